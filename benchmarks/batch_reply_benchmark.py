@@ -0,0 +1,115 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+import pandas as pd
+
+import config
+from batch_replies import BatchReplyRunner
+from batch_search_benchmark import makeComments
+from embedding_cache import EmbeddingCache
+from fake_ollama_server import startFakeOllamaServer
+from llm_interface import callLLM
+from semantic_search import getSemanticSearchResults
+from upload_vector_db import uploadToVectorDB
+
+"""
+Batch Reply Benchmark
+
+This script drafts replies for a queue of --comments new comments the way `main.py`
+does it, one comment at a time (search, then wait for the whole reply, then the next
+comment), and with `BatchReplyRunner` at several concurrency limits, where retrieval is
+batched and overlaps generation.
+
+It uploads a synthetic comment corpus to a throwaway Chroma database and generates
+with the local fake Ollama server (see fake_ollama_server.py), which processes at most
+--ollama-parallel requests at once like `OLLAMA_NUM_PARALLEL`. --host uses a real
+Ollama instead. The generation cache is off, so every comment is generated.
+
+For every variant it reports total seconds, comments per second and p50 / p95 seconds
+per comment (from when the comment was read from the queue to when its reply was
+written, the batch runner reads up to a retrieval batch ahead, so its comments wait
+longer), and checks that the JSON lines output has one reply for every comment.
+
+Usage:
+------
+python benchmarks/batch_reply_benchmark.py [--comments 40] [--corpus 5000] [--concurrency 1,2,4] [--batch-size 8]
+                                           [--ollama-parallel 2] [--tps 40] [--reply-tokens 20] [--host http://127.0.0.1:11434]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# old path: search and generate one comment after another
+def runSequential(comments, output_path):
+    latencies = []
+    with open(output_path, "a", encoding="utf-8") as output_file:
+        for index, comment in enumerate(comments):
+            start = time.perf_counter()
+            examples, replies = getSemanticSearchResults(comment)
+            reply = callLLM(examples, replies, comment, use_cache=False)
+            output_file.write(json.dumps({"index": index, "comment": comment, "reply": reply}) + "\n")
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+# replies written to a json lines output file, by comment index
+def readReplies(output_path):
+    with open(output_path, encoding="utf-8") as output_file:
+        return {record["index"]: record.get("reply") for record in map(json.loads, output_file)}
+
+
+def main():
+    comment_count = getArg("--comments", 40, int)
+    concurrencies = [int(value) for value in getArg("--concurrency", "1,2,4", str).split(",")]
+    host = getArg("--host", None, str)
+    rng = random.Random(0)
+
+    if host is None:
+        _, host = startFakeOllamaServer(prefill_tokens_per_second=2000.0, tokens_per_second=getArg("--tps", 40.0, float),
+                                        reply_tokens=getArg("--reply-tokens", 20, int), parallel=getArg("--ollama-parallel", 2, int))
+    config.registry.override("llm_client", ollama.Client(host=host))
+
+    with tempfile.TemporaryDirectory() as path:
+        import chromadb
+
+        # point the shared database and embedding cache at temporary directories
+        config.registry.override("database", chromadb.PersistentClient(path=os.path.join(path, "database")))
+        config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode, config.EMBEDDING_MODEL_NAME,
+                                                                   path=os.path.join(path, "embedding_cache")))
+        corpus = makeComments(getArg("--corpus", 5000, int), rng)
+        uploadToVectorDB(pd.DataFrame({"comment": corpus, "reply": [f"reply {i}" for i in range(len(corpus))]}))
+        comments = makeComments(comment_count, rng)
+
+        print(f"{'variant':<16}{'seconds':>9}{'comments/s':>12}{'p50 s':>8}{'p95 s':>8}{'complete':>10}")
+        variants = [("sequential", None)] + [(f"batch x{concurrency}", concurrency) for concurrency in concurrencies]
+        for name, concurrency in variants:
+            config.retrieval_cache.invalidate()
+            output_path = os.path.join(path, f"{name.replace(' ', '_')}.jsonl")
+
+            start = time.perf_counter()
+            if concurrency is None:
+                p50, p95 = np.percentile(runSequential(comments, output_path), [50, 95])
+            else:
+                runner = BatchReplyRunner(retrieval_batch_size=getArg("--batch-size", 8, int), concurrency=concurrency,
+                                          use_cache=False)
+                stats = runner.run(iter(comments), output_path)
+                p50, p95 = stats["p50_seconds"], stats["p95_seconds"]
+            seconds = time.perf_counter() - start
+
+            replies = readReplies(output_path)
+            complete = sorted(replies) == list(range(comment_count)) and all(replies.values())
+            print(f"{name:<16}{seconds:>9.2f}{comment_count / seconds:>12.2f}{p50:>8.2f}{p95:>8.2f}{str(complete):>10}")
+
+
+if __name__ == "__main__":
+    main()
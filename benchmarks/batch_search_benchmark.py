@@ -0,0 +1,94 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pandas as pd
+
+import config
+from embedding_cache import EmbeddingCache
+from semantic_search import getSemanticSearchResults, getSemanticSearchResultsBatch
+from upload_vector_db import uploadToVectorDB
+
+"""
+Batch Search Benchmark
+
+This script compares answering many prompts one at a time with
+`getSemanticSearchResults` (one encode and one Chroma query per prompt) against
+`getSemanticSearchResultsBatch` at several batch sizes.
+
+It uploads a synthetic comment corpus to a throwaway Chroma database in a temporary
+directory, then runs the same prompts through every variant with empty embedding and
+retrieval caches each time, so every variant pays for encoding and querying its
+prompts. For every variant it reports total seconds, prompts per second, the mean
+latency of one call, and whether the results match the single-prompt loop.
+
+Usage:
+------
+python benchmarks/batch_search_benchmark.py [--comments 20000] [--prompts 1000] [--batch-sizes 1,16,64,256]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def makeComments(count, rng):
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 30))) for _ in range(count)]
+
+
+# run the prompts through a search function with a fresh embedding cache, returns (results, seconds, calls)
+def timeRun(cache_path, name, search):
+    config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode, config.EMBEDDING_MODEL_NAME,
+                                                               path=os.path.join(cache_path, name)))
+    config.retrieval_cache.invalidate()
+    start = time.perf_counter()
+    results, calls = search()
+    return results, time.perf_counter() - start, calls
+
+
+def main():
+    comment_count = getArg("--comments", 20000, int)
+    prompt_count = getArg("--prompts", 1000, int)
+    batch_sizes = [int(size) for size in getArg("--batch-sizes", "1,16,64,256", str).split(",")]
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as database_path, tempfile.TemporaryDirectory() as cache_path:
+        import chromadb
+
+        # point the shared database and embedding cache at temporary directories
+        config.registry.override("database", chromadb.PersistentClient(path=database_path))
+        config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode, config.EMBEDDING_MODEL_NAME,
+                                                                   path=os.path.join(cache_path, "upload")))
+        comments = makeComments(comment_count, rng)
+        uploadToVectorDB(pd.DataFrame({"comment": comments, "reply": [f"reply {i}" for i in range(comment_count)]}))
+        prompts = makeComments(prompt_count, rng)
+
+        # warm up the model and the collection before timing
+        getSemanticSearchResultsBatch(prompts[:8])
+
+        print(f"{'variant':<16}{'seconds':>10}{'prompts/s':>12}{'ms/call':>10}{'matches':>10}")
+        baseline, seconds, calls = timeRun(cache_path, "single",
+                                           lambda: ([getSemanticSearchResults(prompt) for prompt in prompts], len(prompts)))
+        print(f"{'single loop':<16}{seconds:>10.2f}{len(prompts) / seconds:>12.1f}{seconds / calls * 1000:>10.2f}{'-':>10}")
+
+        for batch_size in batch_sizes:
+            def search():
+                results = []
+                for start in range(0, len(prompts), batch_size):
+                    results.extend(getSemanticSearchResultsBatch(prompts[start:start + batch_size]))
+                return results, -(-len(prompts) // batch_size)
+
+            results, seconds, calls = timeRun(cache_path, f"batch{batch_size}", search)
+            print(f"{f'batch {batch_size}':<16}{seconds:>10.2f}{len(prompts) / seconds:>12.1f}"
+                  f"{seconds / calls * 1000:>10.2f}{str(results == baseline):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from googleapiclient.discovery import build
+
+import config
+from fake_youtube_api import startFakeYouTubeServer
+from response_cache import ResponseCache
+from youtube_scraper import getCommentsPerVideo
+
+"""
+Response Cache Benchmark
+
+This script records the comment pages of a set of videos from the local fake YouTube
+API (`fake_youtube_api.py`) into a temporary response cache, then replays them with
+the API server shut down. It reports the time of the uncached run, the recording run
+and the replay run, and checks that the replayed pairs match the live ones.
+
+Usage:
+------
+python benchmarks/cache_replay_benchmark.py [--videos 16] [--comments 2000] [--latency 0.05]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# run getCommentsPerVideo over every video and time it
+def timedIngest(videos, comments_to_view):
+    start = time.perf_counter()
+    output = []
+    for video in videos:
+        getCommentsPerVideo(video, output, comments_to_view=comments_to_view)
+    return output, time.perf_counter() - start
+
+
+def main():
+    video_count = getArg("--videos", 16, int)
+    comments_to_view = getArg("--comments", 2000, int)
+    latency = getArg("--latency", 0.05, float)
+    videos = [f"video{i:03d}" for i in range(video_count)]
+
+    server, url = startFakeYouTubeServer(threads_per_video=comments_to_view, latency_seconds=latency)
+    config.registry.override("youtube", build("youtube", "v3", developerKey="benchmark", client_options={"api_endpoint": url}))
+
+    with tempfile.TemporaryDirectory() as cache_path:
+        config.registry.override("response_cache", ResponseCache(mode="off"))
+        live, live_seconds = timedIngest(videos, comments_to_view)
+
+        config.registry.override("response_cache", ResponseCache(path=cache_path, mode="record"))
+        _, record_seconds = timedIngest(videos, comments_to_view)
+
+        # no server and no client, everything has to come from the recorded fixtures
+        server.shutdown()
+        config.registry.override("youtube", None)
+        replay_cache = ResponseCache(path=cache_path, mode="replay")
+        config.registry.override("response_cache", replay_cache)
+        replayed, replay_seconds = timedIngest(videos, comments_to_view)
+
+        cache_bytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(cache_path) for name in names)
+
+    print(f"{'run':<10}{'seconds':>10}")
+    print(f"{'live':<10}{live_seconds:>10.3f}")
+    print(f"{'record':<10}{record_seconds:>10.3f}")
+    print(f"{'replay':<10}{replay_seconds:>10.3f}")
+    print(f"\nreplayed pairs match live pairs: {replayed == live}")
+    print(f"cache hits: {replay_cache.stats['hits']}, size on disk: {cache_bytes / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
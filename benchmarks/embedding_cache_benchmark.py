@@ -0,0 +1,69 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import config
+from embedding_cache import EmbeddingCache
+
+"""
+Embedding Cache Benchmark
+
+This script encodes a synthetic comment corpus (with a share of repeated comments,
+like the duplicates left after cleaning) three times through a fresh `EmbeddingCache`
+in a temporary folder:
+
+    * uncached - straight through the embedding model.
+    * cold     - through the empty cache, only distinct texts are encoded.
+    * warm     - a re-ingest of the same corpus plus 5% new comments, only the new
+                 comments are encoded.
+
+It reports seconds and the cache hit rate of each run.
+
+Usage:
+------
+python benchmarks/embedding_cache_benchmark.py [--comments 50000] [--duplicates 0.2] [--dtype float32]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def makeComments(count, duplicate_share, rng):
+    unique = [" ".join(rng.choices(WORDS, k=rng.randint(3, 40))) for _ in range(int(count * (1 - duplicate_share)))]
+    return unique + rng.choices(unique, k=count - len(unique))
+
+
+def main():
+    count = getArg("--comments", 50000, int)
+    duplicate_share = getArg("--duplicates", 0.2, float)
+    dtype = getArg("--dtype", "float32", str)
+    rng = random.Random(0)
+
+    comments = makeComments(count, duplicate_share, rng)
+    reingest = comments + makeComments(count // 20, 0.0, rng)
+    model = config.embedding_model
+
+    print(f"{'run':<10}{'texts':>8}{'seconds':>10}{'hit rate':>10}")
+
+    start = time.perf_counter()
+    model.encode(comments)
+    print(f"{'uncached':<10}{len(comments):>8}{time.perf_counter() - start:>10.2f}{'-':>10}")
+
+    with tempfile.TemporaryDirectory() as cache_path:
+        for name, texts in [("cold", comments), ("warm", reingest)]:
+            cache = EmbeddingCache(model.encode, config.EMBEDDING_MODEL_NAME, path=cache_path, dtype=dtype)
+            start = time.perf_counter()
+            cache.encode(texts)
+            print(f"{name:<10}{len(texts):>8}{time.perf_counter() - start:>10.2f}{cache.stats['hit_rate']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
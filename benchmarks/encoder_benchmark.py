@@ -0,0 +1,73 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+import config
+from batch_encoder import BatchEncoder
+
+"""
+Batch Encoder Benchmark
+
+This script measures encoding throughput (sentences per second) on a synthetic
+comment corpus with a YouTube-like length distribution: mostly short comments with
+a long tail of multi-paragraph ones.
+
+For every corpus size it compares a plain `SentenceTransformer.encode` call (the
+original upload path) with `BatchEncoder` at each worker count, and checks that the
+batch encoder returns the same embeddings in the same order.
+
+Usage:
+------
+python benchmarks/encoder_benchmark.py [--sizes 1000,5000,20000] [--workers 0,2,4]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires",
+         "lol", "love", "hate", "slow", "fast", "best", "worst", "k20c1", "horsepower", "torque", "manual"]
+
+
+def getArg(name, default):
+    return [int(value) for value in sys.argv[sys.argv.index(name) + 1].split(",")] if name in sys.argv else default
+
+
+# comment lengths in words follow a log-normal distribution (median around 12 words)
+def makeCorpus(size, rng):
+    return [" ".join(rng.choices(WORDS, k=max(1, min(int(rng.lognormvariate(2.5, 1.0)), 400)))) for _ in range(size)]
+
+
+def main():
+    sizes = getArg("--sizes", [1000, 5000, 20000])
+    worker_counts = getArg("--workers", [0, 2, 4])
+    rng = random.Random(0)
+    model = config.embedding_model
+
+    print(f"{'size':>8}  {'encoder':<16}{'seconds':>10}{'sentences/s':>14}{'matches':>10}")
+    for size in sizes:
+        corpus = makeCorpus(size, rng)
+
+        start = time.perf_counter()
+        baseline = model.encode(corpus)
+        seconds = time.perf_counter() - start
+        print(f"{size:>8}  {'plain encode':<16}{seconds:>10.2f}{size / seconds:>14.1f}{'-':>10}")
+
+        for workers in worker_counts:
+            encoder = BatchEncoder(workers=workers, min_parallel_texts=0)
+            if workers:
+                # start the workers and load their models before timing
+                encoder.encode(corpus[:workers * 8])
+
+            start = time.perf_counter()
+            embeddings = encoder.encode(corpus)
+            seconds = time.perf_counter() - start
+            matches = np.allclose(embeddings, baseline, atol=1e-4)
+            print(f"{size:>8}  {f'bucketed x{workers}':<16}{seconds:>10.2f}{size / seconds:>14.1f}{str(matches):>10}")
+            encoder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Fake Ollama Server
+
+A small local stand-in for the `/api/generate` endpoint of Ollama, used to test and
+benchmark reply generation without a model. The ollama client can be pointed at it by
+setting the OLLAMA_HOST environment variable (see `config.py`) or by overriding the
+`llm_client` component with `ollama.Client(host=url)`.
+
+It imitates the timing of a model running on a CPU: the prompt is processed at
+`prefill_tokens_per_second` (prompt tokens are estimated as 4 characters each), then
+the reply is generated one token every 1 / `tokens_per_second` seconds. Replies are
+deterministic words (seeded by the prompt), `reply_tokens` long unless the request
+sets a lower `num_predict` option. Streaming and non-streaming requests are supported,
+with the same response fields Ollama sends (including `prompt_eval_count`,
+`eval_count` and the durations in nanoseconds on the last chunk).
+
+Like Ollama, it keeps the processed state of the last prompt: the part of a prompt
+that starts with the same text as the previous one is not processed again, and
+`prompt_eval_count` only counts the rest. Prompts longer than the `num_ctx` option
+(2048 tokens by default) are cut to their last `num_ctx` tokens, which loses the
+start of the prompt. With `parallel` set, at most that many requests are processed at
+once and the rest wait, like `OLLAMA_NUM_PARALLEL`.
+
+Functions:
+----------
+startFakeOllamaServer(prefill_tokens_per_second: float = 500.0, tokens_per_second: float = 20.0,
+                      reply_tokens: int = 60, port: int = 0, parallel: int | None = None) -> tuple[ThreadingHTTPServer, str]
+    - Starts the server on a background thread and returns it with its base URL.
+    - `server.request_count` counts generate requests, `server.tokens_sent` counts reply
+      tokens written, `server.aborted_count` counts streams the client closed before
+      the reply was finished and `server.truncated_count` counts prompts cut to `num_ctx`.
+
+Usage:
+------
+python benchmarks/fake_ollama_server.py [--port 11434]
+"""
+
+DEFAULT_NUM_CTX = 2048
+
+WORDS = ["the", "si", "is", "a", "great", "daily", "driver", "and", "the", "shifter", "feels", "amazing", "honestly",
+         "canadian", "spec", "gets", "more", "features", "for", "less", "money", "turbo", "lsd", "makes", "it", "fun"]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sendJSON(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self._sendJSON(200, {"models": []})
+        self._sendJSON(200, {"status": "Ollama is running"})
+
+    def do_POST(self):
+        server = self.server
+        if self.path != "/api/generate":
+            return self._sendJSON(404, {"error": "not found"})
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.request_count += 1
+
+        # requests over the parallel limit wait for a free slot, like in ollama
+        with server.slots:
+            self._generate(request)
+
+    def _generate(self, request):
+        server = self.server
+        prompt = request.get("prompt", "")
+        options = request.get("options") or {}
+        num_ctx = options.get("num_ctx") or DEFAULT_NUM_CTX
+        reply_tokens = min(server.reply_tokens, options.get("num_predict") or server.reply_tokens)
+        rng = random.Random(prompt)
+        tokens = [("" if i == 0 else " ") + rng.choice(WORDS) for i in range(reply_tokens)]
+
+        # only the part after the prefix shared with the previous prompt is processed
+        with server.lock:
+            if len(prompt) // 4 > num_ctx:
+                server.truncated_count += 1
+                prompt = prompt[-num_ctx * 4:]
+            shared = len(os.path.commonprefix([prompt, server.last_prompt]))
+            server.last_prompt = prompt
+        prompt_tokens = max(1, len(prompt) // 4 - shared // 4)
+
+        start = time.perf_counter()
+        prefill_seconds = prompt_tokens / server.prefill_tokens_per_second
+        time.sleep(prefill_seconds)
+
+        def chunk(response, done):
+            payload = {"model": request.get("model", ""), "created_at": datetime.now(timezone.utc).isoformat(),
+                       "response": response, "done": done}
+            if done:
+                payload.update({"done_reason": "length" if reply_tokens < server.reply_tokens else "stop",
+                                "total_duration": int((time.perf_counter() - start) * 1e9),
+                                "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(prefill_seconds * 1e9),
+                                "eval_count": reply_tokens, "eval_duration": int(reply_tokens / server.tokens_per_second * 1e9)})
+            return payload
+
+        if not request.get("stream", True):
+            time.sleep(reply_tokens / server.tokens_per_second)
+            with server.lock:
+                server.tokens_sent += reply_tokens
+            return self._sendJSON(200, chunk("".join(tokens), True))
+
+        # one json object per line, the connection is closed after the last one
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(1 / server.tokens_per_second)
+                self.wfile.write((json.dumps(chunk(token, False)) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                with server.lock:
+                    server.tokens_sent += 1
+            self.wfile.write((json.dumps(chunk("", True)) + "\n").encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closed the stream, stop generating like ollama does
+            with server.lock:
+                server.aborted_count += 1
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, prefill_tokens_per_second, tokens_per_second, reply_tokens, parallel=None):
+        super().__init__(address, FakeOllamaHandler)
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.request_count = 0
+        self.tokens_sent = 0
+        self.aborted_count = 0
+        self.truncated_count = 0
+        self.last_prompt = ""
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(parallel) if parallel else contextlib.nullcontext()
+
+
+# start the fake server on a background thread
+# parallel == max requests processed at once (None for no limit)
+def startFakeOllamaServer(prefill_tokens_per_second=500.0, tokens_per_second=20.0, reply_tokens=60, port=0, parallel=None):
+    server = FakeOllamaServer(("127.0.0.1", port), prefill_tokens_per_second, tokens_per_second, reply_tokens, parallel)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else 11434
+    server, url = startFakeOllamaServer(port=port)
+    print(f"Fake Ollama server listening on {url} (set OLLAMA_HOST={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,182 @@
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic_corpus import makeComment, makeReply
+
+"""
+Fake YouTube Data API
+
+A small local stand-in for the `commentThreads.list` endpoint of the YouTube Data
+API, used to benchmark the scraper without a network connection or API quota. The
+googleapiclient client can be pointed at it by setting the YOUTUBE_API_ENDPOINT
+environment variable (see `config.py`) or by overriding the `youtube` component.
+
+Every video has the same number of deterministic comment threads (seeded by the
+video ID), served in pages of `maxResults` with numeric page tokens. About half of
+the threads have replies. Videos are spread over `CHANNEL_COUNT` channels. Texts are
+short placeholders ("comment 3 on video001"), or realistic comments with emojis, links
+and HTML from synthetic_corpus.py when `synthetic_text` is set.
+
+Functions:
+----------
+startFakeYouTubeServer(threads_per_video: int = 500, latency_seconds: float = 0.0,
+                       error_rate: float = 0.0, port: int = 0, synthetic_text: bool = False) -> tuple[ThreadingHTTPServer, str]
+    - Starts the server on a background thread and returns it with its base URL.
+    - `latency_seconds` is added to every response to imitate network round trips.
+    - `error_rate` is the fraction of requests answered with a 503 or a 403
+      rateLimitExceeded error, to exercise retries.
+    - `server.request_count` counts every request received.
+
+Usage:
+------
+python benchmarks/fake_youtube_api.py [--port 8765]
+"""
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+CHANNEL_COUNT = 8
+
+
+# channel a video belongs to (deterministic for a given video id)
+def channelOf(video):
+    return f"UCfakechannel{zlib.crc32(video.encode('utf-8')) % CHANNEL_COUNT}"
+
+
+# build the comment threads for one video (deterministic for a given video id)
+# synthetic_text == realistic comment and reply texts instead of placeholders
+def makeThreads(video, count, synthetic_text=False):
+    rng = random.Random(video)
+    threads = []
+
+    for i in range(count):
+        published = BASE_TIME + timedelta(minutes=rng.randint(0, 500000))
+        replies = []
+        if rng.random() < 0.5:
+            for r in range(rng.randint(1, 5)):
+                replies.append({
+                    "id": f"{video}.{i}.{r}",
+                    "snippet": {
+                        "textDisplay": makeReply(rng) if synthetic_text else f"reply {r} to comment {i} on {video}",
+                        "likeCount": rng.randint(0, 200),
+                        "publishedAt": (published + timedelta(hours=r + 1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    },
+                })
+
+        threads.append({
+            "id": f"{video}.{i}",
+            "snippet": {
+                "channelId": channelOf(video),
+                "videoId": video,
+                "topLevelComment": {
+                    "id": f"{video}.{i}",
+                    "snippet": {
+                        "textDisplay": makeComment(rng) if synthetic_text else f"comment {i} on {video}",
+                        "likeCount": rng.randint(0, 1000),
+                        "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    },
+                },
+                "totalReplyCount": len(replies),
+            },
+            "replies": {"comments": replies} if replies else {},
+        })
+
+    return threads
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sendJSON(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+
+        url = urlparse(self.path)
+        if not url.path.endswith("/commentThreads"):
+            return self._sendJSON(404, {"error": {"code": 404, "message": "Not found"}})
+
+        if server.latency_seconds:
+            time.sleep(server.latency_seconds)
+
+        # inject transient errors so retries get exercised
+        if server.error_rate and server.rng.random() < server.error_rate:
+            if server.rng.random() < 0.5:
+                return self._sendJSON(503, {"error": {"code": 503, "message": "Backend Error", "errors": [{"reason": "backendError"}]}})
+            return self._sendJSON(403, {"error": {"code": 403, "message": "Rate limit", "errors": [{"reason": "rateLimitExceeded"}]}})
+
+        params = parse_qs(url.query)
+        video = params["videoId"][0]
+        max_results = int(params.get("maxResults", ["20"])[0])
+        offset = int(params.get("pageToken", ["0"])[0])
+        order = params.get("order", ["relevance"])[0]
+
+        threads = server.getThreads(video, order)
+        page = threads[offset:offset + max_results]
+
+        response = {"kind": "youtube#commentThreadListResponse", "items": page,
+                    "pageInfo": {"totalResults": len(page), "resultsPerPage": max_results}}
+        if offset + max_results < len(threads):
+            response["nextPageToken"] = str(offset + max_results)
+
+        self._sendJSON(200, response)
+
+
+class FakeYouTubeServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, threads_per_video, latency_seconds, error_rate, synthetic_text=False):
+        super().__init__(address, FakeYouTubeHandler)
+        self.threads_per_video = threads_per_video
+        self.synthetic_text = synthetic_text
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self._video_threads = {}
+
+    # threads for a video, newest first for order=time
+    def getThreads(self, video, order):
+        with self.lock:
+            if video not in self._video_threads:
+                self._video_threads[video] = makeThreads(video, self.threads_per_video, self.synthetic_text)
+            threads = self._video_threads[video]
+
+        if order == "time":
+            return sorted(threads, key=lambda thread: thread["snippet"]["topLevelComment"]["snippet"]["publishedAt"], reverse=True)
+        return threads
+
+
+# start the fake api on a background thread
+def startFakeYouTubeServer(threads_per_video=500, latency_seconds=0.0, error_rate=0.0, port=0, synthetic_text=False):
+    server = FakeYouTubeServer(("127.0.0.1", port), threads_per_video, latency_seconds, error_rate, synthetic_text)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else 8765
+    server, url = startFakeYouTubeServer(port=port)
+    print(f"Fake YouTube API listening on {url} (set YOUTUBE_API_ENDPOINT={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from googleapiclient.discovery import build
+
+import config
+from fake_youtube_api import startFakeYouTubeServer
+from youtube_scraper import CommentFetchEngine, parseCommentThreads
+
+"""
+Comment Fetch Benchmark
+
+This script compares comment fetching strategies against a local fake YouTube API
+(`fake_youtube_api.py`) with simulated network latency and transient errors:
+
+    * legacy     - the original sequential loop, which never passed the page token
+                   back so it re-downloaded the first page of every video.
+    * sequential - `CommentFetchEngine` with a single worker.
+    * concurrent - `CommentFetchEngine` with several workers.
+
+For each strategy it reports wall-clock time, quota units spent, unique comment
+pairs and unique pairs per quota unit.
+
+Usage:
+------
+python benchmarks/fetch_benchmark.py [--videos 16] [--workers 8] [--latency 0.05] [--error-rate 0.02]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# the original getCommentsPerVideo loop, page token never updated
+def legacyFetch(videos, comments_to_view):
+    pairs = []
+    requests = 0
+    for video in videos:
+        for _ in range(comments_to_view // 100):
+            apiCall = config.youtube.commentThreads().list(part=["snippet", "replies"], videoId=video, maxResults=100,
+                                                           order="relevance", pageToken=None).execute()
+            requests += 1
+            pairs.extend(parseCommentThreads(apiCall))
+    return pairs, requests
+
+
+def report(name, seconds, pairs, quota_units):
+    unique = len({(pair["comment"], pair["reply"]) for pair in pairs})
+    print(f"{name:<12}{seconds:>10.2f}{quota_units:>8}{unique:>10}{unique / max(quota_units, 1):>16.1f}")
+
+
+def main():
+    video_count = getArg("--videos", 16, int)
+    workers = getArg("--workers", 8, int)
+    latency = getArg("--latency", 0.05, float)
+    error_rate = getArg("--error-rate", 0.02, float)
+    comments_to_view = getArg("--comments", 1000, int)
+
+    server, url = startFakeYouTubeServer(threads_per_video=comments_to_view, latency_seconds=latency, error_rate=error_rate)
+    config.registry.override("youtube", build("youtube", "v3", developerKey="benchmark", client_options={"api_endpoint": url}))
+    videos = [f"video{i:03d}" for i in range(video_count)]
+
+    print(f"{'strategy':<12}{'seconds':>10}{'quota':>8}{'pairs':>10}{'pairs / unit':>16}")
+
+    # legacy loop has no retries, so run it without injected errors
+    server.error_rate = 0.0
+    start = time.perf_counter()
+    pairs, requests = legacyFetch(videos, comments_to_view)
+    report("legacy", time.perf_counter() - start, pairs, requests)
+    server.error_rate = error_rate
+
+    for name, max_workers in [("sequential", 1), ("concurrent", workers)]:
+        engine = CommentFetchEngine(max_workers=max_workers)
+        pairs = engine.fetch(videos, comments_to_view=comments_to_view)
+        report(name, engine.stats["seconds"], pairs, engine.stats["quota_units"])
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
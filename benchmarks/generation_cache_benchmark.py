@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+
+import config
+from fake_ollama_server import startFakeOllamaServer
+from generation_cache import GenerationCache
+from llm_interface import callLLM
+from llm_streaming_benchmark import COMMENTS, REPLIES, getArg, percentiles
+
+"""
+Generation Cache Benchmark
+
+This script replays a stream of reply requests in which popular comments are asked
+again (request frequencies follow a Zipf distribution over --distinct comments, each
+always retrieving the same pairs) and compares `callLLM` without and with the
+generation cache. By default it runs against the local fake Ollama server (see
+fake_ollama_server.py), or against a real one with --host.
+
+For each mode it reports the total seconds, p50 / p95 seconds per request, the cache
+hit rate and the inference seconds the cache saved, then checks that every cached
+reply is the reply generated for the same request without the cache, and that the
+replies are still there after the cache is reopened (a new process).
+
+Usage:
+------
+python benchmarks/generation_cache_benchmark.py [--requests 60] [--distinct 20] [--zipf 1.1] [--max-entries 10000]
+                                                [--tps 100] [--reply-tokens 30] [--host http://127.0.0.1:11434]
+"""
+
+
+def main():
+    request_count = getArg("--requests", 60, int)
+    distinct = getArg("--distinct", 20, int)
+    host = getArg("--host", None, str)
+    rng = np.random.default_rng(0)
+
+    if host is None:
+        _, host = startFakeOllamaServer(prefill_tokens_per_second=2000.0, tokens_per_second=getArg("--tps", 100.0, float),
+                                        reply_tokens=getArg("--reply-tokens", 30, int))
+    config.registry.override("llm_client", ollama.Client(host=host))
+
+    # popular comments are asked far more often than the rest
+    weights = 1 / np.arange(1, distinct + 1) ** getArg("--zipf", 1.1, float)
+    asked = rng.choice(distinct, size=request_count, p=weights / weights.sum())
+    requests = [(COMMENTS[i % len(COMMENTS):] + COMMENTS[:i % len(COMMENTS)], REPLIES, f"Question {i} about the Civic Si")
+                for i in asked]
+
+    with tempfile.TemporaryDirectory() as path:
+        config.registry.override("generation_cache", GenerationCache(path=path, max_entries=getArg("--max-entries", 10000, int)))
+
+        print(f"{'mode':<10}{'total s':>9}{'p50 s':>8}{'p95 s':>8}{'hit rate':>10}{'saved s':>9}")
+        replies = {}
+        for mode in ["no cache", "cache"]:
+            seconds = []
+            start = time.perf_counter()
+            for comments, example_replies, prompt in requests:
+                call_start = time.perf_counter()
+                reply = callLLM(comments, example_replies, prompt, use_cache=mode == "cache")
+                seconds.append(time.perf_counter() - call_start)
+                replies.setdefault(mode, {})[prompt] = reply
+            total = time.perf_counter() - start
+
+            stats = config.generation_cache.stats if mode == "cache" else {"hit_rate": 0.0, "seconds_saved": 0.0}
+            print(f"{mode:<10}{total:>9.2f}{percentiles(seconds)[0]:>8.3f}{percentiles(seconds)[1]:>8.3f}"
+                  f"{stats['hit_rate']:>10.1%}{stats['seconds_saved']:>9.2f}")
+
+        same = replies["cache"] == replies["no cache"]
+        config.generation_cache.close()
+        reopened = GenerationCache(path=path)
+        config.registry.override("generation_cache", reopened)
+        callLLM(*requests[0])
+        print(f"\ncached replies identical to fresh ones: {same}, after reopening: {reopened.count()} replies stored, "
+              f"first request hit: {reopened.stats['hits'] == 1}")
+        reopened.close()
+
+
+if __name__ == "__main__":
+    main()
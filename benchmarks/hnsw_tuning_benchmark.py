@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from vector_store import getOrCreateChromaCollection, hnswSettings
+from vector_store_benchmark import makeVectors, DIMENSION
+
+"""
+HNSW Tuning Harness
+
+This script helps pick the HNSW settings of the Chroma collection (`HNSW_M`,
+`HNSW_CONSTRUCTION_EF` and `HNSW_SEARCH_EF` in config.py) for a given corpus. For
+every combination of M and construction ef it builds a collection in a temporary
+Chroma database. Then, for every search ef, it sets the collection's search ef and
+runs single-prompt queries in a fresh process, comparing their results with exact
+brute-force neighbours. A fresh process is needed because Chroma keeps a loaded index
+(with the search ef it was loaded with) for the rest of the process.
+
+It prints one row per combination, with the build time, recall@k and p50 / p99 query
+latency. Pick the cheapest row whose recall is good enough.
+
+The corpus is a .npy file of embeddings (--corpus, e.g. saved from the embedding
+cache's vectors or a `SentenceTransformer.encode` call) or, by default, synthetic
+clustered 384-d vectors. Queries are held out from the corpus.
+
+Usage:
+------
+python benchmarks/hnsw_tuning_benchmark.py [--corpus embeddings.npy] [--vectors 20000] [--queries 300] [--k 5]
+                                           [--space cosine] [--M 8,16,32] [--construction-ef 100,200]
+                                           [--search-ef 10,20,50,100,200]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def getList(name, default):
+    return [int(value) for value in getArg(name, default, str).split(",")]
+
+
+def loadCorpus(count, query_count):
+    rng = np.random.default_rng(0)
+    if "--corpus" in sys.argv:
+        vectors = np.load(getArg("--corpus", None, str)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors[rng.permutation(len(vectors))]
+        return vectors[query_count:], vectors[:query_count]
+
+    centres = rng.standard_normal((max(count // 50, 1), DIMENSION))
+    return makeVectors(count, centres, rng), makeVectors(query_count, centres, rng)
+
+
+# exact neighbours in the index's space
+def exactNeighbours(vectors, queries, space, k):
+    if space == "l2":
+        scores = -((queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :])
+    else:
+        scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+# query a collection in this process, prints recall@k, p50 and p99 latency in ms
+def runQueries(path, name, k):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=path).get_collection(name)
+    queries = np.load(os.path.join(path, "queries.npy"))
+    exact = [set(map(str, row)) for row in np.load(os.path.join(path, "exact.npy"))]
+
+    # load the index before timing
+    collection.query(query_embeddings=queries[0], n_results=k, include=[])
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, exact):
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=query, n_results=k, include=[])["ids"][0]
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(expected & set(found)) / k)
+    print(np.mean(recalls), np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000)
+
+
+def measureQueries(path, name, k):
+    output = subprocess.run([sys.executable, __file__, "--measure", path, name, str(k)], capture_output=True, text=True,
+                            check=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def main():
+    import chromadb
+
+    vectors, queries = loadCorpus(getArg("--vectors", 20000, int), getArg("--queries", 300, int))
+    k = getArg("--k", 5, int)
+    space = getArg("--space", "cosine", str)
+    ids = [str(i) for i in range(len(vectors))]
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, {space} space\n")
+    print(f"{'M':>4}{'construction ef':>17}{'search ef':>11}{'build s':>9}{f'recall@{k}':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    with tempfile.TemporaryDirectory() as path:
+        np.save(os.path.join(path, "queries.npy"), queries)
+        np.save(os.path.join(path, "exact.npy"), exactNeighbours(vectors, queries, space, k))
+        client = chromadb.PersistentClient(path=path)
+        for M in getList("--M", "8,16,32"):
+            for construction_ef in getList("--construction-ef", "100,200"):
+                name = f"tuning_{M}_{construction_ef}"
+                collection = getOrCreateChromaCollection(client, name, space=space, M=M, construction_ef=construction_ef)
+                start = time.perf_counter()
+                for i in range(0, len(vectors), 5000):
+                    collection.add(ids=ids[i:i + 5000], embeddings=vectors[i:i + 5000])
+                build_seconds = time.perf_counter() - start
+
+                for search_ef in getList("--search-ef", "10,20,50,100,200"):
+                    collection = getOrCreateChromaCollection(client, name, space=space, search_ef=search_ef)
+                    recall, p50, p99 = measureQueries(path, name, k)
+
+                    settings = hnswSettings(collection)
+                    print(f"{settings['M']:>4}{settings['construction_ef']:>17}{settings['search_ef']:>11}{build_seconds:>9.2f}"
+                          f"{recall:>10.3f}{p50:>9.2f}{p99:>9.2f}")
+                client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        position = sys.argv.index("--measure")
+        runQueries(sys.argv[position + 1], sys.argv[position + 2], int(sys.argv[position + 3]))
+    else:
+        main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import chromadb
+from googleapiclient.discovery import build
+
+import config
+from data_cleaning import cleanData
+from fake_youtube_api import startFakeYouTubeServer
+from ingest_pipeline import IngestPipeline
+from resource_usage import getCurrentRSS, formatBytes
+from upload_vector_db import uploadToVectorDB
+from youtube_scraper import fetchYouTubeComments
+
+"""
+Ingest Pipeline Benchmark
+
+This script ingests the same set of videos from the local fake YouTube API
+(`fake_youtube_api.py`) twice, into throwaway Chroma databases:
+
+    * staged    - fetchYouTubeComments → cleanData → uploadToVectorDB, one after another.
+    * streaming - `IngestPipeline`, with the stages overlapping in fixed-size batches.
+
+It reports pairs per second and the peak RSS reached during each run. The embedding
+model is loaded before either run so its load time and memory are not counted.
+
+Usage:
+------
+python benchmarks/ingest_pipeline_benchmark.py [--videos 16] [--comments 2000] [--latency 0.05] [--batch-size 256] [--clean-workers 0]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# point the shared collection at a fresh temporary database
+def useFreshCollection(path):
+    config.registry.override("database", chromadb.PersistentClient(path=path))
+    config.registry.teardown("collection", "vector_store")
+
+
+# run a function while sampling the process RSS, returns (seconds, peak RSS)
+def measure(function):
+    peak = [getCurrentRSS()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak[0] = max(peak[0], getCurrentRSS())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return seconds, peak[0]
+
+
+def main():
+    video_count = getArg("--videos", 16, int)
+    comments_to_view = getArg("--comments", 2000, int)
+    latency = getArg("--latency", 0.05, float)
+    batch_size = getArg("--batch-size", 256, int)
+    clean_workers = getArg("--clean-workers", 0, int)
+    videos = [f"video{i:03d}" for i in range(video_count)]
+
+    server, url = startFakeYouTubeServer(threads_per_video=comments_to_view, latency_seconds=latency)
+    config.registry.override("youtube", build("youtube", "v3", developerKey="benchmark", client_options={"api_endpoint": url}))
+    config.registry.warm("embedding_model")
+
+    print(f"{'run':<12}{'seconds':>10}{'pairs':>10}{'pairs/s':>12}{'peak RSS':>14}")
+
+    with tempfile.TemporaryDirectory() as database_path:
+        useFreshCollection(os.path.join(database_path, "staged"))
+        seconds, peak = measure(lambda: uploadToVectorDB(cleanData(fetchYouTubeComments(videos, comments_to_view=comments_to_view))))
+        rows = config.vector_store.count()
+        print(f"{'staged':<12}{seconds:>10.2f}{rows:>10}{rows / seconds:>12.1f}{formatBytes(peak):>14}")
+
+        useFreshCollection(os.path.join(database_path, "streaming"))
+        pipeline = IngestPipeline(batch_size=batch_size, clean_workers=clean_workers)
+        seconds, peak = measure(lambda: pipeline.run(videos, comments_to_view=comments_to_view))
+        rows = pipeline.stats["rows_written"]
+        print(f"{'streaming':<12}{seconds:>10.2f}{rows:>10}{rows / seconds:>12.1f}{formatBytes(peak):>14}")
+
+    print()
+    pipeline.report()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import config
+import instrumentation
+from data_cleaning import cleanData
+from pipeline_benchmark import useTemporaryStores
+from semantic_search import getSemanticSearchResults
+from synthetic_corpus import makeComment, makeCorpus
+from upload_vector_db import uploadToVectorDB
+
+"""
+Instrumentation Benchmark
+
+This script measures what the instrumentation layer (instrumentation.py) costs:
+
+    * per call - nanoseconds of an empty `with span(...)` block and of a `count(...)`,
+                 with instrumentation off and on, against an empty loop
+    * pipeline - `cleanData` on a synthetic corpus (see synthetic_corpus.py) and
+                 --searches `getSemanticSearchResults` calls against a throwaway Chroma
+                 database, with instrumentation off and on (best of --repeats runs)
+
+then prints the Prometheus text the instrumented run produced, as served at /metrics.
+
+Usage:
+------
+python benchmarks/instrumentation_benchmark.py [--calls 200000] [--corpus 5000] [--searches 200] [--repeats 3]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# nanoseconds per call of function, minus the cost of the loop itself
+def nanosecondsPerCall(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return max(time.perf_counter() - start - loop, 0.0) / calls * 1e9
+
+
+def emptySpan():
+    with instrumentation.span("benchmark", mode="empty"):
+        pass
+
+
+def increment():
+    instrumentation.count("benchmark_total", mode="empty")
+
+
+# best of repeats seconds of running function
+def bestSeconds(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    calls = getArg("--calls", 200000, int)
+    searches = getArg("--searches", 200, int)
+    repeats = getArg("--repeats", 3, int)
+
+    print(f"{'per call':<10}{'off ns':>10}{'on ns':>10}")
+    for name, function in [("span", emptySpan), ("count", increment)]:
+        instrumentation.disable()
+        off = nanosecondsPerCall(function, calls)
+        instrumentation.enable()
+        on = nanosecondsPerCall(function, calls)
+        print(f"{name:<10}{off:>10.0f}{on:>10.0f}")
+    instrumentation.disable()
+    instrumentation.reset()
+
+    corpus = makeCorpus(getArg("--corpus", 5000, int), seed=0)
+    rng = random.Random(0)
+    prompts = [makeComment(rng) for _ in range(searches)]
+
+    with tempfile.TemporaryDirectory() as path:
+        useTemporaryStores(path)
+        uploadToVectorDB(cleanData(corpus))
+
+        def search():
+            # cleared so every run queries the vector store instead of returning cached results
+            config.retrieval_cache.invalidate()
+            for prompt in prompts:
+                getSemanticSearchResults(prompt)
+
+        print(f"\n{'pipeline':<10}{'off s':>10}{'on s':>10}{'overhead':>10}")
+        for name, function in [("clean", lambda: cleanData(corpus)), ("search", search)]:
+            instrumentation.disable()
+            off = bestSeconds(function, repeats)
+            instrumentation.enable(log_path=os.path.join(path, "instrumentation.jsonl"))
+            on = bestSeconds(function, repeats)
+            print(f"{name:<10}{off:>10.3f}{on:>10.3f}{on / off - 1:>10.1%}")
+
+        instrumentation.disable()
+        with open(os.path.join(path, "instrumentation.jsonl")) as log_file:
+            log_lines = sum(1 for _ in log_file)
+        print(f"\n{log_lines} JSON log lines written, /metrics:\n")
+        print(instrumentation.prometheusText())
+
+        if hasattr(config.vector_store, "close"):
+            config.vector_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+import config
+from embedding_cache import EmbeddingCache
+from lexical_index import LexicalIndex
+from retrieval_cache import RetrievalCache
+from semantic_search import getHybridSearchResults, getLexicalSearchResults, getSemanticSearchResults
+from upload_vector_db import uploadToVectorDB
+
+"""
+Lexical Search Benchmark
+
+This script uploads a synthetic corpus of comments into a temporary database (which
+also builds the BM25 lexical index) and compares three ways of searching it:
+
+- lexical - `getLexicalSearchResults`, BM25 only, no embedding model
+- dense   - `getSemanticSearchResults`, the embedding model and the vector store
+- hybrid  - `getHybridSearchResults`, both rankings fused with reciprocal rank fusion
+
+Every prompt is encoded once before timing, so dense and hybrid latency is the search
+itself and not the embedding model. The retrieval cache is disabled.
+
+For each mode it reports p50 / p99 latency per prompt, and it compares the memory of
+the lexical index with the memory the raw float32 embeddings alone would need.
+
+With --startup it also measures, in fresh processes, the time from start to the first
+lexical result and to the first dense result (which has to load the embedding model).
+
+Usage:
+------
+python benchmarks/lexical_search_benchmark.py [--comments 50000] [--prompts 1000] [--candidates 50] [--startup]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires",
+         "the", "is", "a", "this", "and", "for", "my", "it", "so", "love", "great", "looks", "good", "car"]
+# rare keywords that are what keyword heavy prompts ask about
+KEYWORDS = [f"k{number}c{number % 7}" for number in range(500)]
+DIMENSION = 384
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def makeComment(rng):
+    words = rng.choices(WORDS, k=rng.randint(3, 30))
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+    return " ".join(words)
+
+
+def timePrompts(search, prompts):
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        search(prompt)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+# run in a fresh process: seconds from start to the first result of one search mode
+def measureStartup(mode, database_path, lexical_path, cache_path):
+    search = "getLexicalSearchResults" if mode == "lexical" else "getSemanticSearchResults"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"""
+import sys
+sys.path.insert(0, {os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")!r})
+import config
+config.DATABASE_PATH, config.LEXICAL_INDEX_PATH, config.EMBEDDING_CACHE_PATH = {database_path!r}, {lexical_path!r}, {cache_path!r}
+from semantic_search import {search}
+print({search}("turbo lsd k20c6"))
+"""], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main():
+    comment_count = getArg("--comments", 50000, int)
+    prompt_count = getArg("--prompts", 1000, int)
+    candidates = getArg("--candidates", 50, int)
+    rng = random.Random(0)
+
+    df = pd.DataFrame({"comment": [makeComment(rng) for _ in range(comment_count)], "reply": ["reply"] * comment_count})
+    # half keyword prompts, half ordinary prompts
+    prompts = [" ".join(rng.choices(WORDS, k=rng.randint(2, 8)) + ([rng.choice(KEYWORDS)] if i % 2 else []))
+               for i in range(prompt_count)]
+
+    with tempfile.TemporaryDirectory() as database_path, tempfile.TemporaryDirectory() as cache_path, \
+            tempfile.TemporaryDirectory() as lexical_path:
+        import chromadb
+
+        config.registry.override("database", chromadb.PersistentClient(path=database_path))
+        config.registry.teardown("collection", "vector_store")
+        config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode,
+                                                                   config.EMBEDDING_MODEL_NAME, path=cache_path))
+        config.registry.override("lexical_index", LexicalIndex(path=lexical_path))
+        config.registry.override("retrieval_cache", RetrievalCache(max_entries=0))
+
+        start = time.perf_counter()
+        uploadToVectorDB(df)
+        print(f"uploaded {config.vector_store.count()} comments in {time.perf_counter() - start:.1f} s "
+              f"({config.lexical_index.count()} in the lexical index)\n")
+        config.embedding_cache.encode(prompts)
+
+        modes = {
+            "lexical": getLexicalSearchResults,
+            "dense": getSemanticSearchResults,
+            "hybrid": lambda prompt: getHybridSearchResults(prompt, candidates=candidates),
+        }
+        print(f"{'mode':<10}{'p50 ms':>9}{'p99 ms':>9}")
+        for name, search in modes.items():
+            latencies = timePrompts(search, prompts)
+            print(f"{name:<10}{np.percentile(latencies, 50) * 1000:>9.2f}{np.percentile(latencies, 99) * 1000:>9.2f}")
+
+        # memory of the lexical index against the raw embeddings (the dense index holds at least these)
+        vector_bytes = config.vector_store.count() * DIMENSION * 4
+        print(f"\nlexical index memory: {config.lexical_index.memoryBytes() / 2 ** 20:.1f} MB")
+        print(f"float32 embeddings:   {vector_bytes / 2 ** 20:.1f} MB")
+
+        if "--startup" in sys.argv:
+            paths = (database_path, lexical_path, cache_path)
+            print(f"\nstart to first lexical result: {measureStartup('lexical', *paths):.2f} s")
+            print(f"start to first dense result:   {measureStartup('dense', *paths):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+
+import config
+from fake_ollama_server import startFakeOllamaServer
+from llm_interface import GenerationTimeoutError, buildPrompt, callLLM, streamLLM
+
+"""
+LLM Streaming Benchmark
+
+This script compares how long a user waits before seeing any of a reply with the old
+blocking call (`ollama.generate` without streaming, the reply appears all at once)
+and with streaming (`streamLLM`, the first token appears as soon as the prompt is
+processed). By default it runs against a local fake Ollama server that imitates a
+model on a CPU (see fake_ollama_server.py), or against a real one with --host.
+
+It reports, over --calls replies:
+
+    * blocking - p50 / p95 seconds until the reply is shown
+    * streaming - p50 / p95 time to first token, total seconds and tokens per second
+    * cancel   - seconds from cancel() to the end of iteration, and whether the server
+                 stopped generating (fake server only)
+    * timeout  - seconds until a reply with a too short --timeout gives up
+
+Usage:
+------
+python benchmarks/llm_streaming_benchmark.py [--calls 5] [--prefill-tps 300] [--tps 12] [--reply-tokens 80]
+                                             [--timeout 0.5] [--host http://127.0.0.1:11434]
+"""
+
+COMMENTS = ["I love the shifter on the Si", "Canadian spec gets the HPT, the American one doesn't",
+            "The LSD makes it so much fun in corners", "Daily driving it for a year now, no complaints",
+            "Wish it came with a bigger turbo"]
+REPLIES = [["Best shifter in the segment"], ["Yeah the Canadian spec is better value"], ["Helical LSD is great"],
+           ["Same here, great daily"], ["Just get the Type R lol"]]
+PROMPTS = ["I just wish the American spec got the same features as the Canadian Spec.",
+           "Is the Si fast enough for track days?", "How does it compare to the GTI?",
+           "The Si is the best daily driver Honda makes", "Should I get the Si or wait for the Type R?"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def percentiles(values):
+    return np.percentile(values, 50), np.percentile(values, 95)
+
+
+def main():
+    calls = getArg("--calls", 5, int)
+    timeout = getArg("--timeout", 0.5, float)
+    host = getArg("--host", None, str)
+
+    server = None
+    if host is None:
+        server, host = startFakeOllamaServer(prefill_tokens_per_second=getArg("--prefill-tps", 300.0, float),
+                                             tokens_per_second=getArg("--tps", 12.0, float),
+                                             reply_tokens=getArg("--reply-tokens", 80, int))
+    config.registry.override("llm_client", ollama.Client(host=host))
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(calls)]
+
+    # old path: one blocking request, nothing is shown until the whole reply is done
+    blocking = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        config.llm_client.generate(model=config.LLM_MODEL, prompt=buildPrompt(COMMENTS, REPLIES, prompt))
+        blocking.append(time.perf_counter() - start)
+
+    streaming = []
+    for prompt in prompts:
+        stats = {}
+        callLLM(COMMENTS, REPLIES, prompt, stats=stats, use_cache=False)
+        streaming.append(stats)
+
+    ttft = [stats["ttft_seconds"] for stats in streaming]
+    total = [stats["total_seconds"] for stats in streaming]
+    print(f"{'mode':<12}{'shown p50':>10}{'p95':>8}{'total p50':>11}{'tokens/s':>10}")
+    print(f"{'blocking':<12}{percentiles(blocking)[0]:>10.2f}{percentiles(blocking)[1]:>8.2f}{np.median(blocking):>11.2f}{'':>10}")
+    print(f"{'streaming':<12}{percentiles(ttft)[0]:>10.2f}{percentiles(ttft)[1]:>8.2f}{np.median(total):>11.2f}"
+          f"{np.median([stats['tokens_per_second'] for stats in streaming]):>10.1f}")
+
+    # cancel a reply after a few tokens, the server should stop generating it
+    tokens_before = server.tokens_sent if server else 0
+    stream = streamLLM(COMMENTS, REPLIES, prompts[0])
+    for i, _ in enumerate(stream):
+        if i == 4:
+            cancelled_at = time.perf_counter()
+            stream.cancel()
+    stopped = time.perf_counter() - cancelled_at
+    time.sleep(1)
+    print(f"\ncancel: iteration ended {stopped * 1000:.0f} ms after cancel() with {stream.stats['tokens']} tokens", end="")
+    print(f", the server sent {server.tokens_sent - tokens_before} tokens in total" if server else "")
+
+    start = time.perf_counter()
+    try:
+        callLLM(COMMENTS, REPLIES, prompts[0], timeout=timeout, use_cache=False)
+        print(f"timeout: the reply finished within {timeout} s")
+    except GenerationTimeoutError as error:
+        print(f"timeout: gave up after {time.perf_counter() - start:.2f} s (timeout {timeout} s) "
+              f"with {len(error.partial_text)} characters of partial reply")
+
+
+if __name__ == "__main__":
+    main()
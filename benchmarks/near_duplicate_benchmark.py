@@ -0,0 +1,161 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning import cleanData
+from near_duplicates import NearDuplicateDetector, collapseNearDuplicates
+
+"""
+Near-Duplicate Benchmark
+
+This script first checks the edge cases of near-duplicate collapsing: empty, short and
+emoji-only texts (which clean to empty strings) anywhere in the corpus, clusters that
+match a brute-force comparison of every pair of texts sharing an LSH bucket, and that
+thousands of spam variants sharing a bucket take linear time. It then
+runs near-duplicate collapsing on synthetic comment corpora of growing size to show
+that it scales roughly linearly. About a quarter of each corpus is
+copy-pasted spam, "first!" variants and lightly edited reposts of other comments.
+
+For every size it reports the seconds taken, the rows removed, the share of the index
+saved, and the embedding time saved (rows removed / measured encoding rate of the
+embedding model; pass --skip-embedding to leave the model out).
+
+Usage:
+------
+python benchmarks/near_duplicate_benchmark.py [--sizes 100000,300000,1000000] [--threshold 0.9] [--skip-embedding]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires",
+         "the", "is", "a", "and", "this", "car", "i", "my", "love", "hate", "best", "worst", "manual", "k20c1"]
+SPAM = ["first", "First!", "FIRST!!!", "first lol", "Who's watching in 2024?", "check out my channel", "nice video"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# lightly edit a comment: change case, add or drop a word
+def editComment(comment, rng):
+    words = comment.split()
+    edit = rng.random()
+    if edit < 0.3:
+        words.append(rng.choice(["lol", "!!", "for real", "fr"]))
+    elif edit < 0.6 and len(words) > 3:
+        words.pop(rng.randrange(len(words)))
+    else:
+        words[0] = words[0].upper()
+    return " ".join(words)
+
+
+def makeCorpus(size, rng):
+    comments = []
+    for _ in range(size):
+        roll = rng.random()
+        if roll < 0.05:
+            comments.append(rng.choice(SPAM))
+        elif roll < 0.25 and comments:
+            comments.append(editComment(rng.choice(comments), rng))
+        else:
+            comments.append(" ".join(rng.choices(WORDS, k=max(3, int(rng.lognormvariate(2.7, 0.6))))))
+    return pd.DataFrame({"comment": comments, "reply": ["reply"] * size})
+
+
+# clusters from comparing every pair of texts that share a band, the slow reference for _clusterDistinct
+def bruteForceClusters(detector, texts):
+    signatures = detector.signatures(texts)
+    parents = list(range(len(texts)))
+
+    def find(i):
+        while parents[i] != i:
+            i = parents[i]
+        return i
+
+    bands = [signatures[:, band * detector.rows:(band + 1) * detector.rows] for band in range(detector.bands)]
+    for i in range(len(texts)):
+        for j in range(i + 1, len(texts)):
+            shares_bucket = any((band[i] == band[j]).all() for band in bands)
+            if shares_bucket and (signatures[i] == signatures[j]).mean() >= detector.threshold:
+                root_i, root_j = find(i), find(j)
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+    return [find(i) for i in range(len(texts))]
+
+
+# fail loudly if collapsing crashes on edge cases or misses candidates that share a bucket
+def checkEdgeCases(rng):
+    cases = [[{"comment": "great car", "reply": "yes"}, {"comment": "😀😀", "reply": "lol"}],
+             [{"comment": "", "reply": "a"}, {"comment": "a", "reply": "b"}, {"comment": "ab", "reply": "c"}],
+             [{"comment": "🔥", "reply": "a"}, {"comment": "https://youtu.be/x", "reply": "b"}, {"comment": "", "reply": "c"}]]
+    for pairs in cases:
+        cleanData(pairs)
+
+    # a text's signature must not depend on the texts around it
+    detector = NearDuplicateDetector(threshold=0.8)
+    alone = detector.signatures(["ab"])[0]
+    if not all((signatures[i] == alone).all() for signatures, i in [(detector.signatures(["ab", "", "x"]), 0),
+                                                                      (detector.signatures(["", "x", "ab"]), 2)]):
+        raise SystemExit("MinHash signature of a short text depends on its neighbours")
+
+    # a and c share the first band with x, which sorts between them and is similar to neither
+    # (8 values in 2 bands of 4 at threshold 0.75), so comparing only neighbours in a bucket misses a ~ c
+    crafted = NearDuplicateDetector(threshold=0.75, num_perm=8)
+    crafted.signatures = lambda texts: np.array([[1, 1, 1, 1, 2, 2, 2, 5], [1, 1, 1, 1, 7, 7, 7, 7], [1, 1, 1, 1, 2, 2, 2, 6]],
+                                                dtype=np.uint32)
+    if crafted._clusterDistinct(["a", "x", "c"]) != [0, 1, 0]:
+        raise SystemExit("near-duplicates in the same bucket that are not neighbours were not merged")
+
+    texts = list(dict.fromkeys(" ".join(comment.lower().split()) for comment in makeCorpus(600, rng)["comment"]))
+    if detector._clusterDistinct(texts) != bruteForceClusters(detector, texts):
+        raise SystemExit("near-duplicate clusters differ from comparing every pair in a bucket")
+
+    # spam variants fill a few huge buckets, quadrupling them must cost about 4x (not 16x like comparing every pair)
+    spam_seconds = []
+    for size in [4000, 16000]:
+        spam = [f"check out my channel for more car videos number {i}" for i in range(size)]
+        start = time.perf_counter()
+        NearDuplicateDetector(threshold=0.9).clusters(spam)
+        spam_seconds.append(time.perf_counter() - start)
+    if spam_seconds[1] > 8 * spam_seconds[0]:
+        raise SystemExit(f"clustering spam variants grows faster than linearly ({spam_seconds[0]:.2f}s -> {spam_seconds[1]:.2f}s)")
+    print(f"edge cases ok (empty, short and emoji-only texts, buckets match brute force, "
+          f"4000 -> 16000 spam variants {spam_seconds[0]:.2f}s -> {spam_seconds[1]:.2f}s)\n")
+
+
+# sentences per second of the embedding model on a sample of the corpus
+def measureEncodingRate(df):
+    import config
+
+    sample = df["comment"].sample(min(2000, len(df)), random_state=0).to_list()
+    config.embedding_model.encode(sample[:32])
+    start = time.perf_counter()
+    config.embedding_model.encode(sample)
+    return len(sample) / (time.perf_counter() - start)
+
+
+def main():
+    sizes = [int(size) for size in getArg("--sizes", "100000,300000,1000000", str).split(",")]
+    threshold = getArg("--threshold", 0.9, float)
+    rng = random.Random(0)
+    checkEdgeCases(rng)
+
+    print(f"{'rows':>9}{'seconds':>10}{'us/row':>9}{'removed':>10}{'index saved':>13}{'embed s saved':>15}")
+    encoding_rate = None
+    for size in sizes:
+        df = makeCorpus(size, rng)
+        if encoding_rate is None and "--skip-embedding" not in sys.argv:
+            encoding_rate = measureEncodingRate(df)
+
+        _, stats = collapseNearDuplicates(df, threshold=threshold)
+        saved = f"{stats['rows_removed'] / encoding_rate:.1f}" if encoding_rate else "-"
+        print(f"{size:>9}{stats['seconds']:>10.2f}{stats['seconds'] / size * 1e6:>9.1f}{stats['rows_removed']:>10}"
+              f"{stats['reduction']:>13.1%}{saved:>15}")
+
+
+if __name__ == "__main__":
+    main()
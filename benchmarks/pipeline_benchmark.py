@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+from googleapiclient.discovery import build
+
+import config
+from data_cleaning import cleanData
+from embedding_cache import EmbeddingCache
+from fake_ollama_server import startFakeOllamaServer
+from fake_youtube_api import startFakeYouTubeServer
+from generation_cache import GenerationCache
+from llm_interface import callLLM
+from semantic_search import getSemanticSearchResults
+from synthetic_corpus import QUESTIONS, makeComment
+from upload_vector_db import uploadToVectorDB
+from youtube_scraper import getCommentsPerVideo
+
+"""
+Pipeline Benchmark
+
+This script times every stage of the RAG pipeline end to end, without an API key, an
+Ollama server or touching ./youtube_comment_database:
+
+    * fetch  - `getCommentsPerVideo` for every video, against the local fake YouTube API
+               (fake_youtube_api.py) serving synthetic comments with emojis, links and
+               HTML (synthetic_corpus.py), with --latency seconds per request
+    * clean  - `cleanData` on the fetched pairs
+    * upload - `uploadToVectorDB` into a throwaway Chroma database, embedding cache and
+               lexical index
+    * search - `getSemanticSearchResults` for --searches different prompts
+    * reply  - `callLLM` for --replies prompts against the local fake Ollama server
+               (fake_ollama_server.py) with --prefill-tps / --tps, generation cache off
+
+for every corpus size in --sizes (comment threads over --videos videos, about half of
+the threads have replies). The embedding model is loaded before timing.
+
+It prints a table and writes the results to --output as JSON (the commit, settings and
+one record per size and stage with items, seconds, items per second and p50 / p95
+seconds per item for search and reply), so runs on two commits can be compared with
+--compare <older results file>.
+
+Usage:
+------
+python benchmarks/pipeline_benchmark.py [--sizes 1000,4000,16000] [--videos 4] [--latency 0.01] [--searches 50]
+                                        [--replies 5] [--prefill-tps 500] [--tps 50] [--output pipeline_results.json]
+                                        [--compare old_pipeline_results.json]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# commit of the working tree, "-dirty" when it has uncommitted changes
+def currentCommit():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(size, stage, items, seconds, latencies=None):
+    result = {"size": size, "stage": stage, "items": items, "seconds": seconds, "items_per_second": items / max(seconds, 1e-9),
+              "p50_seconds": None, "p95_seconds": None}
+    if latencies:
+        result["p50_seconds"], result["p95_seconds"] = np.percentile(latencies, [50, 95]).tolist()
+    return result
+
+
+# time every call of a function over a list of arguments, returns (total seconds, seconds per call)
+def timeCalls(function, arguments):
+    latencies = []
+    start = time.perf_counter()
+    for argument in arguments:
+        call_start = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - call_start)
+    return time.perf_counter() - start, latencies
+
+
+# point every store the pipeline writes to at a fresh temporary directory
+def useTemporaryStores(path):
+    import chromadb
+
+    config.registry.override("database", chromadb.PersistentClient(path=os.path.join(path, "database")))
+    config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode, config.EMBEDDING_MODEL_NAME,
+                                                               path=os.path.join(path, "embedding_cache")))
+    config.registry.override("generation_cache", GenerationCache(path=os.path.join(path, "generation_cache")))
+    config.LEXICAL_INDEX_PATH = os.path.join(path, "lexical_index")
+    config.NEAR_DUPLICATE_INDEX_PATH = os.path.join(path, "near_duplicate_index")
+    config.STORE_VERSION_PATH = os.path.join(path, "store_version")
+    config.registry.teardown("collection", "vector_store", "lexical_index")
+    config.retrieval_cache.invalidate()
+
+
+def runSize(size, videos, latency, searches, replies):
+    threads_per_video = math.ceil(size / len(videos))
+    server, url = startFakeYouTubeServer(threads_per_video=threads_per_video, latency_seconds=latency, synthetic_text=True)
+    config.registry.override("youtube", build("youtube", "v3", developerKey="benchmark", client_options={"api_endpoint": url}))
+    results = []
+
+    with tempfile.TemporaryDirectory() as path:
+        useTemporaryStores(path)
+
+        output = []
+        start = time.perf_counter()
+        for video in videos:
+            # comments_to_view is a multiple of the 100 threads per page
+            getCommentsPerVideo(video, output, comments_to_view=math.ceil(threads_per_video / 100) * 100)
+        results.append(record(size, "fetch", len(output), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        df = cleanData(output)
+        results.append(record(size, "clean", len(output), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        uploadToVectorDB(df)
+        results.append(record(size, "upload", len(df), time.perf_counter() - start))
+
+        rng = random.Random(size)
+        prompts = [makeComment(rng) for _ in range(searches)]
+        seconds, latencies = timeCalls(getSemanticSearchResults, prompts)
+        results.append(record(size, "search", searches, seconds, latencies))
+
+        questions = [QUESTIONS[i % len(QUESTIONS)] + f" ({i})" for i in range(replies)]
+        seconds, latencies = timeCalls(lambda question: callLLM(*getSemanticSearchResults(question), question, use_cache=False),
+                                       questions)
+        results.append(record(size, "reply", replies, seconds, latencies))
+
+        if hasattr(config.vector_store, "close"):
+            config.vector_store.close()
+
+    server.shutdown()
+    return results
+
+
+# print how every stage changed against an older results file
+def compare(results, older_path):
+    with open(older_path) as older_file:
+        older = json.load(older_file)
+    previous = {(result["size"], result["stage"]): result for result in older["results"]}
+
+    print(f"\ncompared with {older.get('commit')} ({older_path}):")
+    for result in results:
+        before = previous.get((result["size"], result["stage"]))
+        if before:
+            change = result["items_per_second"] / max(before["items_per_second"], 1e-9) - 1
+            print(f"{result['size']:>8}  {result['stage']:<8}{before['items_per_second']:>12.1f} -> {result['items_per_second']:>10.1f}"
+                  f" items/s ({change:+.0%})")
+
+
+def main():
+    sizes = [int(size) for size in getArg("--sizes", "1000,4000,16000", str).split(",")]
+    videos = [f"video{i:03d}" for i in range(getArg("--videos", 4, int))]
+    latency = getArg("--latency", 0.01, float)
+    searches = getArg("--searches", 50, int)
+    replies = getArg("--replies", 5, int)
+    prefill_tps = getArg("--prefill-tps", 500.0, float)
+    tps = getArg("--tps", 50.0, float)
+    output_path = getArg("--output", "pipeline_results.json", str)
+
+    _, ollama_host = startFakeOllamaServer(prefill_tokens_per_second=prefill_tps, tokens_per_second=tps, reply_tokens=40)
+    config.registry.override("llm_client", ollama.Client(host=ollama_host))
+    # load the embedding model before timing anything
+    config.embedding_model.encode(["warm up"])
+
+    results = []
+    print(f"{'size':>8}  {'stage':<8}{'items':>8}{'seconds':>10}{'items/s':>10}{'p50 s':>9}{'p95 s':>9}")
+    for size in sizes:
+        for result in runSize(size, videos, latency, searches, replies):
+            results.append(result)
+            p50 = "" if result["p50_seconds"] is None else f"{result['p50_seconds']:.4f}"
+            p95 = "" if result["p95_seconds"] is None else f"{result['p95_seconds']:.4f}"
+            print(f"{size:>8}  {result['stage']:<8}{result['items']:>8}{result['seconds']:>10.3f}{result['items_per_second']:>10.1f}"
+                  f"{p50:>9}{p95:>9}")
+
+    with open(output_path, "w") as output_file:
+        json.dump({"commit": currentCommit(), "created_at": datetime.now(timezone.utc).isoformat(),
+                   "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                   "settings": {"sizes": sizes, "videos": len(videos), "latency_seconds": latency, "searches": searches,
+                                "replies": replies, "prefill_tokens_per_second": prefill_tps, "tokens_per_second": tps},
+                   "results": results}, output_file, indent=2)
+    print(f"\nresults written to {output_path}")
+
+    if "--compare" in sys.argv:
+        compare(results, getArg("--compare", None, str))
+
+
+if __name__ == "__main__":
+    main()
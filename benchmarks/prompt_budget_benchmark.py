@@ -0,0 +1,114 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+
+import config
+from fake_ollama_server import startFakeOllamaServer
+from llm_interface import callLLM
+from llm_streaming_benchmark import PROMPTS, getArg, percentiles
+from prompt_builder import INSTRUCTIONS, REQUEST, PromptBuilder, estimateTokens
+
+"""
+Prompt Budget Benchmark
+
+This script compares the prompts `callLLM` sends with no limits (every retrieved
+example in full, as before budgets existed) and with the token budget of
+`PromptBuilder`. The retrieved examples are synthetic scraped comments and replies
+with long-tailed (lognormal) lengths, so some of them are very long.
+
+For both it reports, over --calls replies:
+
+    * prompt tokens - p50 / p95 estimated tokens of the prompt
+    * overflows     - prompts longer than the --num-ctx context window (Ollama cuts them
+                      and the instructions at the start are lost)
+    * processed     - p50 prompt tokens the server actually processed (`prompt_eval_count`),
+                      lower than the prompt when its start is reused from the previous call
+    * ttft          - p50 / p95 time to first token, which is mostly prefill
+
+By default it runs against the local fake Ollama server (see fake_ollama_server.py),
+which reuses the shared prefix of consecutive prompts like Ollama. --host runs it
+against a real Ollama instead.
+
+It also checks that the untrimmed prompt is byte for byte the one the old `callLLM`
+built and that every budgeted prompt starts with the instruction block.
+
+Usage:
+------
+python benchmarks/prompt_budget_benchmark.py [--calls 20] [--examples 5] [--budget 1536] [--max-text-tokens 160]
+                                             [--num-ctx 2048] [--prefill-tps 2000] [--host http://127.0.0.1:11434]
+"""
+
+VOCABULARY = ["honda", "civic", "si", "shifter", "turbo", "canadian", "american", "spec", "lsd", "daily", "track",
+              "gti", "type", "r", "manual", "clutch", "mpg", "insurance", "dealer", "markup", "warranty", "tires",
+              "the", "a", "is", "and", "it", "for", "my", "was", "but", "so", "really", "just", "car", "drive"]
+
+
+# words of a synthetic scraped text, lengths are lognormal like real comments (most short, a few very long)
+def makeText(rng, median_words):
+    words = int(min(3000, max(3, rng.lognormal(np.log(median_words), 1.1))))
+    return " ".join(rng.choice(VOCABULARY, words))
+
+
+# the prompt the old callLLM built, kept to check the untrimmed builder against it
+def legacyPrompt(comments, replies, prompt):
+    pre_prompt = INSTRUCTIONS
+    for i in range(len(comments)):
+        pre_prompt += "Comment " + str(i + 1) + ": " + comments[i] + "\nReply " + str(i + 1) + ": " + replies[i][0] + "\n\n"
+    return pre_prompt + REQUEST + prompt
+
+
+def main():
+    calls = getArg("--calls", 20, int)
+    example_count = getArg("--examples", 5, int)
+    num_ctx = getArg("--num-ctx", 2048, int)
+    host = getArg("--host", None, str)
+    rng = np.random.default_rng(0)
+
+    server = None
+    if host is None:
+        server, host = startFakeOllamaServer(prefill_tokens_per_second=getArg("--prefill-tps", 2000.0, float),
+                                             tokens_per_second=50.0, reply_tokens=4)
+    config.registry.override("llm_client", ollama.Client(host=host))
+    config.LLM_NUM_CTX = num_ctx
+
+    retrieved = []
+    for i in range(calls):
+        comments = [makeText(rng, 120) for _ in range(example_count)]
+        replies = [[makeText(rng, 60) for _ in range(int(rng.integers(1, 4)))] for _ in range(example_count)]
+        retrieved.append((comments, replies, PROMPTS[i % len(PROMPTS)]))
+
+    untrimmed = PromptBuilder(token_budget=None, max_text_tokens=None, max_comment_tokens=None)
+    budgeted = PromptBuilder(token_budget=getArg("--budget", 1536, int), max_text_tokens=getArg("--max-text-tokens", 160, int))
+    same = all(untrimmed.build(*example) == legacyPrompt(*example) for example in retrieved)
+    prefixed = all(budgeted.build(*example).startswith(INSTRUCTIONS) for example in retrieved)
+    print(f"untrimmed prompt identical to the old one: {same}, budgeted prompts start with the instructions: {prefixed}\n")
+
+    print(f"{'prompts':<11}{'tokens p50':>11}{'p95':>7}{'overflows':>10}{'processed p50':>14}{'ttft p50':>10}{'p95':>7}"
+          f"{'examples used':>15}")
+    for name, builder in [("untrimmed", untrimmed), ("budgeted", budgeted)]:
+        builder.stats = dict.fromkeys(builder.stats, 0)
+        config.registry.override("prompt_builder", builder)
+        truncated_before = server.truncated_count if server else 0
+
+        tokens, processed, ttft = [], [], []
+        for comments, replies, prompt in retrieved:
+            tokens.append(estimateTokens(builder.build(comments, replies, prompt)))
+            stats = {}
+            callLLM(comments, replies, prompt, stats=stats, use_cache=False)
+            processed.append(stats["prompt_tokens"])
+            ttft.append(stats["ttft_seconds"])
+
+        overflows = sum(count > num_ctx for count in tokens)
+        if server:
+            overflows = f"{overflows} ({server.truncated_count - truncated_before} cut)"
+        used = builder.stats["examples_used"] / (builder.stats["prompts"] * example_count)
+        print(f"{name:<11}{percentiles(tokens)[0]:>11.0f}{percentiles(tokens)[1]:>7.0f}{overflows:>10}"
+              f"{np.median(processed):>14.0f}{percentiles(ttft)[0]:>10.2f}{percentiles(ttft)[1]:>7.2f}{used:>15.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from resource_usage import formatBytes
+from vector_store import MemmapVectorStore
+from vector_store_benchmark import makeVectors, DIMENSION
+
+"""
+Quantization Benchmark
+
+This script stores the same corpus in a `MemmapVectorStore` with every encoding
+(float32, float16, int8 and pq), with and without a full-precision rerank, and
+compares each against the float32 store:
+
+    * search size - bytes scanned by every query (what has to stay in memory)
+    * reduction   - float32 search size / search size
+    * disk        - bytes on disk (codes plus the float32 copy kept for reranking)
+    * p50 ms      - latency of single-prompt queries
+    * recall@k    - overlap of the top k results with the float32 store's top k
+
+By default the corpus is synthetic clustered vectors. With --model, a synthetic
+comment corpus is embedded with the real embedding model instead (slower, but closer
+to the MiniLM vectors the store really holds).
+
+Usage:
+------
+python benchmarks/quantization_benchmark.py [--vectors 100000] [--queries 300] [--k 5] [--rerank 20,100] [--model]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# embeddings of synthetic comments from the real model
+def embedComments(count, rng):
+    import config
+
+    comments = [" ".join(rng.choices(WORDS, k=rng.randint(3, 30))) for _ in range(count)]
+    return np.asarray(config.embedding_model.encode(comments), dtype=np.float32)
+
+
+def buildStore(path, vectors, ids, encoding, rerank):
+    store = MemmapVectorStore(path=path, encoding=encoding, rerank=rerank)
+    # the first batch is a random sample, so the int8 scales and pq centroids are learned from the whole corpus
+    for i in range(0, len(vectors), 20000):
+        store.add(ids[i:i + 20000], vectors[i:i + 20000], None, None)
+    return store
+
+
+def main():
+    count = getArg("--vectors", 100000, int)
+    query_count = getArg("--queries", 300, int)
+    k = getArg("--k", 5, int)
+    reranks = [int(value) for value in getArg("--rerank", "20,100", str).split(",")]
+
+    if "--model" in sys.argv:
+        rng = random.Random(0)
+        vectors = embedComments(count + query_count, rng)
+        vectors, queries = vectors[:count], vectors[count:]
+    else:
+        rng = np.random.default_rng(0)
+        centres = rng.standard_normal((max(count // 50, 1), DIMENSION))
+        vectors = makeVectors(count, centres, rng)
+        queries = makeVectors(query_count, centres, rng)
+    ids = [f"row{i}" for i in range(count)]
+
+    print(f"{'encoding':<10}{'rerank':>7}{'search size':>13}{'reduction':>11}{'disk':>12}{'p50 ms':>9}{f'recall@{k}':>10}")
+    with tempfile.TemporaryDirectory() as path:
+        baseline = None
+        for encoding in ["float32", "float16", "int8", "pq"]:
+            store = buildStore(os.path.join(path, encoding), vectors, ids, encoding, 0)
+            for rerank in [0] + ([] if encoding == "float32" else reranks):
+                latencies = []
+                results = []
+                for query in queries:
+                    start = time.perf_counter()
+                    results.append(set(store.query(query, n_results=k, rerank=rerank)["ids"][0]))
+                    latencies.append(time.perf_counter() - start)
+
+                if baseline is None:
+                    baseline = results
+                sizes = store.sizes()
+                if encoding == "float32":
+                    float32_bytes = sizes["search_bytes"]
+                recall = np.mean([len(found & expected) / k for found, expected in zip(results, baseline)])
+                print(f"{encoding:<10}{rerank:>7}{formatBytes(sizes['search_bytes']):>13}"
+                      f"{float32_bytes / sizes['search_bytes']:>10.1f}x{formatBytes(sizes['disk_bytes']):>12}"
+                      f"{np.percentile(latencies, 50) * 1000:>9.2f}{recall:>10.3f}")
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import config
+from resource_usage import getCurrentRSS, formatBytes
+from upload_vector_db import uploadToVectorDB
+
+"""
+Repeated Ingest Benchmark
+
+This script calls `uploadToVectorDB` several times in a loop on small synthetic
+batches and reports the time and memory growth of each call. Only the first call
+should pay for loading the embedding model and opening Chroma, later calls reuse the
+shared components from `config`.
+
+The benchmark writes to a throwaway Chroma database in a temporary directory so the
+real ./youtube_comment_database is never touched.
+
+Usage:
+------
+python benchmarks/repeated_ingest_benchmark.py [--calls 5] [--rows 200]
+"""
+
+
+# build a small batch of fake comment-reply pairs
+def makeBatch(call, rows):
+    return pd.DataFrame({
+        "comment": [f"comment {call}-{i} about the civic si handling and shifter" for i in range(rows)],
+        "reply": [f"reply {call}-{i} agreeing about the shifter" for i in range(rows)],
+    })
+
+
+def main():
+    calls = int(sys.argv[sys.argv.index("--calls") + 1]) if "--calls" in sys.argv else 5
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 200
+
+    with tempfile.TemporaryDirectory() as database_path:
+        import chromadb
+
+        # point the shared database at the temporary directory
+        config.registry.override("database", chromadb.PersistentClient(path=database_path))
+
+        print(f"{'call':<6}{'seconds':>10}{'RSS growth':>14}")
+        for call in range(calls):
+            rss_before = getCurrentRSS()
+            start = time.perf_counter()
+            uploadToVectorDB(makeBatch(call, rows))
+            print(f"{call:<6}{time.perf_counter() - start:>10.3f}{formatBytes(getCurrentRSS() - rss_before):>14}")
+
+        print()
+        config.registry.report()
+
+
+if __name__ == "__main__":
+    main()
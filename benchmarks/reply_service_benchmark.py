@@ -0,0 +1,162 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import ollama
+import pandas as pd
+
+import config
+from batch_search_benchmark import makeComments
+from embedding_cache import EmbeddingCache
+from fake_ollama_server import startFakeOllamaServer
+from generation_cache import GenerationCache
+from reply_service import startReplyService
+from upload_vector_db import uploadToVectorDB
+
+"""
+Reply Service Benchmark
+
+This script compares answering searches the way the pipeline does today, a fresh
+Python process per request that loads the embedding model and opens Chroma, with the
+long-lived reply service (reply_service.py), and measures the service under load.
+
+It uploads a synthetic comment corpus to a throwaway Chroma database, then reports:
+
+    * cold process   - seconds for one search in a fresh process (--cold runs)
+    * warm service   - p50 seconds of one /search at a time
+    * load           - --clients threads sending --requests different searches each, with
+                       micro-batching (searches within --max-wait-ms are coalesced) and
+                       without (one search per batch): searches per second, p50 / p95
+                       seconds and mean batch size
+    * load shedding  - a burst of --clients searches against a service that lets only
+                       --queue-limit wait: how many were shed with a 503 and the p95
+                       seconds of the rest
+    * replies        - --clients concurrent /reply requests against the local fake Ollama
+                       server (see fake_ollama_server.py) with 2 generation slots
+
+Usage:
+------
+python benchmarks/reply_service_benchmark.py [--corpus 20000] [--clients 16] [--requests 20] [--max-wait-ms 5]
+                                             [--queue-limit 4] [--cold 3]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+# post a json request, returns (status, response, seconds)
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read()), time.perf_counter() - start
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read()), time.perf_counter() - start
+
+
+# send requests from several client threads at once, returns [(status, response, seconds), ...] and the wall seconds
+def runClients(url, payloads_per_client):
+    results = [[] for _ in payloads_per_client]
+    start_together = threading.Barrier(len(payloads_per_client))
+
+    def client(i):
+        start_together.wait()
+        for payload in payloads_per_client[i]:
+            results[i].append(post(url, payload))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(payloads_per_client))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result for client_results in results for result in client_results], time.perf_counter() - start
+
+
+# seconds for one search in a fresh process that loads everything itself
+def measureColdSearch(database_path, cache_path, prompt):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"""
+import sys
+sys.path.insert(0, {os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")!r})
+import config
+config.DATABASE_PATH, config.EMBEDDING_CACHE_PATH = {database_path!r}, {cache_path!r}
+from semantic_search import getSemanticSearchResults
+print(getSemanticSearchResults({prompt!r}))
+"""], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main():
+    clients = getArg("--clients", 16, int)
+    requests_per_client = getArg("--requests", 20, int)
+    max_wait_seconds = getArg("--max-wait-ms", 5.0, float) / 1000
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as path:
+        import chromadb
+
+        # point the shared database and embedding cache at temporary directories
+        database_path, cache_path = os.path.join(path, "database"), os.path.join(path, "embedding_cache")
+        config.registry.override("database", chromadb.PersistentClient(path=database_path))
+        config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode, config.EMBEDDING_MODEL_NAME,
+                                                                   path=cache_path))
+        config.registry.override("generation_cache", GenerationCache(path=os.path.join(path, "generation_cache")))
+        corpus = makeComments(getArg("--corpus", 20000, int), rng)
+        uploadToVectorDB(pd.DataFrame({"comment": corpus, "reply": [f"reply {i}" for i in range(len(corpus))]}))
+
+        cold = [measureColdSearch(database_path, os.path.join(path, f"cold_cache_{i}"), f"cold prompt {i}")
+                for i in range(getArg("--cold", 3, int))]
+        if cold:
+            print(f"cold process: {np.median(cold):.2f} s per search")
+
+        service, url = startReplyService(port=0, max_wait_seconds=max_wait_seconds)
+        warm = [post(f"{url}/search", {"prompt": prompt})[2] for prompt in makeComments(20, rng)]
+        print(f"warm service: {np.median(warm) * 1000:.1f} ms per search\n")
+        service.shutdown()
+        service.server_close()
+
+        print(f"{'load':<14}{'searches/s':>11}{'p50 ms':>8}{'p95 ms':>8}{'batch':>7}{'shed':>6}")
+        variants = [("batched", {"max_wait_seconds": max_wait_seconds}), ("unbatched", {"max_batch_size": 1}),
+                    ("shedding", {"max_wait_seconds": max_wait_seconds, "max_queued_searches": getArg("--queue-limit", 4, int)})]
+        for name, options in variants:
+            # different prompts every time, so no search is answered from the retrieval or embedding caches
+            config.retrieval_cache.invalidate()
+            count = 1 if name == "shedding" else requests_per_client
+            payloads = [[{"prompt": prompt} for prompt in makeComments(count, rng)] for _ in range(clients)]
+
+            service, url = startReplyService(port=0, warm=False, **options)
+            results, seconds = runClients(f"{url}/search", payloads)
+            answered = [result[2] for result in results if result[0] == 200]
+            print(f"{name:<14}{len(answered) / seconds:>11.1f}{np.percentile(answered, 50) * 1000:>8.1f}"
+                  f"{np.percentile(answered, 95) * 1000:>8.1f}{service.batcher.stats['mean_batch_size']:>7.1f}"
+                  f"{sum(result[0] == 503 for result in results):>6}")
+            service.shutdown()
+            service.server_close()
+
+        _, ollama_host = startFakeOllamaServer(prefill_tokens_per_second=2000.0, tokens_per_second=50.0, reply_tokens=20, parallel=2)
+        config.registry.override("llm_client", ollama.Client(host=ollama_host))
+        service, url = startReplyService(port=0, warm=False, max_generations=2, max_queued_replies=clients // 2)
+        payloads = [[{"prompt": prompt, "use_cache": False}] for prompt in makeComments(clients, rng)]
+        results, seconds = runClients(f"{url}/reply", payloads)
+        answered = [result[2] for result in results if result[0] == 200]
+        print(f"\nreplies: {len(answered)} of {clients} answered in {seconds:.2f} s (p95 {np.percentile(answered, 95):.2f} s), "
+              f"{sum(result[0] == 503 for result in results)} shed")
+        service.shutdown()
+        service.server_close()
+
+
+if __name__ == "__main__":
+    main()
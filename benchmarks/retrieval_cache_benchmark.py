@@ -0,0 +1,128 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+import config
+from embedding_cache import EmbeddingCache
+from retrieval_cache import RetrievalCache
+from semantic_search import getSemanticSearchResults
+from upload_vector_db import uploadToVectorDB
+
+"""
+Retrieval Cache Benchmark
+
+This script replays a stream of incoming comments through `getSemanticSearchResults`
+with the retrieval cache off and on. The stream looks like a real moderation sweep:
+a few popular questions are asked over and over (picked with a Zipf distribution),
+often with different case, spacing or punctuation, and sometimes with a small typo.
+
+Halfway through the stream a small batch of new comments is uploaded, which must
+invalidate the cache. Afterwards, every result the cached run returned for the
+second half of the stream is checked against a fresh, uncached search.
+
+For both runs it reports seconds, p50 / p99 latency per prompt, and the cache's exact
+hits, similar hits and misses. Similar hits depend on the embedding model, so they
+only show up with the real model.
+
+Usage:
+------
+python benchmarks/retrieval_cache_benchmark.py [--comments 20000] [--prompts 5000] [--questions 300] [--similarity 0.97]
+"""
+
+WORDS = ["civic", "si", "honda", "shifter", "turbo", "lsd", "daily", "driver", "mazda", "gti", "canadian", "spec",
+         "price", "dealer", "markup", "clutch", "exhaust", "sound", "interior", "seats", "mpg", "winter", "tires"]
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def makeComments(count, rng):
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 30))) for _ in range(count)]
+
+
+# rewrite a question the way different people would type it
+def makeVariant(question, rng):
+    roll = rng.random()
+    if roll < 0.4:
+        return question
+    if roll < 0.6:
+        return question.upper()
+    if roll < 0.8:
+        return "  " + question.replace(" ", "  ") + " "
+    if roll < 0.9:
+        return question + "?"
+    # drop one character (a typo)
+    position = rng.randrange(len(question))
+    return question[:position] + question[position + 1:]
+
+
+def runStream(stream, new_comments):
+    latencies = []
+    results = []
+    for i, prompt in enumerate(stream):
+        if i == len(stream) // 2:
+            uploadToVectorDB(new_comments)
+
+        start = time.perf_counter()
+        results.append(getSemanticSearchResults(prompt))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies)
+
+
+def main():
+    comment_count = getArg("--comments", 20000, int)
+    prompt_count = getArg("--prompts", 5000, int)
+    question_count = getArg("--questions", 300, int)
+    similarity = getArg("--similarity", 0.97, float)
+    rng = random.Random(0)
+
+    questions = makeComments(question_count, rng)
+    weights = [1 / (rank + 1) for rank in range(question_count)]
+    stream = [makeVariant(question, rng) for question in rng.choices(questions, weights=weights, k=prompt_count)]
+    first_half = pd.DataFrame({"comment": makeComments(comment_count, rng), "reply": ["reply"] * comment_count})
+    new_comments = pd.DataFrame({"comment": makeComments(100, rng), "reply": ["new reply"] * 100})
+
+    print(f"{'run':<10}{'seconds':>10}{'p50 ms':>9}{'p99 ms':>9}{'exact':>8}{'similar':>9}{'misses':>8}")
+    for name, cache in [("uncached", RetrievalCache(max_entries=0)), ("cached", RetrievalCache(similarity_threshold=similarity))]:
+        with tempfile.TemporaryDirectory() as database_path, tempfile.TemporaryDirectory() as cache_path:
+            import chromadb
+
+            # fresh database and caches for every run
+            config.registry.override("database", chromadb.PersistentClient(path=database_path))
+            config.registry.teardown("collection", "vector_store")
+            config.registry.override("embedding_cache", EmbeddingCache(config.embedding_model.encode,
+                                                                       config.EMBEDDING_MODEL_NAME, path=cache_path))
+            config.registry.override("retrieval_cache", cache)
+            uploadToVectorDB(first_half)
+            # encode the whole stream once so both runs pay the same (zero) encoding cost
+            config.embedding_cache.encode(stream)
+
+            before = dict(cache.stats)
+            start = time.perf_counter()
+            results, latencies = runStream(stream, new_comments)
+            seconds = time.perf_counter() - start
+            print(f"{name:<10}{seconds:>10.2f}{np.percentile(latencies, 50) * 1000:>9.2f}{np.percentile(latencies, 99) * 1000:>9.2f}"
+                  f"{cache.stats['exact_hits'] - before['exact_hits']:>8}{cache.stats['similar_hits'] - before['similar_hits']:>9}"
+                  f"{cache.stats['misses'] - before['misses']:>8}")
+
+            if name == "cached":
+                invalidations = cache.stats["invalidations"] - before["invalidations"]
+                # the collection no longer changes, so the second half can be checked against uncached searches
+                config.registry.override("retrieval_cache", RetrievalCache(max_entries=0))
+                second_half = range(len(stream) // 2, len(stream))
+                identical = sum(getSemanticSearchResults(stream[i]) == results[i] for i in second_half)
+
+    print(f"\ninvalidations during the cached run: {invalidations}")
+    print(f"second half results identical to uncached searches: {identical} of {len(second_half)} prompts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from vector_store import (ChromaVectorStore, MemmapVectorStore, ShardedVectorStore, getOrCreateChromaCollection,
+                          memmapShardPath, shardCollectionName)
+from vector_store_benchmark import DIMENSION, makeVectors
+
+"""
+Sharded Search Benchmark
+
+This script measures how query latency grows as channels are added, with all rows in
+one store and with one shard per channel (`ShardedVectorStore` keyed on channel_id).
+Every channel has the same number of comments, so the corpus grows with the channel
+count.
+
+For every channel count and layout it reports p50 / p99 latency of:
+
+    * scoped   - queries filtered to one channel ({"channel_id": ...})
+    * all      - unfiltered queries over every channel (fanned out to every shard in
+                 parallel and merged for the sharded layout)
+
+and the fraction of queries whose sharded results are the same ids as the single
+store's. The memmap backend searches exactly, so it should be 1.000. With Chroma both
+layouts are approximate (one HNSW graph against one per shard), so it is lower.
+
+Unfiltered queries on the sharded layout search every shard, so they only get faster
+than the single store when there are free cores to run the shards on.
+
+Usage:
+------
+python benchmarks/sharded_search_benchmark.py [--channels 2,8,32] [--rows-per-channel 5000] [--queries 200] [--k 5]
+                                              [--backend memmap|chroma] [--workers 8]
+"""
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def openStore(backend, path, name):
+    if backend == "memmap":
+        return MemmapVectorStore(path=os.path.join(path, name))
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(path, "chroma"))
+    return ChromaVectorStore(getOrCreateChromaCollection(client, name))
+
+
+def openShardedStore(backend, path, workers):
+    if backend == "memmap":
+        return ShardedVectorStore(lambda shard: MemmapVectorStore(path=memmapShardPath(os.path.join(path, "sharded"), shard)),
+                                  "channel_id", max_workers=workers)
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(path, "chroma"))
+    return ShardedVectorStore(lambda shard: ChromaVectorStore(getOrCreateChromaCollection(
+        client, shardCollectionName("sharded", shard), metadata={"shard_of": "sharded", "shard": shard})),
+        "channel_id", max_workers=workers)
+
+
+# (p50 ms, p99 ms) of single-prompt queries, and the ids they returned
+def timeQueries(store, queries, k, wheres):
+    latencies, ids = [], []
+    for query, where in zip(queries, wheres):
+        start = time.perf_counter()
+        result = store.query(query_embeddings=query, n_results=k, where=where)
+        latencies.append(time.perf_counter() - start)
+        ids.append(set(result["ids"][0]))
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000, ids
+
+
+def main():
+    channel_counts = getArg("--channels", [2, 8, 32], lambda value: [int(count) for count in value.split(",")])
+    rows_per_channel = getArg("--rows-per-channel", 5000, int)
+    query_count = getArg("--queries", 200, int)
+    k = getArg("--k", 5, int)
+    backend = getArg("--backend", "memmap", str)
+    workers = getArg("--workers", 8, int)
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((2000, DIMENSION))
+
+    print(f"{'channels':>8}{'rows':>9}  {'layout':<9}{'scoped p50':>11}{'p99':>8}{'all p50':>9}{'p99':>8}{'same ids':>10}")
+    for channel_count in channel_counts:
+        rows = channel_count * rows_per_channel
+        vectors = makeVectors(rows, centres, rng)
+        ids = [f"row{i}" for i in range(rows)]
+        metadatas = [{"reply": "reply", "channel_id": f"channel{i % channel_count}"} for i in range(rows)]
+        queries = makeVectors(query_count, centres, rng)
+        scoped = [{"channel_id": f"channel{rng.integers(channel_count)}"} for _ in range(query_count)]
+
+        with tempfile.TemporaryDirectory() as path:
+            results = {}
+            for layout, store in [("single", openStore(backend, path, "single")), ("sharded", openShardedStore(backend, path, workers))]:
+                for start in range(0, rows, 5000):
+                    store.add(ids[start:start + 5000], vectors[start:start + 5000], ["comment"] * len(ids[start:start + 5000]),
+                              metadatas[start:start + 5000])
+
+                scoped_p50, scoped_p99, scoped_ids = timeQueries(store, queries, k, scoped)
+                all_p50, all_p99, all_ids = timeQueries(store, queries, k, [None] * query_count)
+                results[layout] = scoped_ids + all_ids
+                same = "" if layout == "single" else \
+                    f"{np.mean([a == b for a, b in zip(results['single'], results['sharded'])]):.3f}"
+                print(f"{channel_count:>8}{rows:>9}  {layout:<9}{scoped_p50:>11.2f}{scoped_p99:>8.2f}{all_p50:>9.2f}{all_p99:>8.2f}{same:>10}")
+                if hasattr(store, "close"):
+                    store.close()
+
+
+if __name__ == "__main__":
+    main()
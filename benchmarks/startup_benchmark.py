@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import time
+
+"""
+Startup Benchmark
+
+This script measures the import cost of each pipeline entry point. Every measurement
+runs in a fresh Python process so nothing is shared between runs.
+
+For each entry point two timings are reported:
+    * eager - `config.registry.warm()` is called before the module is imported, which
+      reproduces the old behaviour of `config.py` building the YouTube client, loading
+      the embedding model and opening Chroma at import time.
+    * lazy  - the module is imported on its own and components are only built on first
+      access (the current behaviour).
+
+Usage:
+------
+python benchmarks/startup_benchmark.py [--repeats 3]
+"""
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ENTRY_POINTS = ["youtube_scraper", "data_cleaning", "upload_vector_db", "semantic_search", "llm_interface"]
+
+
+# time a snippet of code in a fresh interpreter with src on the path
+def timeImport(code, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=os.path.join(SRC_DIR, ".."), check=True,
+                       env={**os.environ, "PYTHONPATH": SRC_DIR})
+        timings.append(time.perf_counter() - start)
+
+    # report the best run, the others are mostly noise from the OS
+    return min(timings)
+
+
+def main():
+    repeats = 3
+    if "--repeats" in sys.argv:
+        repeats = int(sys.argv[sys.argv.index("--repeats") + 1])
+
+    baseline = timeImport("pass", repeats)
+
+    print(f"{'entry point':<20}{'eager (s)':>12}{'lazy (s)':>12}{'speedup':>10}")
+    for module in ENTRY_POINTS:
+        eager = timeImport(f"import config; config.registry.warm(); import {module}", repeats) - baseline
+        lazy = timeImport(f"import {module}", repeats) - baseline
+        print(f"{module:<20}{eager:>12.3f}{lazy:>12.3f}{eager / max(lazy, 1e-6):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
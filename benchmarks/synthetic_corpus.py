@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+"""
+Synthetic Corpus
+
+Seeded generator of YouTube comment–reply text that looks like what the scraper gets
+back, for benchmarks that should not depend on a live API key:
+
+    * lengths are lognormal, most comments are a short sentence and a few are long
+      paragraphs (median about 14 words for comments and 9 for replies)
+    * emojis, URLs, HTML tags and entities (<br>, <a href="...">, <b>, &amp;, &#39;) and
+      timestamp links each appear in a few to twenty percent of the texts
+    * some comments are exact or near duplicates ("First!", repeated spam, the same
+      question with different spacing or punctuation)
+
+The same seed always gives the same corpus.
+
+Functions:
+----------
+makeComment(rng: random.Random) -> str
+makeReply(rng: random.Random) -> str
+    - One comment or reply text (HTML formatted, like `textDisplay` in the API).
+makeCorpus(pairs: int, seed: int = 0, videos: int = 16, channels: int = 8) -> list[dict]
+    - Comment–reply pairs in the format returned by `fetchYouTubeComments` (comment, reply,
+      video_id, comment_id, channel_id, published_at, like_count, reply_like_count).
+
+Usage:
+------
+python benchmarks/synthetic_corpus.py [--pairs 10] [--seed 0]
+"""
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+WORDS = ["the", "si", "is", "a", "great", "daily", "driver", "and", "shifter", "feels", "amazing", "honestly", "canadian",
+         "spec", "gets", "more", "features", "for", "less", "money", "turbo", "lsd", "makes", "it", "fun", "civic", "honda",
+         "i", "my", "this", "car", "was", "but", "so", "really", "just", "manual", "clutch", "mpg", "insurance", "dealer",
+         "markup", "warranty", "tires", "track", "gti", "type", "r", "exhaust", "sound", "interior", "seats", "winter",
+         "k20c6", "hpt", "rev", "hang", "gear", "ratios", "brakes", "suspension", "stock", "tune", "intake", "wheels"]
+EMOJIS = ["😂", "🔥", "👍", "😍", "🚗", "💯", "🤣", "😭", "🙌", "😎"]
+URLS = ["https://www.honda.ca/civic-si", "https://youtu.be/RrZSuz-e9NY", "www.civicx.com/forum/threads/si-review",
+        "https://www.reddit.com/r/civicsi/comments/abc123"]
+SPAM = ["First!", "Who is watching in 2024?", "Check out my channel for more car content", "Great video!", "Nice"]
+QUESTIONS = ["Is the Si fast enough for track days?", "How does it compare to the GTI?", "Should I wait for the Type R?",
+             "What mpg are you getting?", "Does the Canadian spec get the HPT?"]
+
+
+# number of words of a text, lognormal so there is a long tail of very long comments
+def _length(rng, median):
+    return max(1, min(400, int(rng.lognormvariate(0, 0.9) * median)))
+
+
+def _sentence(rng, words):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + rng.choice([".", "!", "?", "", "..."])
+
+
+# decorate a text with the html, links, emojis and entities found in textDisplay
+def _decorate(rng, text):
+    if rng.random() < 0.08:
+        url = rng.choice(URLS)
+        text += f' <a href="{url}">{url}</a>' if rng.random() < 0.5 else f" {url}"
+    if rng.random() < 0.15:
+        text = text.replace(". ", ".<br>", 1) if ". " in text else text + "<br><br>" + _sentence(rng, 4)
+    if rng.random() < 0.05:
+        text = f"<b>{text}</b>"
+    if rng.random() < 0.06:
+        text = text.replace(" and ", " &amp; ", 1).replace(" it is ", " it&#39;s ", 1)
+    if rng.random() < 0.04:
+        text = f'<a href="https://www.youtube.com/watch?v=x&amp;t={rng.randint(10, 900)}">{rng.randint(0, 14)}:{rng.randint(10, 59)}</a> {text}'
+    if rng.random() < 0.2:
+        text += " " + "".join(rng.choice(EMOJIS) for _ in range(rng.randint(1, 4)))
+    return text
+
+
+def _text(rng, median):
+    words = _length(rng, median)
+    sentences = []
+    while words > 0:
+        sentence_words = min(words, rng.randint(4, 18))
+        sentences.append(_sentence(rng, sentence_words))
+        words -= sentence_words
+    return _decorate(rng, " ".join(sentences))
+
+
+def makeComment(rng):
+    # spam and repeated questions make exact and near duplicates
+    roll = rng.random()
+    if roll < 0.04:
+        return rng.choice(SPAM)
+    if roll < 0.08:
+        question = rng.choice(QUESTIONS)
+        return rng.choice([question, question.lower(), question.replace("?", " ??"), "  " + question])
+    return _text(rng, 14)
+
+
+def makeReply(rng):
+    return _text(rng, 9)
+
+
+# comment-reply pairs like the output of fetchYouTubeComments
+def makeCorpus(pairs, seed=0, videos=16, channels=8):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(pairs):
+        video = i % videos
+        published = BASE_TIME + timedelta(minutes=rng.randint(0, 500000))
+        corpus.append({"comment": makeComment(rng), "reply": makeReply(rng), "video_id": f"video{video:03d}",
+                       "comment_id": f"video{video:03d}.{i}", "channel_id": f"UCfakechannel{video % channels}",
+                       "published_at": published.strftime("%Y-%m-%dT%H:%M:%SZ"), "like_count": int(rng.paretovariate(1.2)) - 1,
+                       "reply_like_count": int(rng.paretovariate(1.5)) - 1})
+    return corpus
+
+
+if __name__ == "__main__":
+    import sys
+
+    pair_count = int(sys.argv[sys.argv.index("--pairs") + 1]) if "--pairs" in sys.argv else 10
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+    for pair in makeCorpus(pair_count, seed=seed):
+        print(pair)
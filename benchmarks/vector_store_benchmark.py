@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from resource_usage import getCurrentRSS, formatBytes
+from vector_store import ChromaVectorStore, MemmapVectorStore, getOrCreateChromaCollection
+
+"""
+Vector Store Benchmark
+
+This script compares the Chroma backend (approximate HNSW search) with the
+memory-mapped exact-search backend on the same synthetic corpus of 384-d unit vectors.
+The vectors are drawn around a few thousand cluster centres, like embeddings of
+comments that talk about the same few topics.
+
+Both stores are built in temporary directories, then reopened from disk. For every
+backend it reports:
+
+    * build   - seconds to insert the corpus
+    * open    - seconds to reopen the store in a fresh process and run a first query,
+                and the RSS growth of that process
+    * p50/p99 - latency of single-prompt queries
+    * batch   - queries per second when queries are sent in batches of --batch-size
+    * recall  - recall@k against an exact NumPy search
+
+Usage:
+------
+python benchmarks/vector_store_benchmark.py [--vectors 100000] [--queries 500] [--k 5] [--batch-size 256]
+"""
+
+DIMENSION = 384
+
+
+def getArg(name, default, cast):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def normalize(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def makeVectors(count, centres, rng):
+    return normalize(centres[rng.integers(0, len(centres), count)] + 0.7 * rng.standard_normal((count, DIMENSION)))
+
+
+def openChroma(path):
+    import chromadb
+
+    return ChromaVectorStore(getOrCreateChromaCollection(chromadb.PersistentClient(path=path), "benchmark"))
+
+
+def openMemmap(path):
+    return MemmapVectorStore(path=path)
+
+
+# reopen a store in a fresh process (so nothing is cached yet) and run one query, returns (seconds, RSS growth)
+def measureOpen(name, path):
+    output = subprocess.run([sys.executable, __file__, "--open", name, path], capture_output=True, text=True, check=True).stdout
+    seconds, rss = output.split()
+    return float(seconds), int(rss)
+
+
+def runOpen(name, path):
+    rss_before = getCurrentRSS()
+    start = time.perf_counter()
+    store = BACKENDS[name](path)
+    store.query(np.ones(DIMENSION, dtype=np.float32), n_results=5)
+    print(time.perf_counter() - start, getCurrentRSS() - rss_before)
+
+
+def recallAtK(result_ids, exact_ids):
+    return np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(result_ids, exact_ids)])
+
+
+def main():
+    count = getArg("--vectors", 100000, int)
+    query_count = getArg("--queries", 500, int)
+    k = getArg("--k", 5, int)
+    batch_size = getArg("--batch-size", 256, int)
+    rng = np.random.default_rng(0)
+
+    centres = rng.standard_normal((max(count // 50, 1), DIMENSION))
+    vectors = makeVectors(count, centres, rng)
+    queries = makeVectors(query_count, centres, rng)
+    ids = [f"row{i}" for i in range(count)]
+
+    # exact nearest neighbours
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    exact_ids = [[ids[i] for i in row] for row in exact]
+
+    print(f"{'backend':<9}{'build s':>9}{'open s':>8}{'open RSS':>11}{'p50 ms':>9}{'p99 ms':>9}{'batch q/s':>11}{'recall':>8}")
+    with tempfile.TemporaryDirectory() as path:
+        for name, open_store in BACKENDS.items():
+            store_path = os.path.join(path, name)
+            store = open_store(store_path)
+            start = time.perf_counter()
+            for i in range(0, count, 5000):
+                store.add(ids[i:i + 5000], vectors[i:i + 5000], [f"comment {j}" for j in range(i, min(i + 5000, count))],
+                          [{"reply": f"reply {j}"} for j in range(i, min(i + 5000, count))])
+            build_seconds = time.perf_counter() - start
+            open_seconds, open_rss = measureOpen(name, store_path)
+
+            latencies = []
+            result_ids = []
+            for query in queries:
+                start = time.perf_counter()
+                result_ids.append(store.query(query, n_results=k)["ids"][0])
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for i in range(0, query_count, batch_size):
+                store.query(queries[i:i + batch_size], n_results=k)
+            batch_rate = query_count / (time.perf_counter() - start)
+
+            print(f"{name:<9}{build_seconds:>9.2f}{open_seconds:>8.2f}{formatBytes(open_rss):>11}"
+                  f"{np.percentile(latencies, 50) * 1000:>9.2f}{np.percentile(latencies, 99) * 1000:>9.2f}"
+                  f"{batch_rate:>11.1f}{recallAtK(result_ids, exact_ids):>8.3f}")
+
+
+BACKENDS = {"memmap": openMemmap, "chroma": openChroma}
+
+
+if __name__ == "__main__":
+    if "--open" in sys.argv:
+        runOpen(sys.argv[sys.argv.index("--open") + 1], sys.argv[sys.argv.index("--open") + 2])
+    else:
+        main()
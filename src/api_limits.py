@@ -0,0 +1,135 @@
+import random
+import socket
+import threading
+import time
+
+"""
+YouTube API Limits
+
+This module provides the building blocks used to call the YouTube Data API safely
+from several threads at once: a shared quota-unit budget, a requests-per-second rate
+limiter and a retry helper with exponential backoff for transient errors.
+
+Classes:
+---------
+QuotaBudget(units: int | None)
+    - Thread-safe counter of YouTube quota units.
+    - `spend(units)` reserves units before a request and raises `QuotaExceededError`
+      once the budget is used up. A budget of None is unlimited.
+
+RateLimiter(requests_per_second: float | None)
+    - Thread-safe limiter that spaces requests evenly across all threads.
+    - `wait()` blocks until the next request is allowed. A rate of None is unlimited.
+
+Functions:
+----------
+executeWithRetry(request, max_retries: int = 5, backoff_seconds: float = 1.0, http = None) -> dict
+    - Executes a googleapiclient request and returns the parsed response.
+    - Retries on 429 and 5xx responses, on 403 responses caused by rate limiting and on
+      network errors, sleeping `backoff_seconds * 2 ** attempt` (plus jitter) between tries.
+    - Raises `QuotaExceededError` when the API reports that the daily quota is used up.
+
+Notes:
+-------
+- `commentThreads().list` costs 1 quota unit per call, the default daily quota for a
+  YouTube Data API project is 10,000 units.
+"""
+
+# quota cost of the API methods used by the scraper
+COMMENT_THREADS_LIST_COST = 1
+
+# 403 reasons that will not go away by retrying
+NON_RETRYABLE_403_REASONS = {"quotaExceeded", "dailyLimitExceeded", "commentsDisabled", "forbidden"}
+
+
+# raised when the quota budget (ours or the API's) is used up
+class QuotaExceededError(Exception):
+    pass
+
+
+# shared budget of quota units
+class QuotaBudget:
+
+    def __init__(self, units=None):
+        self.units = units
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    # reserve quota units for a request
+    def spend(self, units=COMMENT_THREADS_LIST_COST):
+        with self._lock:
+            if self.units is not None and self.spent + units > self.units:
+                raise QuotaExceededError(f"Quota budget of {self.units} units used up")
+            self.spent += units
+
+    # units left in the budget (None if unlimited)
+    def remaining(self):
+        if self.units is None:
+            return None
+        return self.units - self.spent
+
+
+# spaces requests evenly so all threads together stay under requests_per_second
+class RateLimiter:
+
+    def __init__(self, requests_per_second=None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    # block until the next request is allowed
+    def wait(self):
+        if not self.interval:
+            return
+
+        # reserve the next slot while holding the lock, then sleep outside of it
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_time, now)
+            self._next_time = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# get the reasons listed in a googleapiclient HttpError (e.g. ["quotaExceeded"])
+def getErrorReasons(error):
+    details = getattr(error, "error_details", None)
+    if not isinstance(details, list):
+        return []
+    return [detail.get("reason") for detail in details if isinstance(detail, dict)]
+
+
+# check if an error is worth retrying
+def isRetryable(error):
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 403:
+            return not NON_RETRYABLE_403_REASONS.intersection(getErrorReasons(error))
+        return status == 429 or status >= 500
+
+    return isinstance(error, (socket.timeout, ConnectionError, TimeoutError))
+
+
+# execute a googleapiclient request, retrying transient errors with exponential backoff
+# http == optional httplib2.Http to use instead of the client's shared one (needed when calling from several threads)
+def executeWithRetry(request, max_retries=5, backoff_seconds=1.0, http=None, on_retry=None):
+    from googleapiclient.errors import HttpError
+
+    for attempt in range(max_retries + 1):
+        try:
+            return request.execute(http=http)
+        except (HttpError, socket.timeout, ConnectionError, TimeoutError) as error:
+            if isinstance(error, HttpError) and {"quotaExceeded", "dailyLimitExceeded"}.intersection(getErrorReasons(error)):
+                raise QuotaExceededError("YouTube API daily quota used up") from error
+
+            if attempt == max_retries or not isRetryable(error):
+                raise
+
+            if on_retry is not None:
+                on_retry(error)
+
+            # exponential backoff with jitter so threads don't retry in lockstep
+            time.sleep(backoff_seconds * 2 ** attempt + random.uniform(0, backoff_seconds))
@@ -0,0 +1,145 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+
+"""
+Batch Encoder
+
+This module provides a high-throughput CPU encoding engine for the upload path. A
+plain `SentenceTransformer.encode(comments)` call pads every batch to its longest
+text and runs in a single process. `BatchEncoder` instead:
+
+1. Estimates the token length of every text (a cheap word-piece approximation, no
+   tokenizer or model needed).
+2. Sorts the texts by length and groups them into batches under a token budget, so
+   short "lol" comments go in large batches and long comments in small ones, with
+   little padding either way.
+3. Encodes the batches in the current process, or fans them out over a process pool
+   with one model replica per worker.
+4. Puts the embeddings back in the original order of the texts.
+
+Class:
+-------
+BatchEncoder(model_name: str = config.EMBEDDING_MODEL_NAME, workers: int = 0, tokens_per_batch: int = 8192,
+             max_batch_size: int = 256, min_parallel_texts: int = 512)
+    - encode(texts, **encode_options) -> numpy.ndarray
+        Embeds a list of texts (or a single string) and returns float32 embeddings in
+        input order. Lists shorter than `min_parallel_texts` are encoded in-process.
+    - makeBatches(texts) -> list[list[int]]
+        Returns the length-bucketed batches of text indices that `encode` will use.
+    - close() -> None
+        Shuts down the worker processes.
+
+Notes:
+-------
+- With `workers` > 0 each worker loads its own copy of the model and uses
+  `os.cpu_count() // workers` torch threads, so the workers don't oversubscribe the CPU.
+- In-process encoding uses the shared `config.embedding_model`.
+"""
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces
+MAX_SEQUENCE_LENGTH = 256
+
+# roughly how BERT pre-tokenizes: words and single punctuation marks
+_PRE_TOKENS = re.compile(r"\w+|[^\w\s]")
+
+# model loaded in each worker process
+_worker_model = None
+
+
+# load one model replica per worker process
+def _initWorker(model_name, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encodeInWorker(texts, encode_options):
+    return _worker_model.encode(texts, batch_size=len(texts), **encode_options)
+
+
+# approximate word piece count of a text ([CLS] and [SEP] included)
+def estimateTokens(text):
+    # long words are split into several word pieces, count roughly one piece per 6 characters
+    pieces = sum(1 + len(token) // 6 for token in _PRE_TOKENS.findall(text))
+    return min(pieces + 2, MAX_SEQUENCE_LENGTH)
+
+
+class BatchEncoder:
+
+    # model_name == sentence-transformers model loaded by the worker processes
+    # workers == number of worker processes (0 encodes in this process)
+    # tokens_per_batch == max padded tokens per batch (batch size x longest text in the batch)
+    # max_batch_size == max texts per batch, however short they are
+    # min_parallel_texts == lists shorter than this skip the worker processes
+    def __init__(self, model_name=config.EMBEDDING_MODEL_NAME, workers=0, tokens_per_batch=8192,
+                 max_batch_size=256, min_parallel_texts=512):
+        self.model_name = model_name
+        self.workers = workers
+        self.tokens_per_batch = tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.min_parallel_texts = min_parallel_texts
+        self._pool = None
+
+    def _getPool(self):
+        if self._pool is None:
+            threads = max((os.cpu_count() or 1) // self.workers, 1)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker,
+                                             initargs=(self.model_name, threads))
+        return self._pool
+
+    # group text indices into batches of similar length under the token budget
+    def makeBatches(self, texts):
+        lengths = [estimateTokens(text) for text in texts]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+        batches = []
+        batch = []
+        for index in order:
+            # texts are sorted, so the text being added is the longest in the batch
+            if batch and ((len(batch) + 1) * lengths[index] > self.tokens_per_batch or len(batch) == self.max_batch_size):
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    # embed texts, returning embeddings in input order
+    def encode(self, texts, **encode_options):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        encode_options.pop("batch_size", None)
+
+        batches = self.makeBatches(texts)
+        batch_texts = [[texts[i] for i in batch] for batch in batches]
+
+        if self.workers and len(texts) >= self.min_parallel_texts:
+            results = self._getPool().map(_encodeInWorker, batch_texts, [encode_options] * len(batches))
+        else:
+            model = config.embedding_model
+            results = (model.encode(chunk, batch_size=len(chunk), **encode_options) for chunk in batch_texts)
+
+        embeddings = None
+        for batch, result in zip(batches, results):
+            result = np.asarray(result, dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), result.shape[1]), dtype=np.float32)
+            embeddings[batch] = result
+
+        if embeddings is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,238 @@
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+from llm_interface import callLLM
+from semantic_search import getSemanticSearchResultsBatch
+
+"""
+Batch Reply Runner
+
+This module drafts replies for a whole queue of new comments instead of one hard-coded
+prompt. Comments flow through two overlapping stages, so the retrieval of later
+comments runs while the LLM is still generating replies for earlier ones:
+
+1. retrieve - comments are read from the input `retrieval_batch_size` at a time and
+              searched together with `getSemanticSearchResultsBatch` (one batched encode
+              and one vector store query per batch).
+2. generate - `concurrency` worker threads take retrieved comments and call `callLLM`, so
+              at most `concurrency` generations are in flight in Ollama at once.
+
+Every reply is appended to a JSON lines file as soon as it is finished (in completion
+order, each line carries the comment's position in the input), so a long batch can be
+followed with `tail -f` and a crash keeps every reply written so far.
+
+Class:
+-------
+BatchReplyRunner(retrieval_batch_size: int = 8, concurrency: int = 2, comments_to_return: int = 5,
+                 timeout: float | None = None, use_cache: bool = True, where: dict | None = None)
+    - run(comments, output_path) -> dict
+        Drafts a reply for every comment and returns the stats of the run: comments,
+        replies, errors, seconds, comments per second, p50 / p95 seconds per comment
+        (from when the comment was read to when its reply was written), cached replies
+        and busy seconds of each stage.
+
+Functions:
+----------
+readComments(path: str) -> iterator of dict
+    - Reads incoming comments from a text file (one comment per line) or a JSON lines
+      file (one {"comment": ..., "id": ...} object per line, `id` is optional).
+runBatchReplies(comments, output_path: str, **options) -> dict
+    - Builds a `BatchReplyRunner` with the given options and runs it.
+
+Parameters:
+------------
+comments : iterable of str or dict
+    Incoming comments, as strings or dicts with a `comment` and an optional `id`. They are
+    read lazily, so a generator that yields comments as they arrive works too.
+output_path : str
+    JSON lines file the replies are appended to, one object per comment with its
+    `index`, `id`, `comment`, `reply` (or `error`), `seconds` and `cached`.
+
+Notes:
+-------
+- Ollama only runs `OLLAMA_NUM_PARALLEL` requests of a model at a time, more in flight
+  just wait in its queue. `concurrency` should match it.
+- A reply that fails (e.g. a `timeout`) is written with its `error` and the batch goes on.
+"""
+
+# marks the end of a stage's output
+_END = object()
+
+
+# incoming comments from a text or json lines file
+def readComments(path):
+    with open(path, encoding="utf-8") as comments_file:
+        for line in comments_file:
+            line = line.strip()
+            if not line:
+                continue
+            yield json.loads(line) if path.endswith(".jsonl") else {"comment": line}
+
+
+class BatchReplyRunner:
+
+    # retrieval_batch_size == comments searched in one batched query
+    # concurrency == max replies generated at the same time
+    # comments_to_return == retrieved comment-reply pairs per comment
+    # timeout == max seconds for one reply (None for no limit)
+    # use_cache == False to always generate fresh replies (see callLLM)
+    # where == optional metadata filter for the retrieval, e.g. {"channel_id": "UC..."}
+    def __init__(self, retrieval_batch_size=8, concurrency=2, comments_to_return=5, timeout=None, use_cache=True, where=None):
+        self.retrieval_batch_size = retrieval_batch_size
+        self.concurrency = concurrency
+        self.comments_to_return = comments_to_return
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.where = where
+
+    # put an item on a queue, giving up if another stage failed
+    def _put(self, stage_queue, item):
+        while not self._stop.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    # get an item from a queue, returning _END if another stage failed
+    def _get(self, stage_queue):
+        while not self._stop.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    # run a stage, stopping the whole run if it fails
+    def _runStage(self, stage_function):
+        try:
+            stage_function()
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop.set()
+
+    def _busy(self, name, seconds):
+        with self._stats_lock:
+            self.stats["stage_seconds"][name] += seconds
+
+    def _retrieve(self, batch):
+        start = time.perf_counter()
+        results = getSemanticSearchResultsBatch([item["comment"] for item in batch], self.comments_to_return, where=self.where)
+        self._busy("retrieve", time.perf_counter() - start)
+        for item, (comments, replies) in zip(batch, results):
+            self._put(self._retrieved, (item, comments, replies))
+
+    def _retrieveStage(self, comments):
+        batch = []
+        for index, comment in enumerate(comments):
+            if self._stop.is_set():
+                break
+            item = dict(comment) if isinstance(comment, dict) else {"comment": comment}
+            batch.append({"index": index, "id": item.get("id"), "comment": item["comment"], "read_at": time.perf_counter()})
+            if len(batch) == self.retrieval_batch_size:
+                self._retrieve(batch)
+                batch = []
+
+        if batch and not self._stop.is_set():
+            self._retrieve(batch)
+        for _ in range(self.concurrency):
+            self._put(self._retrieved, _END)
+
+    def _generateStage(self):
+        while True:
+            retrieved = self._get(self._retrieved)
+            if retrieved is _END:
+                break
+
+            item, comments, replies = retrieved
+            stats = {}
+            record = {"index": item["index"], "id": item["id"], "comment": item["comment"]}
+            start = time.perf_counter()
+            try:
+                record["reply"] = callLLM(comments, replies, item["comment"], timeout=self.timeout, stats=stats,
+                                          use_cache=self.use_cache)
+            except Exception as error:
+                record["error"] = f"{type(error).__name__}: {error}"
+            self._busy("generate", time.perf_counter() - start)
+            record["cached"] = stats.get("cached", False)
+            self._put(self._finished, (record, item["read_at"]))
+
+        self._put(self._finished, _END)
+
+    # append every finished reply to the output file as soon as it arrives
+    def _write(self, output_path):
+        latencies = []
+        workers_left = self.concurrency
+        with open(output_path, "a", encoding="utf-8") as output_file:
+            while workers_left:
+                finished = self._get(self._finished)
+                if finished is _END:
+                    workers_left -= 1
+                    continue
+
+                record, read_at = finished
+                record["seconds"] = round(time.perf_counter() - read_at, 4)
+                output_file.write(json.dumps(record) + "\n")
+                output_file.flush()
+
+                latencies.append(record["seconds"])
+                self.stats["comments"] += 1
+                self.stats["errors" if "error" in record else "replies"] += 1
+                self.stats["cached"] += record["cached"]
+        return latencies
+
+    # draft a reply for every comment, appending them to output_path, and return the stats of the run
+    def run(self, comments, output_path):
+        # bounded so retrieval only runs about a batch ahead of generation (read-ahead comments wait, adding to their latency)
+        self._retrieved = queue.Queue(maxsize=self.concurrency)
+        self._finished = queue.Queue()
+        self._stop = threading.Event()
+        self._errors = []
+        self._stats_lock = threading.Lock()
+        self.stats = {"comments": 0, "replies": 0, "errors": 0, "cached": 0, "seconds": 0.0, "comments_per_second": 0.0,
+                      "p50_seconds": None, "p95_seconds": None, "stage_seconds": {"retrieve": 0.0, "generate": 0.0}}
+
+        stages = [threading.Thread(target=self._runStage, args=(lambda: self._retrieveStage(comments),))]
+        stages += [threading.Thread(target=self._runStage, args=(self._generateStage,)) for _ in range(self.concurrency)]
+
+        start = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        try:
+            latencies = self._write(output_path)
+        except BaseException:
+            # writing failed, stop the other stages
+            self._stop.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+
+        self.stats["seconds"] = time.perf_counter() - start
+        self.stats["comments_per_second"] = self.stats["comments"] / max(self.stats["seconds"], 1e-9)
+        if latencies:
+            self.stats["p50_seconds"], self.stats["p95_seconds"] = np.percentile(latencies, [50, 95]).tolist()
+
+        if self._errors:
+            raise self._errors[0]
+
+        return self.stats
+
+    # print the stats of the last run
+    def report(self):
+        print(f"drafted {self.stats['replies']} replies for {self.stats['comments']} comments ({self.stats['errors']} failed, "
+              f"{self.stats['cached']} cached) in {self.stats['seconds']:.2f}s ({self.stats['comments_per_second']:.2f} comments/s)")
+        if self.stats["p50_seconds"] is not None:
+            print(f"seconds per comment: p50 {self.stats['p50_seconds']:.2f}, p95 {self.stats['p95_seconds']:.2f}")
+        print("busy seconds per stage: " + ", ".join(f"{name} {seconds:.2f}" for name, seconds in self.stats["stage_seconds"].items()))
+
+
+# draft replies for a queue of comments
+# options == passed to BatchReplyRunner (retrieval_batch_size, concurrency, timeout, ...)
+def runBatchReplies(comments, output_path, **options):
+    runner = BatchReplyRunner(**options)
+    return runner.run(comments, output_path)
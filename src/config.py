@@ -1,28 +1,101 @@
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
-import chromadb
-from sentence_transformers import SentenceTransformer
+from resource_usage import getCurrentRSS, formatBytes
 
 """
 Configuration Script
 
-This script sets up the environment and core components required for collecting 
-and embedding YouTube comments in a local Chroma vector database. It performs the 
+This script sets up the environment and core components required for collecting
+and embedding YouTube comments in a local Chroma vector database. It performs the
 following tasks:
 
-1. Loads environment variables from a .env file to access API credentials.
-2. Initializes a YouTube Data API client using the `googleapiclient` library.
-3. Loads a lightweight sentence embedding model (`all-MiniLM-L6-v2`) from Hugging Face 
-   via the `sentence-transformers` library to convert text into embeddings.
-4. Creates or retrieves a persistent Chroma database collection to store comment 
-   embeddings for later retrieval and semantic search.
+1. Loads environment variables from a .env file to access API credentials
+   (`YOUTUBE_API_KEY`, and optionally `YOUTUBE_API_ENDPOINT` to use a local stand-in API
+   and `YOUTUBE_CACHE_MODE` / `YOUTUBE_CACHE_PATH` / `YOUTUBE_CACHE_TTL_SECONDS` to
+   record or replay API responses).
+2. Registers a factory for each core component with a lazy component registry:
+    * `youtube` - a YouTube Data API client built with the `googleapiclient` library.
+    * `embedding_model` - a lightweight sentence embedding model (`all-MiniLM-L6-v2`)
+      from Hugging Face, loaded via the `sentence-transformers` library.
+    * `database` - a persistent Chroma client.
+    * `collection` - the Chroma collection that stores comment embeddings for later
+      retrieval and semantic search. Its HNSW index is created with the cosine space by
+      default; `HNSW_SPACE`, `HNSW_M`, `HNSW_CONSTRUCTION_EF` and `HNSW_SEARCH_EF` change
+      its settings (see benchmarks/hnsw_tuning_benchmark.py to pick them). An existing
+      collection keeps the space it was built with (the shipped one is l2), and opening
+      it with different settings warns.
+    * `response_cache` - an on-disk cache of raw YouTube API responses.
+    * `batch_encoder` - a length-bucketed, optionally multi-process encoder built on
+      `embedding_model` (see batch_encoder.py), configured with `EMBEDDING_WORKERS`.
+    * `embedding_cache` - a persistent cache of embeddings in front of `batch_encoder`
+      (see embedding_cache.py), configured with `EMBEDDING_CACHE_PATH` and
+      `EMBEDDING_CACHE_DTYPE`.
+    * `vector_store` - the store that upload and search go through (see vector_store.py),
+      either the Chroma `collection` or a memory-mapped exact-search store, picked with
+      `VECTOR_STORE` (chroma or memmap) and `VECTOR_STORE_PATH`. The memmap store can
+      keep compact embeddings with `VECTOR_STORE_ENCODING` (float32, float16, int8 or pq)
+      and rescore its best candidates at full precision with `VECTOR_STORE_RERANK`.
+      With `VECTOR_STORE_SHARD_KEY` (e.g. channel_id) the rows are split into one
+      collection (or memmap folder) per value of that metadata key, and searches are
+      fanned out over the shards on `VECTOR_STORE_SHARD_WORKERS` threads.
+    * `lexical_index` - a BM25 inverted index over the stored comments (see
+      lexical_index.py), updated by every upload unless `LEXICAL_INDEX=off`, stored at
+      `LEXICAL_INDEX_PATH`.
+    The streaming ingest pipeline keeps its near-duplicate index at
+    `NEAR_DUPLICATE_INDEX_PATH` (see ingest_pipeline.py). Every write to the stores
+    bumps the version file at `STORE_VERSION_PATH`, which searches check to notice
+    writes made by other processes (see store_version.py).
+    * `retrieval_cache` - an in-memory cache of recent search results (see
+      retrieval_cache.py), configured with `RETRIEVAL_CACHE_SIZE`,
+      `RETRIEVAL_CACHE_TTL_SECONDS` and `RETRIEVAL_CACHE_SIMILARITY`.
+    * `llm_client` - an Ollama client used to generate replies (see llm_interface.py).
+      `OLLAMA_HOST` points it at another server (e.g. a local fake one for benchmarks),
+      `LLM_MODEL` picks the model (default llama3:8B), `LLM_NUM_CTX` its context window
+      and `LLM_KEEP_ALIVE` how long Ollama keeps it loaded between calls.
+    * `prompt_builder` - fits the retrieved examples into a token budget (see
+      prompt_builder.py), configured with `PROMPT_TOKEN_BUDGET` and `PROMPT_MAX_TEXT_TOKENS`
+      ("none" turns a limit off).
+    * `generation_cache` - a persistent SQLite cache of generated replies (see
+      generation_cache.py), configured with `GENERATION_CACHE_PATH`,
+      `GENERATION_CACHE_SIZE` and `GENERATION_CACHE_TTL_SECONDS`.
+
+Nothing heavy is built at import time. Each component is built the first time it is
+accessed (e.g. `config.collection`), so a query-only process never builds the YouTube
+client and a scrape-only process never loads torch or the embedding model.
+
+Per-stage timing spans and counters (API calls and quota units, rows cleaned, sentences
+encoded, query latency, prompt / reply tokens and time to first token) are recorded by
+instrumentation.py when `INSTRUMENTATION=on`, with JSON log lines written to
+`INSTRUMENTATION_LOG` and Prometheus text served at the reply service's /metrics.
+
+Registry:
+----------
+registry.get(name) -> object
+    - Returns the component, building it on first access.
+registry.warm(*names) -> None
+    - Builds the given components (all of them if no names are given) ahead of time.
+registry.teardown(*names) -> None
+    - Drops the given components (all of them if no names are given) so they are
+      rebuilt on next access.
+registry.override(name, instance) -> None
+    - Swaps a component for a stand-in (e.g. a fake client or a small model).
+registry.stats() -> dict
+    - Returns the load time and memory footprint of every component built so far.
+registry.report() -> None
+    - Prints the load time and memory footprint of every component built so far.
+
+The registry is shared by every module (scraper, upload, search), so the embedding
+model and the Chroma client are loaded once per process and can safely be requested
+from several threads at the same time.
 
 Dependencies:
 - python-dotenv
 - google-api-python-client
 - chromadb
 - sentence-transformers
+- ollama
 
 Artifacts:
 - A persistent Chroma database located at ./youtube_comment_database
@@ -33,15 +106,316 @@ Artifacts:
 # load env file
 load_dotenv()
 
+# settings shared by the components below
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3:8B")
+# context window in tokens (unset keeps ollama's default), it must fit the prompt budget and the reply
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX")) if os.getenv("LLM_NUM_CTX") else None
+# how long ollama keeps the model (and the kv cache of the last prompt) loaded after a call
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+DATABASE_PATH = "./youtube_comment_database"
+COLLECTION_NAME = "youtube_comments"
+RESPONSE_CACHE_PATH = os.getenv("YOUTUBE_CACHE_PATH", "./api_cache")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index")
+NEAR_DUPLICATE_INDEX_PATH = os.getenv("NEAR_DUPLICATE_INDEX_PATH", "./near_duplicate_index")
+STORE_VERSION_PATH = os.getenv("STORE_VERSION_PATH", "./store_version")
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "./generation_cache")
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX", "on") != "off"
+
+
+# registry that builds each component the first time it is asked for
+# it is shared by every module in the process, so each component is only ever built once
+class ComponentRegistry:
+
+    def __init__(self):
+        # name -> function that builds the component
+        self._factories = {}
+        # name -> built (or overridden) component
+        self._instances = {}
+        # name -> lock held while that component is being built
+        # one lock per component so loading the embedding model does not block the youtube client
+        self._locks = {}
+        # name -> {"load_seconds": ..., "rss_bytes": ..., "parameter_bytes": ...}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    # register the function used to build a component
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+            self._instances.pop(name, None)
+            self._stats.pop(name, None)
+
+    # return a component, building it if this is the first access
+    # safe to call from several threads at once, only one of them builds the component
+    def get(self, name):
+        if name not in self._factories:
+            raise KeyError(f"Unknown component: {name}")
+
+        # fast path, no locking once the component exists
+        instance = self._instances.get(name, _MISSING)
+        if instance is not _MISSING:
+            return instance
+
+        with self._locks[name]:
+            # another thread may have built it while we were waiting on the lock
+            instance = self._instances.get(name, _MISSING)
+            if instance is _MISSING:
+                rss_before = getCurrentRSS()
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self._stats[name] = {
+                    "load_seconds": time.perf_counter() - start,
+                    "rss_bytes": max(getCurrentRSS() - rss_before, 0),
+                    "parameter_bytes": _parameterBytes(instance),
+                }
+                self._instances[name] = instance
+            return instance
+
+    # check if a component has already been built
+    def isLoaded(self, name):
+        return name in self._instances
+
+    # build components ahead of time (all of them if no names are given)
+    def warm(self, *names):
+        for name in names or list(self._factories):
+            self.get(name)
+
+    # drop built components so they are rebuilt on next access (all of them if no names are given)
+    def teardown(self, *names):
+        with self._lock:
+            for name in names or list(self._instances):
+                self._instances.pop(name, None)
+                self._stats.pop(name, None)
+
+    # swap a component for a stand-in
+    def override(self, name, instance):
+        if name not in self._factories:
+            raise KeyError(f"Unknown component: {name}")
+
+        with self._lock:
+            self._instances[name] = instance
+            self._stats.pop(name, None)
+
+    # load time and memory footprint of every component built so far
+    def stats(self):
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    # print the load time and memory footprint of every component built so far
+    def report(self):
+        for name, stats in self.stats().items():
+            line = f"{name}: loaded in {stats['load_seconds']:.2f}s, +{formatBytes(stats['rss_bytes'])} RSS"
+            if stats["parameter_bytes"]:
+                line += f", {formatBytes(stats['parameter_bytes'])} of weights"
+            print(line)
+
+
+# sentinel so a component that legitimately builds to None is still cached
+_MISSING = object()
+
+
+# size of the weights of a torch model (0 for anything that is not a model)
+def _parameterBytes(instance):
+    parameters = getattr(instance, "parameters", None)
+    if not callable(parameters):
+        return 0
+    try:
+        return sum(p.numel() * p.element_size() for p in parameters())
+    except (TypeError, AttributeError):
+        return 0
+
+
 # initialize youtube client
-youtube = build("youtube", "v3", developerKey=os.getenv("YOUTUBE_API_KEY"))
+# YOUTUBE_API_ENDPOINT can point the client at a local stand-in server (e.g. for benchmarks)
+def _buildYouTubeClient():
+    from googleapiclient.discovery import build
+
+    client_options = {"api_endpoint": os.getenv("YOUTUBE_API_ENDPOINT")} if os.getenv("YOUTUBE_API_ENDPOINT") else None
+    return build("youtube", "v3", developerKey=os.getenv("YOUTUBE_API_KEY"), client_options=client_options)
+
 
 # import sentence embedder from huggingface
 # using all-MiniLM-L6-v2 since llama2:7B doesn't have an encoder and this one is light enough for me to run
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+def _buildEmbeddingModel():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
 
 # initialize an instance of the database
 # persist ensures that the database is saved to the computer so I can reference it in other scripts
-database = chromadb.PersistentClient(path="./youtube_comment_database")
+def _buildDatabase():
+    import chromadb
+
+    return chromadb.PersistentClient(path=DATABASE_PATH)
+
+
+# on-disk cache of raw youtube api responses
+# YOUTUBE_CACHE_MODE == off (default), record or replay, see response_cache.py
+def _buildResponseCache():
+    from response_cache import ResponseCache
+
+    ttl = os.getenv("YOUTUBE_CACHE_TTL_SECONDS")
+    return ResponseCache(path=RESPONSE_CACHE_PATH, mode=os.getenv("YOUTUBE_CACHE_MODE", "off"),
+                         ttl_seconds=float(ttl) if ttl else 86400)
+
+
+# length-bucketed batch encoder used for everything that is not in the embedding cache
+# EMBEDDING_WORKERS == worker processes for large batches, each with its own model replica (default 0, encode in-process)
+def _buildBatchEncoder():
+    from batch_encoder import BatchEncoder
+
+    return BatchEncoder(EMBEDDING_MODEL_NAME, workers=int(os.getenv("EMBEDDING_WORKERS", "0")))
+
+
+# persistent cache in front of the embedding model, the model is only loaded when a text is not cached yet
+# EMBEDDING_CACHE_DTYPE == float32 (default) or float16
+def _buildEmbeddingCache():
+    from embedding_cache import EmbeddingCache
+
+    return EmbeddingCache(lambda texts, **options: registry.get("batch_encoder").encode(texts, **options),
+                          EMBEDDING_MODEL_NAME, path=EMBEDDING_CACHE_PATH, dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float32"))
+
+
+# bm25 index over the stored comments, used by lexical and hybrid search (needs no embedding model)
+def _buildLexicalIndex():
+    from lexical_index import LexicalIndex
+
+    return LexicalIndex(path=LEXICAL_INDEX_PATH)
+
+
+# in-memory cache of recent semantic search results, invalidated whenever the collection is written to
+# RETRIEVAL_CACHE_SIZE == max cached results (default 10000, 0 disables the cache)
+# RETRIEVAL_CACHE_SIMILARITY == min cosine similarity to reuse the result of a different prompt (default 0.97)
+def _buildRetrievalCache():
+    from retrieval_cache import RetrievalCache
+
+    ttl = os.getenv("RETRIEVAL_CACHE_TTL_SECONDS")
+    return RetrievalCache(max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "10000")), ttl_seconds=float(ttl) if ttl else 3600,
+                          similarity_threshold=float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.97")))
+
+
+# client for the local ollama server that generates replies
+# the client reads OLLAMA_HOST itself (default http://127.0.0.1:11434)
+def _buildLLMClient():
+    import ollama
+
+    return ollama.Client()
+
+
+# prompt assembly within a token budget
+# PROMPT_TOKEN_BUDGET == max tokens of a whole prompt (default 1536)
+# PROMPT_MAX_TEXT_TOKENS == max tokens of each example comment and reply (default 160)
+def _buildPromptBuilder():
+    from prompt_builder import PromptBuilder
+
+    def limit(name, default):
+        value = os.getenv(name, str(default))
+        return None if value.lower() == "none" else int(value)
+
+    return PromptBuilder(token_budget=limit("PROMPT_TOKEN_BUDGET", 1536), max_text_tokens=limit("PROMPT_MAX_TEXT_TOKENS", 160))
+
+
+# persistent cache of generated replies
+# GENERATION_CACHE_SIZE == max cached replies (default 10000, 0 disables the cache)
+# GENERATION_CACHE_TTL_SECONDS == how long a reply is reused (default 7 days)
+def _buildGenerationCache():
+    from generation_cache import GenerationCache
+
+    ttl = os.getenv("GENERATION_CACHE_TTL_SECONDS")
+    return GenerationCache(path=GENERATION_CACHE_PATH, max_entries=int(os.getenv("GENERATION_CACHE_SIZE", "10000")),
+                           ttl_seconds=float(ttl) if ttl else 604800)
+
+
+# read an optional integer setting from the environment
+def _intSetting(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
 # create a collection (group of documents and their embeddings)
-collection = database.get_or_create_collection(name="youtube_comments")
+# a new hnsw index uses cosine distance, HNSW_* settings left unset keep chroma's defaults
+# a collection created before keeps its space, M and construction ef (a warning says when they differ),
+# only HNSW_SEARCH_EF applies to it (from the next start)
+def _buildCollection():
+    from vector_store import getOrCreateChromaCollection
+
+    return getOrCreateChromaCollection(registry.get("database"), COLLECTION_NAME, space=os.getenv("HNSW_SPACE", "cosine"),
+                                       M=_intSetting("HNSW_M"), construction_ef=_intSetting("HNSW_CONSTRUCTION_EF"),
+                                       search_ef=_intSetting("HNSW_SEARCH_EF"))
+
+
+# store used by upload and search
+# VECTOR_STORE == chroma (default, the collection above) or memmap (search over a memory-mapped matrix)
+# VECTOR_STORE_ENCODING == float32 (default, exact), float16, int8 or pq, only used when a memmap store is created
+# VECTOR_STORE_RERANK == candidates per query rescored with the float32 vectors (default 0, off)
+# VECTOR_STORE_SHARD_KEY == metadata key to shard by, e.g. channel_id or video_id (default unset, one collection)
+# VECTOR_STORE_SHARD_WORKERS == shards searched in parallel (default 8)
+def _buildVectorStore():
+    from vector_store import (ChromaVectorStore, MemmapVectorStore, ShardedVectorStore, chromaShards, getOrCreateChromaCollection,
+                              memmapShardPath, memmapShards, shardCollectionName)
+
+    backend = os.getenv("VECTOR_STORE", "chroma")
+    if backend not in ("chroma", "memmap"):
+        raise ValueError(f"Unknown vector store {backend!r}, expected chroma or memmap")
+
+    def openMemmap(path):
+        return MemmapVectorStore(path=path, encoding=os.getenv("VECTOR_STORE_ENCODING", "float32"),
+                                 rerank=int(os.getenv("VECTOR_STORE_RERANK", "0")))
+
+    shard_key = os.getenv("VECTOR_STORE_SHARD_KEY")
+    if not shard_key:
+        return ChromaVectorStore(registry.get("collection")) if backend == "chroma" else openMemmap(VECTOR_STORE_PATH)
+
+    # every shard is a collection (or memmap folder) of its own with the same settings
+    if backend == "chroma":
+        client = registry.get("database")
+
+        def listShards():
+            return chromaShards(client, COLLECTION_NAME)
+
+        def openShard(shard):
+            collection = getOrCreateChromaCollection(client, shardCollectionName(COLLECTION_NAME, shard),
+                                                     space=os.getenv("HNSW_SPACE", "cosine"), M=_intSetting("HNSW_M"),
+                                                     construction_ef=_intSetting("HNSW_CONSTRUCTION_EF"),
+                                                     search_ef=_intSetting("HNSW_SEARCH_EF"),
+                                                     metadata={"shard_of": COLLECTION_NAME, "shard": shard})
+            return ChromaVectorStore(collection)
+    else:
+        def listShards():
+            return memmapShards(VECTOR_STORE_PATH)
+
+        def openShard(shard):
+            return openMemmap(memmapShardPath(VECTOR_STORE_PATH, shard))
+
+    return ShardedVectorStore(openShard, shard_key, shards=listShards(), list_shards=listShards,
+                              max_workers=int(os.getenv("VECTOR_STORE_SHARD_WORKERS", "8")))
+
+
+registry = ComponentRegistry()
+registry.register("youtube", _buildYouTubeClient)
+registry.register("embedding_model", _buildEmbeddingModel)
+registry.register("database", _buildDatabase)
+registry.register("collection", _buildCollection)
+registry.register("vector_store", _buildVectorStore)
+registry.register("response_cache", _buildResponseCache)
+registry.register("batch_encoder", _buildBatchEncoder)
+registry.register("embedding_cache", _buildEmbeddingCache)
+registry.register("lexical_index", _buildLexicalIndex)
+registry.register("retrieval_cache", _buildRetrievalCache)
+registry.register("llm_client", _buildLLMClient)
+registry.register("prompt_builder", _buildPromptBuilder)
+registry.register("generation_cache", _buildGenerationCache)
+
+
+# module level access (config.youtube, config.collection, ...) goes through the registry
+def __getattr__(name):
+    if name in registry:
+        return registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,8 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import instrumentation
+from near_duplicates import collapseNearDuplicates
 
 """
 Data Cleaning Script
@@ -8,9 +12,9 @@ retrieved from the YouTube Data API. It converts raw JSON-style output (a list o
 dictionaries) into a clean, structured pandas DataFrame suitable for downstream 
 embedding and analysis.
 
-Function:
+Functions:
 ----------
-cleanData(output: list[dict]) -> pandas.DataFrame
+cleanData(output: list[dict], workers: int = 0, near_duplicate_threshold: float | None = 0.9) -> pandas.DataFrame
     - Converts the input list of dictionaries into a DataFrame.
     - Removes duplicate entries.
     - Cleans the 'comment' and 'reply' text fields by:
@@ -18,6 +22,18 @@ cleanData(output: list[dict]) -> pandas.DataFrame
         * Stripping HTML tags
         * Removing special characters and punctuation
         * Removing emojis and other non-standard Unicode characters
+    - Both columns are cleaned in a single pass with rules compiled once, optionally in
+      parallel chunks across `workers` processes.
+    - After cleaning, collapses near-duplicate comments (MinHash LSH, see
+      near_duplicates.py) to the first row of each cluster. How much this shrank the
+      data is recorded in `df.attrs["near_duplicates"]`.
+
+normalizeText(text: str) -> str
+    - Applies the cleaning rules to one string.
+
+normalizeTexts(texts: list[str], workers: int = 0) -> list[str]
+    - Applies the cleaning rules to a list of strings, in parallel chunks when
+      `workers` > 0 and the list is large enough to be worth it.
 
 Returns:
 --------
@@ -26,31 +42,91 @@ A cleaned pandas DataFrame containing processed 'comment' and 'reply' text colum
 Dependencies:
 -------------
 - pandas
+- numpy
+- src.near_duplicates
+- src.instrumentation (rows in and out, when enabled)
 """
 
 
+# cleaning rules, compiled once
+# in order: remove links, html tags, then special characters / punctuation and emojis
+_LINK_PATTERN = re.compile(r"http\S+|www\S+|https\S+")
+_HTML_TAG_PATTERN = re.compile(r"<.*?>")
+_SPECIAL_CHARACTER_PATTERN = re.compile(r"[^\w\s]")
+_EMOJI_PATTERN = re.compile(r"[\U00010000-\U0010ffff]")
+# ascii characters removed by _SPECIAL_CHARACTER_PATTERN, so pure ascii text can skip the regex engine
+_ASCII_SPECIAL_CHARACTERS = bytes(c for c in range(128) if not (chr(c).isalnum() or chr(c) == "_" or chr(c).isspace()))
+
+# default similarity (estimated Jaccard of character shingles) for two comments to count as near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+# below this many texts a process pool costs more than it saves
+_MIN_TEXTS_PER_WORKER = 20000
+
+
+# clean one string: remove links, html tags, special characters and punctuation, emojis
+def normalizeText(text):
+    # skip the patterns that cannot match, most comments have no links or tags
+    if "http" in text or "www" in text:
+        text = _LINK_PATTERN.sub("", text)
+    if "<" in text:
+        text = _HTML_TAG_PATTERN.sub("", text)
+
+    # removing special characters and removing emojis both delete single characters regardless of what is around them
+    # ascii text has no emojis and its special characters can be deleted with a byte translation table
+    if text.isascii():
+        return text.encode("ascii").translate(None, _ASCII_SPECIAL_CHARACTERS).decode("ascii")
+
+    text = _SPECIAL_CHARACTER_PATTERN.sub("", text)
+    return text if text.isascii() else _EMOJI_PATTERN.sub("", text)
+
+
+def _normalizeChunk(texts):
+    return [normalizeText(text) for text in texts]
+
+
+# clean a list of strings, in parallel chunks when workers > 0
+def normalizeTexts(texts, workers=0):
+    if not workers or len(texts) < 2 * _MIN_TEXTS_PER_WORKER:
+        return _normalizeChunk(texts)
+
+    chunk_size = max(len(texts) // workers, _MIN_TEXTS_PER_WORKER)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [text for chunk in pool.map(_normalizeChunk, chunks) for text in chunk]
+
+
 # function for data cleaning
 # accepts the output of the fetchYouTubeComments function
+# workers == processes used to clean the text (0 cleans in this process)
+# near_duplicate_threshold == similarity above which cleaned comments count as near-duplicates (None keeps them all)
+
+def cleanData(output, workers=0, near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD):
+
+    with instrumentation.span("clean") as span:
+
+        # convert list of dictionaries to dataframe
+        output = pd.DataFrame(output)
+        rows_in = len(output)
 
-def cleanData(output):
+        # drop any duplicate entries we have
+        output.drop_duplicates(inplace=True)
 
-    # convert list of dictionaries to dataframe
-    output = pd.DataFrame(output)
+        # clean both columns in one pass, every string goes through the compiled rules once
+        comments = output['comment'].astype(str)
+        replies = output['reply'].astype(str)
+        cleaned = normalizeTexts(comments.to_list() + replies.to_list(), workers=workers)
 
-    # drop any duplicate entries we have
-    output.drop_duplicates(inplace=True)
+        output['comment'] = pd.Series(cleaned[:len(comments)], index=output.index, dtype=comments.dtype)
+        output['reply'] = pd.Series(cleaned[len(comments):], index=output.index, dtype=replies.dtype)
 
-    # in order: remove links, html tags, special characters and punctuation, emojis
-    output['comment'] = output['comment'].astype(str) \
-        .str.replace(r"http\S+|www\S+|https\S+", "", regex=True) \
-        .str.replace(r"<.*?>", "", regex=True) \
-        .str.replace(r"[^\w\s]", "", regex=True) \
-        .str.replace(r"[\U00010000-\U0010ffff]", "", regex=True)
+        # collapse copy-pasted spam, "first" variants and lightly edited reposts down to one row each
+        # done after cleaning so differences in punctuation, links and emojis don't hide the duplicates
+        if near_duplicate_threshold is not None and len(output):
+            output, near_duplicate_stats = collapseNearDuplicates(output, column='comment', threshold=near_duplicate_threshold)
+            output.attrs['near_duplicates'] = near_duplicate_stats
 
-    output['reply'] = output['reply'].astype(str) \
-        .str.replace(r"http\S+|www\S+|https\S+", "", regex=True) \
-        .str.replace(r"<.*?>", "", regex=True) \
-        .str.replace(r"[^\w\s]", "", regex=True) \
-        .str.replace(r"[\U00010000-\U0010ffff]", "", regex=True)
-    
-    return output
\ No newline at end of file
+        instrumentation.count("clean_rows_in_total", rows_in)
+        instrumentation.count("clean_rows_out_total", len(output))
+        span.set(rows_in=rows_in, rows_out=len(output))
+        return output
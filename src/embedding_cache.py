@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+import instrumentation
+
+"""
+Embedding Cache
+
+This module keeps a persistent cache of sentence embeddings so the same text is never
+encoded twice, whether it shows up again in a later ingest, as a duplicate left after
+cleaning, or in an experiment with a different Chroma collection.
+
+Each entry is keyed by a hash of the normalized text (Unicode NFC, surrounding and
+repeated whitespace collapsed). Every model gets its own folder, so embeddings from
+different models never mix. Vectors are appended to a flat float32 or float16 file
+that is read back through a memory map, and a tab-separated index file maps each text
+hash to its row.
+
+Class:
+-------
+EmbeddingCache(encode_function, model_name: str, path: str = "./embedding_cache", dtype: str = "float32")
+    - encode(texts, cache=True) -> numpy.ndarray
+        Drop-in replacement for `SentenceTransformer.encode`. Looks every text up in one
+        batch, encodes only the misses (each distinct text once) with `encode_function`,
+        stores them, and returns float32 embeddings in the order of `texts`. A single
+        string returns a single vector. With cache=False the misses are returned without
+        being stored, for one-off texts such as search prompts that would otherwise grow
+        the cache without bound.
+    - stats -> dict with hits, misses and hit_rate
+    - count() -> int
+
+Artifacts:
+-----------
+- <path>/<model name>/meta.json    dimension and dtype of the stored vectors
+- <path>/<model name>/vectors.bin  raw vectors, one row per cached text
+- <path>/<model name>/index.tsv    "<text hash>\t<row>" per cached text
+
+Notes:
+-------
+- The cache is safe to use from several threads in one process, but only one process
+  should write to a given cache folder at a time. `encode_function` is called without
+  holding the cache's lock, so it must be safe to call from several threads.
+- Vectors left without an index line by a crash are truncated away when the cache is
+  opened, and malformed index lines are skipped.
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+# normalize a text before hashing so trivially different copies share an entry
+def normalizeText(text):
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def textHash(text):
+    return hashlib.sha1(normalizeText(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+
+    # encode_function == function that embeds a list of texts (e.g. SentenceTransformer.encode)
+    # model_name == name of the model behind encode_function, each model gets its own folder
+    # dtype == "float32" or "float16" (half the disk and memory, small loss of precision)
+    def __init__(self, encode_function, model_name, path="./embedding_cache", dtype="float32"):
+        self.encode_function = encode_function
+        self.model_name = model_name
+        self.folder = os.path.join(path, re.sub(r"[^\w.-]", "_", model_name))
+        self.dtype = np.dtype(dtype)
+        self.dimension = None
+        self.stats = {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
+        # text hash -> row in vectors.bin
+        self._index = {}
+        # rows in vectors.bin, new vectors are appended after them
+        self._rows = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.folder, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _load(self):
+        if os.path.exists(self._path("meta.json")):
+            with open(self._path("meta.json")) as meta_file:
+                meta = json.load(meta_file)
+            self.dimension = meta["dimension"]
+            # an existing cache keeps the dtype it was created with
+            self.dtype = np.dtype(meta["dtype"])
+
+        if self.dimension is None or not os.path.exists(self._path("vectors.bin")):
+            return
+        row_bytes = self.dimension * self.dtype.itemsize
+        rows = os.path.getsize(self._path("vectors.bin")) // row_bytes
+
+        # rows are written before their index line, so every indexed row is complete
+        # (a line cut short by a crash is skipped, and so is a row past the end of vectors.bin)
+        if os.path.exists(self._path("index.tsv")):
+            with open(self._path("index.tsv"), encoding="utf-8") as index_file:
+                for line in index_file:
+                    key, _, row = line.rstrip("\n").partition("\t")
+                    if len(key) == 40 and row.isdigit() and int(row) < rows:
+                        self._index[key] = int(row)
+
+        # vectors appended by a process that died before writing their index lines are dropped
+        self._rows = max(self._index.values(), default=-1) + 1
+        os.truncate(self._path("vectors.bin"), self._rows * row_bytes)
+
+    # memory map of the stored vectors, reopened after new rows are appended
+    def _matrix(self):
+        if self._vectors is None and self._index:
+            self._vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r", shape=(self._rows, self.dimension))
+        return self._vectors
+
+    # append new vectors to the cache files
+    def _store(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            with open(self._path("meta.json"), "w") as meta_file:
+                json.dump({"model_name": self.model_name, "dimension": self.dimension, "dtype": self.dtype.name}, meta_file)
+
+        first_row = self._rows
+        with open(self._path("vectors.bin"), "ab") as vectors_file:
+            vectors_file.write(vectors.astype(self.dtype).tobytes())
+        with open(self._path("index.tsv"), "a", encoding="utf-8") as index_file:
+            index_file.writelines(f"{key}\t{first_row + i}\n" for i, key in enumerate(keys))
+
+        for i, key in enumerate(keys):
+            self._index[key] = first_row + i
+        self._rows += len(keys)
+        self._vectors = None
+
+    # embed texts, only encoding the ones that are not cached yet
+    # cache == store the newly encoded texts (False still reads texts that are cached already)
+    def encode(self, texts, cache=True, **encode_options):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        keys = [textHash(text) for text in texts]
+
+        # each distinct missing text is encoded once, even if it appears several times
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._index and key not in missing:
+                    missing[key] = text
+
+        # the model runs outside the lock, so other threads can look up and encode meanwhile
+        if missing:
+            with instrumentation.span("embed"):
+                vectors = self.encode_function(list(missing.values()), **encode_options)
+
+        with self._lock:
+            if missing and cache:
+                # another thread may have stored some of the same texts while these were encoded
+                new = [i for i, key in enumerate(missing) if key not in self._index]
+                if new:
+                    missing_keys = list(missing)
+                    self._store([missing_keys[i] for i in new], np.asarray(vectors)[new])
+            instrumentation.count("embedding_texts_total", len(texts))
+            instrumentation.count("sentences_encoded_total", len(missing))
+
+            self.stats["misses"] += len(missing)
+            self.stats["hits"] += len(texts) - len(missing)
+            self.stats["hit_rate"] = self.stats["hits"] / max(self.stats["hits"] + self.stats["misses"], 1)
+
+            if not texts:
+                return np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+            if cache or not missing:
+                embeddings = np.asarray(self._matrix()[[self._index[key] for key in keys]], dtype=np.float32)
+            else:
+                # the texts encoded just now are returned as they are, the others come from the cache
+                vectors = np.asarray(vectors, dtype=np.float32)
+                positions = {key: i for i, key in enumerate(missing)}
+                embeddings = vectors[[positions.get(key, 0) for key in keys]]
+                cached = [i for i, key in enumerate(keys) if key not in positions]
+                if cached:
+                    embeddings[cached] = self._matrix()[[self._index[keys[i]] for i in cached]]
+
+        return embeddings[0] if single else embeddings
+
+    # number of cached texts
+    def count(self):
+        return len(self._index)
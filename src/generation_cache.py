@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""
+Generation Cache
+
+This module keeps the replies generated by the LLM in a small SQLite database so a
+comment that is asked again, and retrieves the same comment–reply pairs, gets its
+reply back instantly instead of after seconds of inference.
+
+Each reply is keyed by a hash of everything that decides it: the user's comment, the
+ids of the retrieved pairs (in rank order), the model name and the generation options
+sent to Ollama. The pair ids are content hashes of each comment and its replies (for
+a pair with one reply, the same `content_hash` stored with the row in the vector
+store), so a pair whose text changed is a different pair.
+
+Entries are evicted least recently used first once there are `max_entries` of them,
+and expire `ttl_seconds` after they were generated.
+
+Class:
+-------
+GenerationCache(path: str = "./generation_cache", max_entries: int = 10000, ttl_seconds: float | None = 604800)
+    - lookup(key) -> str | None
+        Returns the stored reply, or None if there is none (or it expired).
+    - put(key, reply, model, generation_seconds) -> None
+        Stores a reply with the seconds it took to generate.
+    - clear() -> None
+        Drops every entry.
+    - count() -> int
+    - stats -> dict with hits, misses, hit_rate, seconds_saved (generation seconds of the
+      replies served from the cache), evictions and expirations
+
+Functions:
+----------
+pairIds(comments: list[str], replies: list[list[str]]) -> list[str]
+    - Content hash of every retrieved pair.
+generationKey(prompt: str, pair_ids: list[str], model: str, options: dict | None) -> str
+    - Cache key of a reply.
+
+Artifacts:
+-----------
+- <path>/generations.sqlite3 with one `generations` row per cached reply
+
+Notes:
+-------
+- `max_entries` = 0 disables the cache.
+- The key does not cover the prompt builder settings or instructions, `clear()` the
+  cache after changing them.
+- The cache is safe to use from several threads in one process.
+"""
+
+
+# content hash of every retrieved comment with its replies
+def pairIds(comments, replies):
+    return [hashlib.sha1("\x1f".join([comment, *pair_replies]).encode("utf-8")).hexdigest()
+            for comment, pair_replies in zip(comments, replies)]
+
+
+def generationKey(prompt, pair_ids, model, options):
+    payload = json.dumps([prompt, list(pair_ids), model, options or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+
+    # max_entries == max cached replies, the least recently used one is evicted first
+    # ttl_seconds == how long a reply stays valid after it was generated (None never expires)
+    def __init__(self, path="./generation_cache", max_entries=10000, ttl_seconds=604800):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "hit_rate": 0.0, "seconds_saved": 0.0, "evictions": 0, "expirations": 0}
+        os.makedirs(path, exist_ok=True)
+
+        # one connection shared by every thread, guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "generations.sqlite3"), check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                reply TEXT NOT NULL,
+                model TEXT,
+                generation_seconds REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used_at)")
+        self._connection.commit()
+        self._count = self._connection.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+
+    def _countLookup(self, hit, generation_seconds=0.0):
+        self.stats["hits" if hit else "misses"] += 1
+        self.stats["seconds_saved"] += generation_seconds
+        self.stats["hit_rate"] = self.stats["hits"] / (self.stats["hits"] + self.stats["misses"])
+
+    # stored reply for a key, None if there is none
+    def lookup(self, key):
+        if self.max_entries == 0:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT reply, generation_seconds, created_at FROM generations WHERE key = ?",
+                                           (key,)).fetchone()
+
+            if row is not None and self.ttl_seconds is not None and now - row[2] > self.ttl_seconds:
+                self._connection.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._connection.commit()
+                self._count -= 1
+                self.stats["expirations"] += 1
+                row = None
+
+            if row is None:
+                self._countLookup(False)
+                return None
+
+            self._connection.execute("UPDATE generations SET last_used_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self._countLookup(True, row[1])
+            return row[0]
+
+    # store a reply, evicting the least recently used ones when the cache is full
+    # generation_seconds == seconds the reply took to generate, added to seconds_saved on every hit
+    def put(self, key, reply, model, generation_seconds):
+        if self.max_entries == 0:
+            return
+
+        now = time.time()
+        with self._lock:
+            exists = self._connection.execute("SELECT 1 FROM generations WHERE key = ?", (key,)).fetchone() is not None
+            self._connection.execute("""
+                INSERT OR REPLACE INTO generations (key, reply, model, generation_seconds, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, reply, model, generation_seconds, now, now))
+            self._count += not exists
+
+            if self._count > self.max_entries:
+                evicted = self._count - self.max_entries
+                self._connection.execute("DELETE FROM generations WHERE key IN "
+                                         "(SELECT key FROM generations ORDER BY last_used_at LIMIT ?)", (evicted,))
+                self._count -= evicted
+                self.stats["evictions"] += evicted
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM generations")
+            self._connection.commit()
+            self._count = 0
+
+    # number of cached replies (expired ones included until they are looked up)
+    def count(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
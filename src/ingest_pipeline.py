@@ -0,0 +1,300 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from data_cleaning import NEAR_DUPLICATE_THRESHOLD, cleanData
+from near_duplicates import NearDuplicateIndex
+from resource_usage import getCurrentRSS, formatBytes
+from upload_vector_db import LOOKUP_BATCH_SIZE, encodeComments, findNewRows, migrateLegacyRows, writeToVectorDB
+from youtube_scraper import CommentFetchEngine
+
+"""
+Streaming Ingest Pipeline
+
+This module runs the fetch → clean → embed → upsert stages of the RAG pipeline at the
+same time instead of one after another. Pages of comment–reply pairs flow through the
+stages in fixed-size batches, so memory stays bounded by the batch and queue sizes
+instead of growing with the whole corpus, and the CPU keeps cleaning and embedding
+while the scraper waits on the network.
+
+Stages:
+--------
+1. fetch  - `CommentFetchEngine` threads stream pages into a bounded queue.
+2. clean  - pairs are grouped into batches of `batch_size` and cleaned with `cleanData`,
+            in a process pool when `clean_workers` > 0.
+3. embed  - rows stored under legacy numeric ids are re-keyed first (see
+            `migrateLegacyRows`). Then rows already stored unchanged are dropped,
+            then near-duplicates of any comment kept so far (in this run or already
+            stored) are dropped, and the rest are encoded with the shared embedding
+            model (torch releases the GIL while encoding, so this overlaps with the
+            other stages).
+4. upsert - embedded batches are written to the shared Chroma collection.
+
+Every stage hands off through a bounded queue of `queue_size` items. When a later
+stage falls behind, the queues fill up and the earlier stages block (backpressure).
+
+Class:
+-------
+IngestPipeline(batch_size: int = 256, queue_size: int = 4, fetch_workers: int = 4, clean_workers: int = 0,
+               quota_budget: int | None = None, requests_per_second: float | None = None, state_store = None,
+               near_duplicate_threshold: float | None = 0.9)
+    - run(videos, comments_to_view=5000) -> dict
+        Runs the pipeline and returns its stats: pairs fetched and written, near-duplicates
+        removed, batches, seconds, pairs per second, peak RSS during the run and busy
+        seconds per stage.
+
+Function:
+----------
+runIngestPipeline(videos: list[str], comments_to_view: int = 5000, **options) -> dict
+    - Builds an `IngestPipeline` with the given options and runs it.
+
+Notes:
+-------
+- `cleanData` removes exact duplicates within a batch only. Rows have stable ids and are
+  upserted, so a pair that lands in two batches is only stored once, and rows that
+  are already stored unchanged are skipped before encoding.
+- Near-duplicates are not collapsed per batch (which row survived would depend on how
+  the pages happened to split into batches). The embed stage checks every new row
+  against a `NearDuplicateIndex` of the whole corpus instead, so running the same ingest
+  again writes nothing. The index is kept on disk at `config.NEAR_DUPLICATE_INDEX_PATH`
+  (env `NEAR_DUPLICATE_INDEX_PATH`) and only the buckets of each batch are read from it,
+  so memory does not grow with the corpus. The first run over an existing vector store
+  seeds it with the stored comments.
+- Rows written without the pipeline (e.g. `uploadToVectorDB`) are not added to the index,
+  and rows deleted from the store stay in it. Delete the index folder to seed it again
+  from the store.
+"""
+
+# marks the end of a stage's output
+_END = object()
+
+
+class IngestPipeline:
+
+    # batch_size == rows per clean / embed / upsert batch
+    # queue_size == max items waiting between two stages
+    # fetch_workers == videos fetched in parallel
+    # clean_workers == processes used for cleaning (0 cleans on the pipeline's own thread)
+    # near_duplicate_threshold == similarity above which a new comment counts as a near-duplicate of a kept one (None keeps them all)
+    def __init__(self, batch_size=256, queue_size=4, fetch_workers=4, clean_workers=0,
+                 quota_budget=None, requests_per_second=None, state_store=None,
+                 near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.fetch_workers = fetch_workers
+        self.clean_workers = clean_workers
+        self.quota_budget = quota_budget
+        self.requests_per_second = requests_per_second
+        self.state_store = state_store
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+    # put an item on a queue, giving up if another stage failed
+    def _put(self, stage_queue, item):
+        while not self._stop.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    # get an item from a queue, returning _END if another stage failed
+    def _get(self, stage_queue):
+        while not self._stop.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    # run a stage, stopping the whole pipeline if it fails
+    def _runStage(self, stage_function):
+        try:
+            stage_function()
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop.set()
+
+    def _busy(self, name, seconds):
+        with self._stats_lock:
+            self.stats["stage_seconds"][name] += seconds
+
+    # called from the fetch threads with every page, blocks while the clean stage is behind
+    def _onPage(self, video, pairs):
+        if self._stop.is_set():
+            raise RuntimeError("Ingest pipeline stopped")
+        if pairs:
+            self._put(self._pages, pairs)
+
+    def _fetchStage(self, videos, comments_to_view):
+        engine = CommentFetchEngine(max_workers=self.fetch_workers, quota_budget=self.quota_budget,
+                                    requests_per_second=self.requests_per_second, state_store=self.state_store,
+                                    on_page=self._onPage)
+        start = time.perf_counter()
+        engine.fetch(videos, comments_to_view=comments_to_view)
+        self._busy("fetch", time.perf_counter() - start)
+        self.stats["fetch"] = engine.stats
+        self._put(self._pages, _END)
+
+    def _cleanStage(self):
+        pool = ProcessPoolExecutor(max_workers=self.clean_workers) if self.clean_workers else None
+        in_flight = deque()
+        buffer = []
+
+        # clean a batch now, or hand it to the pool and pass on the oldest finished batch
+        def clean(batch, flush=False):
+            self.stats["pairs_fetched"] += len(batch)
+            if pool is None:
+                start = time.perf_counter()
+                df = cleanData(batch, near_duplicate_threshold=None)
+                self._busy("clean", time.perf_counter() - start)
+                self._put(self._cleaned, df)
+                return
+
+            in_flight.append(pool.submit(cleanData, batch, near_duplicate_threshold=None))
+            while in_flight and (flush or len(in_flight) > self.clean_workers):
+                start = time.perf_counter()
+                self._put(self._cleaned, in_flight.popleft().result())
+                self._busy("clean", time.perf_counter() - start)
+
+        try:
+            while True:
+                pairs = self._get(self._pages)
+                if pairs is _END:
+                    break
+
+                buffer.extend(pairs)
+                while len(buffer) >= self.batch_size:
+                    clean(buffer[:self.batch_size])
+                    buffer = buffer[self.batch_size:]
+
+            if buffer and not self._stop.is_set():
+                clean(buffer, flush=True)
+            while in_flight and not self._stop.is_set():
+                self._put(self._cleaned, in_flight.popleft().result())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self._put(self._cleaned, _END)
+
+    # persistent near-duplicate index of every comment kept so far
+    # the first run over an existing vector store seeds it with the stored comments, later runs only add their own
+    def _nearDuplicateIndex(self):
+        index = NearDuplicateIndex(threshold=self.near_duplicate_threshold, path=config.NEAR_DUPLICATE_INDEX_PATH)
+        if not len(index) and config.vector_store.count():
+            ids = config.vector_store.ids()
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                stored = config.vector_store.get(ids=ids[start:start + LOOKUP_BATCH_SIZE], include=["documents"])
+                index.add(stored["ids"], stored["documents"])
+        return index
+
+    def _embedStage(self):
+        # rows stored under the legacy numeric ids would never match the stable ids of the new rows
+        migrateLegacyRows()
+
+        near_duplicates = None
+        if self.near_duplicate_threshold is not None:
+            start = time.perf_counter()
+            near_duplicates = self._nearDuplicateIndex()
+            self._busy("embed", time.perf_counter() - start)
+
+        try:
+            while True:
+                df = self._get(self._cleaned)
+                if df is _END:
+                    break
+
+                # rows that are already stored unchanged never reach the embedding model
+                start = time.perf_counter()
+                df = findNewRows(df)
+                # neither do near-duplicates of a comment kept earlier in this run or in an earlier one
+                if near_duplicates is not None and not df.empty:
+                    keep = near_duplicates.filter(df["id"].to_list(), df["comment"].to_list())
+                    self.stats["near_duplicates_removed"] += int((~keep).sum())
+                    df = df[keep]
+                if df.empty:
+                    continue
+                encoded_comments = encodeComments(df["comment"].to_list())
+                self._busy("embed", time.perf_counter() - start)
+                self._put(self._embedded, (df, encoded_comments))
+        finally:
+            if near_duplicates is not None:
+                near_duplicates.close()
+
+        self._put(self._embedded, _END)
+
+    def _upsertStage(self):
+        while True:
+            item = self._get(self._embedded)
+            if item is _END:
+                break
+
+            df, encoded_comments = item
+            start = time.perf_counter()
+            writeToVectorDB(df, encoded_comments)
+            self._busy("upsert", time.perf_counter() - start)
+            self.stats["rows_written"] += len(df)
+            self.stats["batches"] += 1
+
+    # sample the process RSS while the pipeline runs
+    def _sampleMemory(self, done):
+        while not done.wait(0.05):
+            self.stats["peak_rss_bytes"] = max(self.stats["peak_rss_bytes"], getCurrentRSS())
+
+    # run the pipeline over a list of video ids and return its stats
+    def run(self, videos, comments_to_view=5000):
+        self._pages = queue.Queue(maxsize=self.queue_size)
+        self._cleaned = queue.Queue(maxsize=self.queue_size)
+        self._embedded = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self._stats_lock = threading.Lock()
+        self.stats = {"pairs_fetched": 0, "rows_written": 0, "near_duplicates_removed": 0, "batches": 0, "seconds": 0.0, "pairs_per_second": 0.0,
+                      "start_rss_bytes": getCurrentRSS(), "peak_rss_bytes": getCurrentRSS(),
+                      "stage_seconds": {"fetch": 0.0, "clean": 0.0, "embed": 0.0, "upsert": 0.0}}
+
+        done = threading.Event()
+        sampler = threading.Thread(target=self._sampleMemory, args=(done,), daemon=True)
+        sampler.start()
+
+        stages = [
+            threading.Thread(target=self._runStage, args=(lambda: self._fetchStage(videos, comments_to_view),)),
+            threading.Thread(target=self._runStage, args=(self._cleanStage,)),
+            threading.Thread(target=self._runStage, args=(self._embedStage,)),
+            threading.Thread(target=self._runStage, args=(self._upsertStage,)),
+        ]
+
+        start = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        self.stats["seconds"] = time.perf_counter() - start
+        self.stats["pairs_per_second"] = self.stats["rows_written"] / max(self.stats["seconds"], 1e-9)
+        done.set()
+        sampler.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        return self.stats
+
+    # print the stats of the last run
+    def report(self):
+        print(f"wrote {self.stats['rows_written']} pairs in {self.stats['batches']} batches "
+              f"in {self.stats['seconds']:.2f}s ({self.stats['pairs_per_second']:.1f} pairs/s), "
+              f"{self.stats['near_duplicates_removed']} near-duplicates removed")
+        print(f"peak RSS {formatBytes(self.stats['peak_rss_bytes'])} "
+              f"(started at {formatBytes(self.stats['start_rss_bytes'])})")
+        print("busy seconds per stage: " + ", ".join(f"{name} {seconds:.2f}" for name, seconds in self.stats["stage_seconds"].items()))
+
+
+# run the streaming pipeline over a list of video ids
+# options == passed to IngestPipeline (batch_size, queue_size, fetch_workers, clean_workers, ...)
+def runIngestPipeline(videos, comments_to_view=5000, **options):
+    pipeline = IngestPipeline(**options)
+    return pipeline.run(videos, comments_to_view=comments_to_view)
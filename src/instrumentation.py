@@ -0,0 +1,287 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Instrumentation
+
+Lightweight timing spans and counters that every stage of the pipeline reports into
+(scraper, cleaning, upload, search and the LLM), so a run can be broken down without
+attaching a profiler. Metrics are kept in memory and exported two ways:
+
+    * as structured JSON logs, one line per finished span or event (`log_path`)
+    * as Prometheus text, from `prometheusText()`, the /metrics endpoint of
+      `startMetricsServer` or the reply service's GET /metrics
+
+Instrumentation is off by default. `INSTRUMENTATION=on` turns it on when the module is
+imported and `INSTRUMENTATION_LOG` sets the JSON log file ("-" for stderr, unset for no
+log). While it is off every call returns straight away: `span` hands back one shared
+no-op context manager and `count` / `observe` / `event` only check a flag.
+
+Metrics reported by the pipeline:
+----------------------------------
+youtube_api_call_seconds, youtube_api_calls_total, youtube_api_retries_total,
+youtube_quota_units_total, youtube_pages_total, youtube_failed_videos_total
+    - Real commentThreads.list calls (cached pages only count in youtube_pages_total), and
+      videos skipped after an error that retrying can't fix.
+clean_seconds, clean_rows_in_total, clean_rows_out_total
+    - `cleanData` runs and the rows that went in and came out.
+embed_seconds, embedding_texts_total, sentences_encoded_total
+    - Embedding cache lookups and the texts that had to go through the model.
+upsert_seconds, rows_upserted_total
+    - Writes to the vector store.
+search_seconds{mode}, search_prompts_total{mode}, vector_query_seconds
+    - Query latency of semantic (single and batch), lexical and hybrid searches.
+llm_ttft_seconds, llm_generation_seconds, llm_prompt_tokens_total, llm_response_tokens_total,
+llm_replies_total{done_reason}, generation_cache_hits_total
+    - Replies streamed from Ollama and replies answered from the generation cache.
+
+Every span also records a histogram `<name>_seconds` and, if it raised, a counter
+`<name>_errors_total`.
+
+Functions:
+----------
+enable(log_path: str | None = None) -> None
+disable() -> None
+    - Turn recording on or off, `disable` also closes the JSON log (the metrics recorded
+      so far are kept).
+span(name: str, **labels) -> context manager
+    - Times the block into the `<name>_seconds` histogram. `span.set(**fields)` adds
+      fields to the span's JSON log line (e.g. rows=...).
+count(name: str, value: float = 1, **labels) -> None
+    - Adds to a counter.
+observe(name: str, seconds: float, **labels) -> None
+    - Adds one observation to a histogram of seconds.
+event(name: str, **fields) -> None
+    - Writes one JSON log line (e.g. the token counts of one reply).
+snapshot() -> dict
+    - Counters and histograms (count, sum, mean, max) keyed by name and labels.
+prometheusText() -> str
+    - Every metric in the Prometheus text exposition format, prefixed with `youtube_rag_`.
+reset() -> None
+    - Drops every metric recorded so far.
+startMetricsServer(host: str = "127.0.0.1", port: int = 9100) -> tuple[ThreadingHTTPServer, str]
+    - Serves GET /metrics (Prometheus text) and GET /metrics.json (`snapshot()`) on a
+      background thread, for batch runs that don't start the reply service.
+
+Notes:
+-------
+- Labels should have few distinct values (a mode, a done reason), never a prompt or an id.
+- The module only uses the standard library, so importing it costs nothing.
+"""
+
+PREFIX = "youtube_rag_"
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+enabled = False
+
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+# (name, labels) -> [count per bucket, count, sum, max]
+_histograms = {}
+_log_file = None
+
+
+# a span that does nothing, handed out while instrumentation is off
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+
+    __slots__ = ("name", "labels", "fields", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        seconds = time.perf_counter() - self.start
+        observe(f"{self.name}_seconds", seconds, **self.labels)
+        if error_type is not None:
+            count(f"{self.name}_errors_total", **self.labels)
+            self.fields["error"] = error_type.__name__
+        _write({"type": "span", "name": self.name, "seconds": round(seconds, 6), **self.labels, **self.fields})
+        return False
+
+    # extra fields for the span's log line
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+# turn recording on, log_path == file the JSON log lines are appended to ("-" for stderr, None for no log)
+def enable(log_path=None):
+    global enabled, _log_file
+    with _lock:
+        if _log_file is not None and _log_file is not sys.stderr:
+            _log_file.close()
+        if log_path is None:
+            _log_file = None
+        else:
+            _log_file = sys.stderr if log_path == "-" else open(log_path, "a", encoding="utf-8", buffering=1)
+        enabled = True
+
+
+# turn recording off and close the JSON log, the metrics recorded so far are kept
+def disable():
+    global enabled, _log_file
+    with _lock:
+        enabled = False
+        if _log_file is not None and _log_file is not sys.stderr:
+            _log_file.close()
+        _log_file = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def _write(record):
+    if _log_file is None:
+        return
+    line = json.dumps({"ts": round(time.time(), 6), **record}, default=str)
+    with _lock:
+        if _log_file is not None:
+            _log_file.write(line + "\n")
+
+
+# time a block into the <name>_seconds histogram
+def span(name, **labels):
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def count(name, value=1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0, 0.0, 0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += 1
+        histogram[2] += seconds
+        histogram[3] = max(histogram[3], seconds)
+
+
+# write one JSON log line
+def event(name, **fields):
+    if not enabled:
+        return
+    _write({"type": "event", "name": name, **fields})
+
+
+def _formatLabels(labels, extra=()):
+    pairs = [f'{label}="{str(value)}"' for label, value in labels + tuple(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def snapshot():
+    with _lock:
+        counters = {name + _formatLabels(labels): value for (name, labels), value in _counters.items()}
+        histograms = {name + _formatLabels(labels): {"count": histogram[1], "sum": histogram[2],
+                                                     "mean": histogram[2] / max(histogram[1], 1), "max": histogram[3]}
+                      for (name, labels), histogram in _histograms.items()}
+    return {"enabled": enabled, "counters": counters, "histograms": histograms}
+
+
+# every metric in the prometheus text exposition format
+def prometheusText():
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, [list(histogram[0])] + histogram[1:]) for key, histogram in _histograms.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_formatLabels(labels)} {value}")
+
+    for (name, labels), (bucket_counts, observations, total, _) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        # prometheus buckets are cumulative
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f"{PREFIX}{name}_bucket{_formatLabels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_formatLabels(labels, [('le', '+Inf')])} {observations}")
+        lines.append(f"{PREFIX}{name}_sum{_formatLabels(labels)} {total}")
+        lines.append(f"{PREFIX}{name}_count{_formatLabels(labels)} {observations}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheusText().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# serve /metrics on a background thread, returns the server and its base url
+def startMetricsServer(host="127.0.0.1", port=9100):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if os.getenv("INSTRUMENTATION", "off") == "on":
+    enable(log_path=os.getenv("INSTRUMENTATION_LOG"))
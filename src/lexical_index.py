@@ -0,0 +1,271 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+"""
+Lexical Index
+
+This module keeps a BM25 inverted index over the cleaned comments, next to the vector
+store. It answers keyword-heavy prompts ("K20C1", "LSD", "Canadian spec") without the
+embedding model, and its rankings can be fused with the dense ones for hybrid search
+(see semantic_search.py).
+
+The index is stored compactly: a term list, and for every term a slice of two flat
+arrays holding the documents that contain it and how often. Rows written since the
+last compaction are kept in small in-memory postings lists and in an append-only log,
+so the upload path only pays for the rows it writes. Once the log holds more than
+`compact_ratio` of the compacted rows, everything is merged into new arrays.
+
+Class:
+-------
+LexicalIndex(path: str = "./lexical_index", k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.25)
+    - upsert(ids, texts) -> None
+        Indexes texts under the given ids, replacing older versions of the same ids.
+    - delete(ids) -> None
+    - search(query, n_results=5) -> list[tuple[str, float]]
+        Ids and BM25 scores of the best matching rows, best first.
+    - compact() -> None
+        Merges the rows written since the last compaction into the compact arrays.
+    - reload() -> None
+        Reads the index from disk again, picking up rows written by another process.
+    - count() -> int
+    - memoryBytes() -> int, approximate memory held by the index
+
+Function:
+----------
+tokenize(text: str) -> list[str]
+    - Lowercased word tokens (letters, digits and underscores, so "k20c1" stays one token).
+
+Artifacts:
+-----------
+- <path>/index.npz    compacted rows: row ids, terms, term offsets, postings (document numbers
+                      and term counts) and document lengths, replaced in one step by a compaction
+- <path>/log.jsonl    rows upserted or deleted since the last compaction
+
+Notes:
+-------
+- Rows uploaded before the index existed are not in it. Remove the index folder and
+  upload again to rebuild it from scratch.
+"""
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+
+    # k1 == how quickly repeated terms stop adding to the score
+    # b == how much long comments are penalized (0 ignores length, 1 fully normalizes it)
+    # compact_ratio == rows in the log, relative to the compacted rows, that trigger a compaction
+    def __init__(self, path="./lexical_index", k1=1.2, b=0.75, compact_ratio=0.25):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        # compacted part, ids and terms are stored as newline separated utf-8 bytes
+        if os.path.exists(self._file("index.npz")):
+            with np.load(self._file("index.npz")) as arrays:
+                self._ids = arrays["ids"].tobytes().decode("utf-8").split("\n") if len(arrays["ids"]) else []
+                terms = arrays["terms"].tobytes().decode("utf-8").split("\n") if len(arrays["terms"]) else []
+                self._offsets = arrays["offsets"]
+                self._documents = arrays["documents"]
+                self._counts = arrays["counts"]
+                self._lengths = arrays["lengths"].astype(np.float32)
+        else:
+            self._ids, terms = [], []
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._documents = np.zeros(0, dtype=np.int32)
+            self._counts = np.zeros(0, dtype=np.uint16)
+            self._lengths = np.zeros(0, dtype=np.float32)
+        self._term_numbers = {term: i for i, term in enumerate(terms)}
+        self._compacted_rows = len(self._ids)
+
+        # document number of every live id, and the deleted documents of both parts
+        # _lengths has spare capacity for new rows, only the first len(self._ids) entries are used
+        self._document_numbers = {row_id: i for i, row_id in enumerate(self._ids)}
+        self._deleted = set()
+        self._total_length = float(self._lengths.sum())
+
+        # rows written since the last compaction: term -> [(document number, count), ...]
+        self._recent = {}
+        self._log_rows = 0
+        if os.path.exists(self._file("log.jsonl")):
+            with open(self._file("log.jsonl"), encoding="utf-8") as log_file:
+                for line in log_file:
+                    # a last line without its newline is still being written by another process
+                    if not line.endswith("\n"):
+                        break
+                    entry = json.loads(line)
+                    if "delete" in entry:
+                        self._delete(entry["delete"])
+                    else:
+                        self._add(entry["id"], entry["terms"])
+
+    # add one row to the in-memory postings (replacing an older version of the same id)
+    def _add(self, row_id, term_counts):
+        self._delete(row_id)
+        number = len(self._ids)
+        self._ids.append(row_id)
+        self._document_numbers[row_id] = number
+        if number == len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros(max(number, 1024), dtype=np.float32)])
+        self._lengths[number] = length = sum(term_counts.values())
+        self._total_length += length
+        for term, count in term_counts.items():
+            self._recent.setdefault(term, []).append((number, count))
+        self._log_rows += 1
+
+    def _delete(self, row_id):
+        number = self._document_numbers.pop(row_id, None)
+        if number is not None:
+            self._deleted.add(number)
+            self._total_length -= self._lengths[number]
+
+    def _appendLog(self, entries):
+        with open(self._file("log.jsonl"), "a", encoding="utf-8") as log_file:
+            log_file.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+    # index texts under the given ids, replacing older versions of the same ids
+    def upsert(self, ids, texts):
+        entries = [{"id": row_id, "terms": dict(Counter(tokenize(text)))} for row_id, text in zip(ids, texts)]
+        with self._lock:
+            self._appendLog(entries)
+            for entry in entries:
+                self._add(entry["id"], entry["terms"])
+            if self._log_rows > max(self._compacted_rows * self.compact_ratio, 1000):
+                self._compact()
+
+    def delete(self, ids):
+        with self._lock:
+            self._appendLog({"delete": row_id} for row_id in ids)
+            for row_id in ids:
+                self._delete(row_id)
+
+    # (document numbers, counts) of every document containing a term
+    def _postings(self, term):
+        parts_documents, parts_counts = [], []
+        number = self._term_numbers.get(term)
+        if number is not None:
+            start, end = self._offsets[number], self._offsets[number + 1]
+            parts_documents.append(self._documents[start:end])
+            parts_counts.append(self._counts[start:end])
+        recent = self._recent.get(term)
+        if recent:
+            recent = np.array(recent, dtype=np.int64)
+            parts_documents.append(recent[:, 0])
+            parts_counts.append(recent[:, 1])
+        if not parts_documents:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts_documents).astype(np.int64), np.concatenate(parts_counts).astype(np.float32)
+
+    # ids and bm25 scores of the best matching rows, best first
+    def search(self, query, n_results=5):
+        with self._lock:
+            live = len(self._document_numbers)
+            if not live:
+                return []
+            average_length = max(self._total_length / live, 1e-9)
+            deleted = np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted))
+
+            matched_documents, matched_scores = [], []
+            for term in set(tokenize(query)):
+                documents, counts = self._postings(term)
+                if len(deleted):
+                    keep = ~np.isin(documents, deleted)
+                    documents, counts = documents[keep], counts[keep]
+                if not len(documents):
+                    continue
+
+                idf = math.log(1 + (live - len(documents) + 0.5) / (len(documents) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[documents] / average_length)
+                matched_documents.append(documents)
+                matched_scores.append(idf * counts * (self.k1 + 1) / (counts + norm))
+
+            if not matched_documents:
+                return []
+
+            # sum the scores of every document over the query terms
+            scores = np.bincount(np.concatenate(matched_documents), weights=np.concatenate(matched_scores))
+            documents = np.flatnonzero(scores)
+            scores = scores[documents]
+            top = np.argsort(-scores, kind="stable")[:n_results] if len(scores) <= n_results else \
+                np.argpartition(-scores, n_results - 1)[:n_results]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(self._ids[documents[i]], float(scores[i])) for i in top]
+
+    # read the compacted rows and the log again (e.g. after another process wrote to the index)
+    def reload(self):
+        with self._lock:
+            self._load()
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    # merge the recent postings into new compact arrays, dropping deleted documents
+    def _compact(self):
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[list(self._deleted)] = False
+        new_numbers = np.cumsum(keep) - 1
+
+        terms = list(self._term_numbers) + [term for term in self._recent if term not in self._term_numbers]
+        offsets = [0]
+        documents, counts = [], []
+        for term in terms:
+            term_documents, term_counts = self._postings(term)
+            alive = keep[term_documents]
+            documents.append(new_numbers[term_documents[alive]].astype(np.int32))
+            counts.append(np.minimum(term_counts[alive], 65535).astype(np.uint16))
+            offsets.append(offsets[-1] + int(alive.sum()))
+
+        # terms that no longer match any document are dropped
+        used = np.diff(offsets) > 0
+        terms = [term for term, is_used in zip(terms, used) if is_used]
+        documents = [part for part, is_used in zip(documents, used) if is_used]
+        counts = [part for part, is_used in zip(counts, used) if is_used]
+        offsets = np.concatenate(([0], np.cumsum([len(part) for part in documents]))).astype(np.int64)
+
+        ids = [row_id for row_id, is_kept in zip(self._ids, keep) if is_kept]
+        lengths = self._lengths[:len(self._ids)][keep].astype(np.int32)
+
+        # write the new index next to the old one and swap it in, then drop the log
+        # if the process dies in between, replaying the log again gives the same rows
+        with open(self._file("index.tmp.npz"), "wb") as index_file:
+            np.savez(index_file, offsets=offsets, lengths=lengths,
+                     ids=np.frombuffer("\n".join(ids).encode("utf-8"), dtype=np.uint8),
+                     terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                     documents=np.concatenate(documents) if documents else np.zeros(0, dtype=np.int32),
+                     counts=np.concatenate(counts) if counts else np.zeros(0, dtype=np.uint16))
+        os.replace(self._file("index.tmp.npz"), self._file("index.npz"))
+        if os.path.exists(self._file("log.jsonl")):
+            os.remove(self._file("log.jsonl"))
+
+        self._load()
+
+    # number of indexed rows
+    def count(self):
+        return len(self._document_numbers)
+
+    # approximate bytes of memory held by the index (arrays, plus the python objects for ids, terms and recent rows)
+    def memoryBytes(self):
+        arrays = self._offsets.nbytes + self._documents.nbytes + self._counts.nbytes + self._lengths.nbytes
+        # about 100 bytes per dict entry with its string key, about 80 bytes per recent posting tuple
+        objects = 100 * (len(self._document_numbers) + len(self._term_numbers) + len(self._ids))
+        objects += 80 * sum(len(postings) for postings in self._recent.values())
+        return arrays + objects
@@ -1,21 +1,68 @@
-import ollama
+import queue
+import threading
+import time
+
+import config
+import instrumentation
+from generation_cache import generationKey, pairIds
 
 """
 LLM Interface Script
 
-This module defines a function for generating YouTube comment replies using a locally
+This module defines functions for generating YouTube comment replies using a locally
 hosted Large Language Model (LLM) through the Ollama API. It performs lightweight
 prompt engineering by constructing a context-rich input prompt that guides the model
 to generate relevant, natural responses in the style of real YouTube interactions.
 
-Function:
+Replies are streamed: tokens are handed to the caller as the model produces them, so
+a UI can show the start of a reply after the prompt is processed instead of waiting
+for the whole reply.
+
+Functions:
 ----------
-callLLM(comments: list[str], replies: list[list[str]], prompt: str) -> str
-    - Builds a pre-prompt with example comment–reply pairs to condition the model.
-    - Provides clear behavioral instructions for tone, structure, and content.
-    - Appends the user's comment to request a tailored reply.
-    - Calls the 'llama2:7B' model through the Ollama API using `generate()`.
-    - Returns the generated reply text.
+buildPrompt(comments: list[str], replies: list[list[str]], prompt: str) -> str
+    - Builds the prompt with the shared `prompt_builder` (see prompt_builder.py): the
+      static instructions for tone, structure, and content, as many example
+      comment–reply pairs as fit in the token budget, and the user's comment.
+
+streamLLM(comments: list[str], replies: list[list[str]], prompt: str, timeout: float | None = None,
+          cancel_event: threading.Event | None = None) -> ReplyStream
+    - Starts generating a reply with the model in `config.LLM_MODEL` (llama3:8B by
+      default) through the shared Ollama client (`config.llm_client`), with the context
+      window `config.LLM_NUM_CTX` and keep-alive `config.LLM_KEEP_ALIVE`.
+    - Iterating over the returned stream yields the reply's tokens as they arrive.
+
+callLLM(comments: list[str], replies: list[list[str]], prompt: str, timeout: float | None = None,
+        stats: dict | None = None, use_cache: bool = True) -> str
+    - Blocking wrapper around `streamLLM`, returns the whole reply text.
+    - Replies are looked up in and stored to the shared generation cache
+      (`config.generation_cache`, see generation_cache.py), keyed on the comment, the
+      retrieved pairs, the model and the generation options. `use_cache=False` skips the
+      cache and always generates a fresh reply.
+    - With `stats`, fills the dict with the metrics of the call (see `ReplyStream`), and
+      `cached` (True when the reply came from the generation cache, then only
+      `total_seconds` is set).
+
+Classes:
+---------
+ReplyStream(prompt: str, model: str = config.LLM_MODEL, timeout: float | None = None,
+            cancel_event: threading.Event | None = None, options: dict | None = None,
+            keep_alive: str | float | None = None)
+    - Iterable over the tokens of one reply (it can only be iterated once).
+    - cancel() -> None, stops the reply. Iteration ends after the token being read and
+      the connection to Ollama is closed, which stops the generation on the server.
+    - text -> str, the reply generated so far.
+    - stats -> dict with:
+        ttft_seconds       seconds from the request to the first token
+        total_seconds      seconds from the request to the last token
+        tokens             tokens generated (as counted by Ollama when it reports them)
+        tokens_per_second  tokens per second after the first token
+        prompt_tokens      prompt tokens processed by Ollama (None if not reported)
+        done_reason        why Ollama stopped ("stop", "length", ...), None if the reply was cut short
+        cancelled, timed_out
+GenerationTimeoutError(TimeoutError)
+    - Raised while iterating when the reply takes longer than `timeout` seconds. The
+      reply so far is in `partial_text`.
 
 Parameters:
 ------------
@@ -25,6 +72,10 @@ replies : list of list of str
     Corresponding replies for each comment; only the first element of each list is used.
 prompt : str
     The new user comment for which the model should generate a reply.
+timeout : float, optional (default = None)
+    Max seconds for the whole reply, including the time to process the prompt.
+cancel_event : threading.Event, optional (default = None)
+    Setting it from any thread cancels the reply (the same as `ReplyStream.cancel()`).
 
 Returns:
 ---------
@@ -33,32 +84,189 @@ str
 
 Dependencies:
 --------------
+- src.config (for the lazily built `llm_client`, `prompt_builder` and `generation_cache`)
+- src.instrumentation (time to first token, generation seconds and token counts, when enabled)
 - ollama (local LLM API interface)
+
+Notes:
+-------
+- The reply is read from Ollama on a background thread, so timeouts and cancellation
+  take effect even while no tokens are arriving (e.g. while a long prompt is being
+  processed). That thread stops reading at the next token it receives.
+- benchmarks/fake_ollama_server.py is a local stand-in for Ollama that can be used
+  with `OLLAMA_HOST` (see benchmarks/llm_streaming_benchmark.py).
 """
 
+# how often a waiting reply checks for cancellation and its timeout
+_POLL_SECONDS = 0.05
+
+
+# raised when a reply takes longer than its timeout
+class GenerationTimeoutError(TimeoutError):
+
+    # partial_text == reply text generated before the timeout
+    def __init__(self, message, partial_text=""):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+# function to build the prompt sent to the llm
+# also perform pre-prompting / prompt engineering, within the token budget of the shared prompt builder
+def buildPrompt(comments, replies, prompt):
+    return config.prompt_builder.build(comments, replies, prompt)
+
+
+# tokens of one reply, streamed from ollama as they are generated
+class ReplyStream:
+
+    # prompt == full prompt sent to the model
+    # timeout == max seconds for the whole reply (None for no limit)
+    # cancel_event == optional threading.Event, setting it cancels the reply
+    # options == ollama model options (e.g. {"num_predict": 200, "num_ctx": 2048})
+    # keep_alive == how long ollama keeps the model loaded after the reply (e.g. "30m")
+    def __init__(self, prompt, model=None, timeout=None, cancel_event=None, options=None, keep_alive=None):
+        self.prompt = prompt
+        self.model = model or config.LLM_MODEL
+        self.timeout = timeout
+        self.options = options
+        self.keep_alive = keep_alive
+        self.cancel_event = cancel_event or threading.Event()
+        self.text = ""
+        self.stats = {"ttft_seconds": None, "total_seconds": None, "tokens": 0, "tokens_per_second": None,
+                      "prompt_tokens": None, "done_reason": None, "cancelled": False, "timed_out": False}
+        self._chunks = queue.Queue()
+        self._stop = threading.Event()
+        self._started = False
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    # runs on a background thread: read chunks from ollama into the queue until the reply ends or is stopped
+    def _read(self):
+        chunks = None
+        try:
+            # using generate and not chat because don't need to have a conversation, just a response to the initial prompt
+            chunks = config.llm_client.generate(model=self.model, prompt=self.prompt, stream=True, options=self.options,
+                                                keep_alive=self.keep_alive)
+            for chunk in chunks:
+                self._chunks.put(("chunk", chunk))
+                if self._stop.is_set() or self.cancel_event.is_set():
+                    break
+        except Exception as error:
+            self._chunks.put(("error", error))
+        finally:
+            # closing the stream closes the connection, which stops the generation in ollama
+            if chunks is not None:
+                chunks.close()
+            self._chunks.put(("end", None))
+
+    # wait for the next item from the reader, None when cancelled
+    def _next(self, deadline):
+        while not self.cancel_event.is_set():
+            wait = _POLL_SECONDS if deadline is None else min(_POLL_SECONDS, deadline - time.perf_counter())
+            if wait <= 0:
+                self.stats["timed_out"] = True
+                raise GenerationTimeoutError(f"No complete reply after {self.timeout} seconds", self.text)
+            try:
+                return self._chunks.get(timeout=wait)
+            except queue.Empty:
+                continue
+        self.stats["cancelled"] = True
+        return None
+
+    def __iter__(self):
+        if self._started:
+            raise RuntimeError("A reply can only be streamed once")
+        self._started = True
+
+        start = time.perf_counter()
+        deadline = None if self.timeout is None else start + self.timeout
+        first_token_at = None
+        counted_tokens = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+        try:
+            while True:
+                item = self._next(deadline)
+                if item is None or item[0] == "end":
+                    return
+                kind, chunk = item
+                if kind == "error":
+                    raise chunk
+
+                if chunk["response"]:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        self.stats["ttft_seconds"] = first_token_at - start
+                    counted_tokens += 1
+                    self.text += chunk["response"]
+                    yield chunk["response"]
+
+                # the last chunk carries ollama's own counts
+                if chunk["done"]:
+                    self.stats["done_reason"] = chunk.get("done_reason")
+                    self.stats["prompt_tokens"] = chunk.get("prompt_eval_count")
+                    counted_tokens = chunk.get("eval_count") or counted_tokens
+        finally:
+            # also reached when the caller stops iterating early
+            self._stop.set()
+            end = time.perf_counter()
+            self.stats["total_seconds"] = end - start
+            self.stats["tokens"] = counted_tokens
+            if first_token_at is not None and end > first_token_at and counted_tokens > 1:
+                self.stats["tokens_per_second"] = (counted_tokens - 1) / (end - first_token_at)
+            if instrumentation.enabled:
+                self._record()
+
+    # report the finished (or stopped) reply to the instrumentation layer
+    def _record(self):
+        stats = self.stats
+        if stats["ttft_seconds"] is not None:
+            instrumentation.observe("llm_ttft_seconds", stats["ttft_seconds"])
+        instrumentation.observe("llm_generation_seconds", stats["total_seconds"])
+        instrumentation.count("llm_prompt_tokens_total", stats["prompt_tokens"] or 0)
+        instrumentation.count("llm_response_tokens_total", stats["tokens"])
+        done_reason = stats["done_reason"] or ("timeout" if stats["timed_out"] else "cancelled" if stats["cancelled"] else "stopped")
+        instrumentation.count("llm_replies_total", done_reason=done_reason)
+        instrumentation.event("llm_reply", model=self.model, **stats)
+
+
+# ollama options sent with every reply
+def _generationOptions():
+    return {"num_ctx": config.LLM_NUM_CTX} if config.LLM_NUM_CTX else None
+
+
+# function to stream a reply from the llm, tokens are yielded as they are generated
+# timeout == max seconds for the whole reply
+# cancel_event == optional threading.Event that cancels the reply when set
+def streamLLM(comments, replies, prompt, timeout=None, cancel_event=None):
+    return ReplyStream(buildPrompt(comments, replies, prompt), timeout=timeout, cancel_event=cancel_event,
+                       options=_generationOptions(), keep_alive=config.LLM_KEEP_ALIVE)
+
+
 # function to call LLM and get results
-# also perform pre-prompting / prompt engineering
-def callLLM(comments, replies, prompt):
-
-    # write out the pre-prompt text for the llm
-    pre_prompt = """
-    You are a bot whose purpose is to reply to YouTube comments about the Honda Civic Si.
-    You will be provided with examples of comment and reply pairings. Do not simply regurgitate these replies, use them as inspiration.
-    Do not include special characters or usernames in your response. Do not ask for more information.
-    Use only the information provided in the sample comment reply pairs to create your response.
-    Respond by restating the comment and then your reply, like thisL Comment: (user comment here) Reply: (your reply here).
-    Here are your samples:
-    """
-
-    # add in the comment and reply pairs
-    for i in range(len(comments)):
-        pre_prompt += "Comment " + str(i + 1) + ": " + comments[i] + "\nReply " + str(i + 1) + ": " + replies[i][0] + "\n\n"
-
-    # add in the comment from user for llm to reply to
-    pre_prompt += "\nDraft a reply to this comment: \n" + prompt
-
-    # call llm and get response
-    # using generate and not chat because don't need to have a conversation, just a response to the initial prompt
-    response = ollama.generate(model='llama3:8B', prompt=pre_prompt)
-
-    return response["response"]
+# blocks until the whole reply is generated
+# stats == optional dict, filled with the metrics of the call (time to first token, tokens per second, total seconds, ...)
+# use_cache == False to skip the generation cache and always sample a new reply
+def callLLM(comments, replies, prompt, timeout=None, stats=None, use_cache=True):
+    if use_cache:
+        start = time.perf_counter()
+        key = generationKey(prompt, pairIds(comments, replies), config.LLM_MODEL, _generationOptions())
+        reply = config.generation_cache.lookup(key)
+        if reply is not None:
+            instrumentation.count("generation_cache_hits_total")
+            if stats is not None:
+                stats.update({"cached": True, "total_seconds": time.perf_counter() - start})
+            return reply
+
+    stream = streamLLM(comments, replies, prompt, timeout=timeout)
+    try:
+        reply = "".join(stream)
+    finally:
+        if stats is not None:
+            stats.update(stream.stats, cached=False)
+
+    # only whole replies are stored, not ones that were cancelled or cut short
+    if use_cache and stream.stats["done_reason"] is not None:
+        config.generation_cache.put(key, reply, config.LLM_MODEL, stream.stats["total_seconds"])
+    return reply
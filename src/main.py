@@ -1,8 +1,9 @@
-from youtube_scraper import fetchYouTubeComments
-from data_cleaning import cleanData
-from upload_vector_db import uploadToVectorDB
+import sys
+
+from batch_replies import BatchReplyRunner, readComments
+from ingest_pipeline import runIngestPipeline
 from semantic_search import getSemanticSearchResults
-from llm_interface import callLLM
+from llm_interface import streamLLM
 
 """
 YouTube RAG Pipeline Script
@@ -26,15 +27,25 @@ Usage:
 ------
 - Define a user prompt and a list of YouTube video IDs.
 - Run the pipeline to fetch, clean, store, retrieve, and respond to comments.
-- The final LLM-generated response is printed to the console.
+- The final LLM-generated response is printed to the console as it is generated.
+- To draft replies for a whole queue of new comments instead, pass a file of comments
+  (one per line, or JSON lines with a "comment" field) and an output file:
+  `python src/main.py new_comments.txt replies.jsonl`. Steps 4-5 then run for every
+  comment through `batch_replies.BatchReplyRunner` and the replies are appended to the
+  output file as they finish.
+
+Steps 1-3 run as a streaming pipeline (`ingest_pipeline.runIngestPipeline`): batches
+of comments are cleaned, embedded and uploaded while later pages are still being fetched.
 
 Dependencies:
 -------------
+- src.ingest_pipeline.runIngestPipeline
 - src.youtube_scraper.fetchYouTubeComments
 - src.data_cleaning.cleanData
 - src.upload_vector_db.uploadToVectorDB
 - src.semantic_search.getSemanticSearchResults
-- src.llm_interface.callLLM
+- src.llm_interface.streamLLM
+- src.batch_replies.BatchReplyRunner
 - ChromaDB, SentenceTransformers, Ollama
 
 Example:
@@ -57,19 +68,21 @@ video_ids = [
     "wczsTzaIgcE", "1h4MB5K_w1I", "JOp1xZrbuQM", "_e5mIqafwMA", "evTLpZZp6R0", "pUTj3C-Owx8"
 ]
 
-# 1. Fetch comments
-output = fetchYouTubeComments(video_ids)
+# 1-3. Fetch comments, clean them and upload them to the vector DB
+# the stages run at the same time, streaming batches of comments from one to the next
+runIngestPipeline(video_ids)
 
-# 2. Clean data
-output = cleanData(output)
-
-# 3. Upload to vector DB
-uploadToVectorDB(output)
+# 4-5. With a file of new comments, search and generate replies for all of them, writing them to a json lines file
+if len(sys.argv) > 1:
+    runner = BatchReplyRunner()
+    runner.run(readComments(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else "replies.jsonl")
+    runner.report()
+    sys.exit()
 
 # 4. Perform semantic search
 comments, replies = getSemanticSearchResults(prompt)
 
-# 5. Generate LLM response
-response = callLLM(comments, replies, prompt)
-
-print(response)
+# 5. Generate LLM response, printing each token as soon as it arrives
+for token in streamLLM(comments, replies, prompt):
+    print(token, end="", flush=True)
+print()
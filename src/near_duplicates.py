@@ -0,0 +1,339 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+"""
+Near-Duplicate Detection
+
+This module finds near-duplicate comments (copy-pasted spam, "first!" variants,
+lightly edited reposts) with MinHash signatures and locality-sensitive hashing (LSH),
+and collapses each cluster of near-duplicates down to one representative row.
+
+How it works:
+--------------
+1. Every text is lowercased with its whitespace collapsed. Exact copies are grouped
+   right away and only distinct texts go through the next steps.
+2. Each distinct text is split into overlapping character shingles (`shingle_size`
+   characters), hashed with a rolling hash.
+3. Each text gets a MinHash signature of `num_perm` values, the minimum of `num_perm`
+   (a * x + b) mod 2^32 hash functions over its shingles. Two signatures agree on a given
+   position with probability equal to the Jaccard similarity of the shingle sets.
+4. Signatures are cut into bands. Texts that share a whole band land in the same
+   bucket and become candidates. The band size is picked from `threshold` so pairs
+   above the threshold are very likely to collide.
+5. Within a bucket, every text is compared with the bucket's first text. The texts that
+   are not merged with it are compared with the first of them, and so on, so the work
+   grows with the number of clusters in a bucket rather than the number of pairs (spam
+   variants can fill a bucket with thousands of texts). Texts are only merged if their
+   estimated similarity (the share of equal signature values) is at least `threshold`,
+   and texts already in the same cluster are not compared again. Clusters are tracked
+   with union-find.
+
+Everything except the union-find step is vectorized with NumPy and runs in chunks,
+so time and memory grow roughly linearly with the number of texts. A text is only
+compared with the first text of each cluster in its buckets, so a chain of texts that
+are each similar to the next one but not to the first can end up in several clusters.
+
+Class:
+-------
+NearDuplicateDetector(threshold: float = 0.9, num_perm: int = 64, shingle_size: int = 4, seed: int = 0)
+    - signatures(texts) -> numpy.ndarray of shape (len(texts), num_perm)
+    - clusters(texts) -> numpy.ndarray with the cluster representative index of every text
+      (the index of the first text in its cluster)
+NearDuplicateIndex(threshold: float = 0.9, path: str | None = None, **options)
+    - Streaming version for pipelines that see the corpus one batch at a time. The
+      signatures and LSH buckets live in SQLite, on disk under `path` (or in memory),
+      so a run only loads the buckets its own texts fall into.
+    - add(ids, texts) -> None
+        Indexes texts that are kept anyway (e.g. rows already in the vector store).
+    - filter(ids, texts) -> numpy.ndarray of bool
+        Keeps every text that is not a near-duplicate of an indexed text with another id
+        (or of an earlier text in the same call), and indexes the kept ones.
+    - close() -> None
+
+Function:
+----------
+collapseNearDuplicates(df: pandas.DataFrame, column: str = "comment", threshold: float = 0.9, **options)
+    -> tuple[pandas.DataFrame, dict]
+    - Keeps the first row of every near-duplicate cluster and returns the reduced
+      DataFrame with stats (rows before / after, rows removed, reduction, seconds).
+
+Artifacts (NearDuplicateIndex with a path):
+--------------------------------------------
+- <path>/index.sqlite3   MinHash signature of every indexed text, its LSH bucket in every
+                         band, and the settings it was built with (opening it with other
+                         settings raises a ValueError)
+"""
+
+# multiplier of the rolling shingle hash
+_SHINGLE_BASE = np.uint64(1000003)
+# max shingles hashed at once (bounds memory to about num_perm x 4 bytes per shingle)
+_SHINGLES_PER_CHUNK = 200000
+
+
+# pick the number of bands so that (1 / bands) ** (1 / rows) is as close as possible to the threshold
+def chooseBands(num_perm, threshold):
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class NearDuplicateDetector:
+
+    # threshold == min estimated Jaccard similarity of the shingle sets to count as a duplicate
+    # num_perm == number of hash functions in each MinHash signature
+    # shingle_size == characters per shingle
+    def __init__(self, threshold=0.9, num_perm=64, shingle_size=4, seed=0):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bands, self.rows = chooseBands(num_perm, threshold)
+
+        # (a * x + b) mod 2^32 hash functions on 32 bit shingle hashes, multipliers must be odd so each is a permutation
+        rng = np.random.default_rng(seed)
+        self._multipliers = (rng.integers(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint32) | np.uint32(1))
+        self._offsets = rng.integers(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint32)
+
+    # hash every shingle of a chunk of texts, returns (32 bit hashes, index of the first shingle of each text)
+    def _shingleHashes(self, texts):
+        k = self.shingle_size
+        padding = "\0" * k
+
+        # texts are joined with k characters of padding, so a shingle never spans two texts and short
+        # (or empty) texts still get one shingle that ends inside their own padding
+        codes = np.frombuffer("".join(text + padding for text in texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        text_starts = np.concatenate(([0], np.cumsum(lengths + k)[:-1]))
+        counts = np.maximum(lengths - k + 1, 1)
+
+        # rolling hash of the k characters starting at every position
+        with np.errstate(over="ignore"):
+            hashes = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+            for offset in range(k):
+                hashes = hashes * _SHINGLE_BASE + codes[offset:len(codes) - k + 1 + offset]
+
+        # keep only the positions that start a shingle inside a text
+        shingle_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        positions = np.repeat(text_starts - shingle_starts, counts) + np.arange(counts.sum())
+        hashes = hashes[positions]
+        return ((hashes >> np.uint64(32)) ^ hashes).astype(np.uint32), shingle_starts
+
+    # MinHash signature of every text (texts are expected to be lowercased already)
+    def signatures(self, texts):
+        texts = list(texts)
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+
+        start = 0
+        while start < len(texts):
+            # grow the chunk until it holds about _SHINGLES_PER_CHUNK shingles (at least one text)
+            end, shingles = start, 0
+            while end < len(texts) and (end == start or shingles + len(texts[end]) <= _SHINGLES_PER_CHUNK):
+                shingles += max(len(texts[end]) - self.shingle_size + 1, 1)
+                end += 1
+
+            hashes, shingle_starts = self._shingleHashes(texts[start:end])
+            # one row per hash function, so the per-text minimum runs over contiguous memory
+            # computed in place, this step is bound by memory bandwidth
+            permuted = np.multiply(self._multipliers, hashes)
+            np.add(permuted, self._offsets, out=permuted)
+            signatures[start:end] = np.minimum.reduceat(permuted, shingle_starts, axis=1).T
+            start = end
+
+        return signatures
+
+    # cluster the distinct texts, returns the representative (first member) of every text
+    def _clusterDistinct(self, texts):
+        signatures = self.signatures(texts)
+        parents = np.arange(len(texts))
+
+        def find(i):
+            while parents[i] != i:
+                i = parents[i]
+            return i
+
+        # point every text straight at its root
+        def compressPaths():
+            while True:
+                grandparents = parents[parents]
+                if (grandparents == parents).all():
+                    return
+                parents[:] = grandparents
+
+        for band in range(self.bands):
+            band_values = np.ascontiguousarray(signatures[:, band * self.rows:(band + 1) * self.rows])
+            band_keys = band_values.view(np.dtype((np.void, band_values.dtype.itemsize * self.rows))).ravel()
+
+            # sort by bucket, texts in the same bucket end up next to each other
+            order = np.argsort(band_keys, kind="stable")
+            sorted_keys = band_keys[order]
+            bucket_starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+            bucket_sizes = np.diff(np.append(bucket_starts, len(sorted_keys)))
+            bucket_of = np.repeat(np.arange(len(bucket_starts)), bucket_sizes)
+
+            # every member of a bucket is compared with one representative, the first member left in the bucket
+            # members that are merged with it (or already in its cluster) drop out and the rest get the next one,
+            # so the rounds grow with the clusters in a bucket and not with the pairs
+            positions = np.flatnonzero(bucket_sizes[bucket_of] > 1)
+            while len(positions):
+                buckets = bucket_of[positions]
+                is_first = np.concatenate(([True], buckets[1:] != buckets[:-1]))
+                members = order[positions]
+                representatives = members[is_first][np.cumsum(is_first) - 1]
+
+                # members already in the representative's cluster are skipped
+                compressPaths()
+                pending = np.flatnonzero(~is_first & (parents[members] != parents[representatives]))
+
+                # only merge candidates that really are similar enough
+                similar = (signatures[members[pending]] == signatures[representatives[pending]]).mean(axis=1) >= self.threshold
+                for first, second in zip(members[pending[similar]].tolist(), representatives[pending[similar]].tolist()):
+                    root_first, root_second = find(first), find(second)
+                    # the earlier text stays the representative
+                    if root_first != root_second:
+                        parents[max(root_first, root_second)] = min(root_first, root_second)
+                positions = positions[pending[~similar]]
+
+        compressPaths()
+        return parents.tolist()
+
+    # cluster representative (index of the first text in the cluster) of every text
+    def clusters(self, texts):
+        # exact copies (ignoring case and spacing) share a signature, so only distinct texts are hashed
+        distinct = {}
+        distinct_ids = [distinct.setdefault(" ".join(text.lower().split()), len(distinct)) for text in texts]
+        first_index = [0] * len(distinct)
+        for i in range(len(distinct_ids) - 1, -1, -1):
+            first_index[distinct_ids[i]] = i
+
+        # distinct texts are numbered in order of first appearance, so the smallest root is also the earliest text
+        roots = self._clusterDistinct(list(distinct))
+        return np.array([first_index[roots[distinct_id]] for distinct_id in distinct_ids], dtype=np.int64)
+
+
+# near-duplicate filter over a stream of batches, every text is checked against all texts kept so far
+# the same row id is never its own duplicate, so a stored row whose text was edited is kept
+class NearDuplicateIndex:
+
+    # path == folder to keep the index in across runs (None keeps it in memory)
+    # options == passed to NearDuplicateDetector (num_perm, shingle_size, seed)
+    def __init__(self, threshold=0.9, path=None, **options):
+        self.detector = NearDuplicateDetector(threshold=threshold, **options)
+        self.path = path
+        settings = json.dumps({"threshold": threshold, "num_perm": self.detector.num_perm,
+                               "shingle_size": self.detector.shingle_size, "seed": self.detector.seed})
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        # one connection shared by every thread, guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "index.sqlite3") if path else ":memory:", check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (settings TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS signatures (position INTEGER PRIMARY KEY, id TEXT NOT NULL, signature BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, key BLOB NOT NULL, position INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS buckets_by_key ON buckets (band, key);
+        """)
+
+        # signatures made with other settings can't be compared, the index has to be rebuilt
+        stored = self._connection.execute("SELECT settings FROM settings").fetchone()
+        if stored is None:
+            self._connection.execute("INSERT INTO settings VALUES (?)", (settings,))
+            self._connection.commit()
+        elif stored[0] != settings:
+            raise ValueError(f"Near-duplicate index at {path} was built with {stored[0]}, not {settings}. "
+                             f"Delete the folder to rebuild it.")
+        self._rows = self._connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM signatures").fetchone()[0]
+
+    def __len__(self):
+        return self._rows
+
+    def _textSignatures(self, texts):
+        return self.detector.signatures([" ".join(str(text).lower().split()) for text in texts])
+
+    def _bandKeys(self, signature):
+        rows = self.detector.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.detector.bands)]
+
+    # ids and signatures of the indexed texts that share a bucket with any of the given band keys
+    def _candidates(self, band_keys):
+        positions = {}
+        for band in range(self.detector.bands):
+            keys = list({keys[band] for keys in band_keys})
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                for key, position in self._connection.execute(
+                        f"SELECT key, position FROM buckets WHERE band = ? AND key IN ({','.join('?' * len(chunk))})", [band] + chunk):
+                    positions.setdefault((band, key), []).append(position)
+
+        found = {}
+        wanted = list({position for bucket in positions.values() for position in bucket})
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            for position, row_id, signature in self._connection.execute(
+                    f"SELECT position, id, signature FROM signatures WHERE position IN ({','.join('?' * len(chunk))})", chunk):
+                found[position] = (row_id, np.frombuffer(signature, dtype=np.uint32))
+        return positions, found
+
+    def _insert(self, ids, signatures, band_keys):
+        first = self._rows
+        self._connection.executemany("INSERT INTO signatures (position, id, signature) VALUES (?, ?, ?)",
+                                     [(first + i, row_id, signature.tobytes()) for i, (row_id, signature) in enumerate(zip(ids, signatures))])
+        self._connection.executemany("INSERT INTO buckets (band, key, position) VALUES (?, ?, ?)",
+                                     [(band, key, first + i) for i, keys in enumerate(band_keys) for band, key in enumerate(keys)])
+        self._connection.commit()
+        self._rows += len(ids)
+
+    # index texts without filtering them
+    def add(self, ids, texts):
+        signatures = self._textSignatures(texts)
+        with self._lock:
+            self._insert(list(ids), signatures, [self._bandKeys(signature) for signature in signatures])
+
+    # keep mask of the texts that are not near-duplicates of anything indexed, the kept texts are indexed
+    def filter(self, ids, texts):
+        ids = list(ids)
+        signatures = self._textSignatures(texts)
+        band_keys = [self._bandKeys(signature) for signature in signatures]
+        keep = np.ones(len(ids), dtype=bool)
+
+        with self._lock:
+            positions, found = self._candidates(band_keys)
+            # texts kept earlier in this call are candidates too, numbered after the indexed ones
+            for i, (row_id, signature, keys) in enumerate(zip(ids, signatures, band_keys)):
+                candidates = {position for band, key in enumerate(keys) for position in positions.get((band, key), ())}
+                if any(found[position][0] != row_id and (found[position][1] == signature).mean() >= self.detector.threshold
+                       for position in candidates):
+                    keep[i] = False
+                    continue
+                found[-1 - i] = (row_id, signature)
+                for band, key in enumerate(keys):
+                    positions.setdefault((band, key), []).append(-1 - i)
+
+            kept = np.flatnonzero(keep)
+            self._insert([ids[i] for i in kept], signatures[kept], [band_keys[i] for i in kept])
+        return keep
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# keep one row (the first) of every cluster of near-duplicate texts in a column
+def collapseNearDuplicates(df, column="comment", threshold=0.9, **options):
+    start = time.perf_counter()
+    representatives = NearDuplicateDetector(threshold=threshold, **options).clusters(df[column].astype(str).to_list())
+    keep = representatives == np.arange(len(df))
+    collapsed = df[keep]
+
+    stats = {
+        "rows_before": len(df),
+        "rows_after": len(collapsed),
+        "rows_removed": len(df) - len(collapsed),
+        "reduction": (len(df) - len(collapsed)) / max(len(df), 1),
+        "seconds": time.perf_counter() - start,
+    }
+    return collapsed, stats
@@ -0,0 +1,144 @@
+import math
+import threading
+
+"""
+Prompt Builder
+
+This module assembles the prompt sent to the LLM from the retrieved comment–reply
+examples and the user's comment, within a token budget. Scraped comments can be very
+long, and every prompt token has to be processed before the first reply token appears
+(prefill), so an unbounded prompt is slow and can overflow the model's context window
+(Ollama then drops the start of the prompt, which is where the instructions are).
+
+The prompt always has the same layout:
+
+    <instructions>  static text, byte-identical in every prompt
+    <examples>      "Comment i: ...\nReply i: ...\n\n" for every example that fits
+    <request>       "\nDraft a reply to this comment: \n" + the user's comment
+
+Because the instructions never change, Ollama can reuse the processed (KV cache) state
+of that prefix from the previous call and only process the rest.
+
+Examples are fitted in rank order (the order the search returned them): every comment
+and reply is first cut to `max_text_tokens`, then examples are added while they fit in
+the budget left after the instructions and the request. Lower ranked examples are the
+ones dropped.
+
+Class:
+-------
+PromptBuilder(token_budget: int | None = 1536, max_text_tokens: int | None = 160, max_comment_tokens: int | None = 256,
+              replies_per_example: int = 1, count_tokens = estimateTokens, instructions: str = INSTRUCTIONS)
+    - build(comments, replies, prompt) -> str
+    - stats -> dict with prompts, examples_used, examples_trimmed, examples_dropped and prompt_tokens
+      (totals over every build, safe to build from several threads)
+
+Functions:
+----------
+estimateTokens(text: str) -> int
+    - Token count estimate of about 4 characters per token (the average of the Llama 3
+      tokenizer on English text). Pass `count_tokens` for an exact count.
+trimToTokens(text: str, max_tokens: int, count_tokens = estimateTokens) -> str
+    - Cuts a text at a word boundary so it fits in `max_tokens`, marking the cut with "...".
+
+Notes:
+-------
+- `token_budget` = None (with the other limits None) builds the untrimmed prompt, the
+  same text `callLLM` sent before budgets existed.
+- The budget only covers the prompt. The context window (`LLM_NUM_CTX`, see config.py)
+  must also fit the reply.
+"""
+
+# static instruction block, every prompt starts with exactly these bytes
+INSTRUCTIONS = """
+    You are a bot whose purpose is to reply to YouTube comments about the Honda Civic Si.
+    You will be provided with examples of comment and reply pairings. Do not simply regurgitate these replies, use them as inspiration.
+    Do not include special characters or usernames in your response. Do not ask for more information.
+    Use only the information provided in the sample comment reply pairs to create your response.
+    Respond by restating the comment and then your reply, like thisL Comment: (user comment here) Reply: (your reply here).
+    Here are your samples:
+    """
+REQUEST = "\nDraft a reply to this comment: \n"
+TRIM_MARKER = "..."
+
+
+def estimateTokens(text):
+    return math.ceil(len(text) / 4)
+
+
+# cut a text at a word boundary so it fits in max_tokens
+def trimToTokens(text, max_tokens, count_tokens=estimateTokens):
+    if max_tokens is None or count_tokens(text) <= max_tokens:
+        return text
+
+    # most words that still fit with the marker (binary search, count_tokens may be slow)
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle]) + TRIM_MARKER) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + TRIM_MARKER
+
+
+class PromptBuilder:
+
+    # token_budget == max tokens of the whole prompt (None for no limit)
+    # max_text_tokens == max tokens of every example comment and reply (None for no limit)
+    # max_comment_tokens == max tokens of the user's comment (None for no limit)
+    # replies_per_example == replies shown for every example comment
+    # count_tokens == function returning the token count of a text
+    def __init__(self, token_budget=1536, max_text_tokens=160, max_comment_tokens=256, replies_per_example=1,
+                 count_tokens=estimateTokens, instructions=INSTRUCTIONS):
+        self.token_budget = token_budget
+        self.max_text_tokens = max_text_tokens
+        self.max_comment_tokens = max_comment_tokens
+        self.replies_per_example = replies_per_example
+        self.count_tokens = count_tokens
+        self.instructions = instructions
+        self.stats = {"prompts": 0, "examples_used": 0, "examples_trimmed": 0, "examples_dropped": 0, "prompt_tokens": 0}
+        # the reply service builds prompts on several threads, the totals are updated under this lock
+        self._lock = threading.Lock()
+
+    def _example(self, number, comment, replies):
+        parts = [f"Comment {number}: {comment}\n"]
+        for reply in replies:
+            parts.append(f"Reply {number}: {reply}\n")
+        parts.append("\n")
+        return "".join(parts)
+
+    # prompt with as many of the examples (best ranked first) as fit in the budget
+    # comments == example comments, best match first
+    # replies == list of replies for every example comment
+    # prompt == the user's comment to reply to
+    def build(self, comments, replies, prompt):
+        request = REQUEST + trimToTokens(prompt, self.max_comment_tokens, self.count_tokens)
+        available = None if self.token_budget is None else \
+            self.token_budget - self.count_tokens(self.instructions) - self.count_tokens(request)
+
+        examples = []
+        trimmed = 0
+        for comment, example_replies in zip(comments, replies):
+            example_replies = list(example_replies[:self.replies_per_example])
+            texts = [trimToTokens(text, self.max_text_tokens, self.count_tokens) for text in [comment] + example_replies]
+
+            # once an example does not fit, it and every lower ranked one are dropped
+            example = self._example(len(examples) + 1, texts[0], texts[1:])
+            tokens = self.count_tokens(example)
+            if available is not None and tokens > available:
+                break
+            examples.append(example)
+            trimmed += texts != [comment] + example_replies
+            if available is not None:
+                available -= tokens
+
+        text = "".join([self.instructions, *examples, request])
+        prompt_tokens = self.count_tokens(text)
+        with self._lock:
+            self.stats["prompts"] += 1
+            self.stats["examples_used"] += len(examples)
+            self.stats["examples_trimmed"] += trimmed
+            self.stats["examples_dropped"] += len(comments) - len(examples)
+            self.stats["prompt_tokens"] += prompt_tokens
+        return text
@@ -0,0 +1,210 @@
+import warnings
+
+import numpy as np
+
+"""
+Embedding Quantization
+
+This module provides compact encodings ("codecs") for unit length embeddings, used by
+`MemmapVectorStore` to shrink the stored index. Every codec turns float32 vectors into
+codes and scores query embeddings against codes without decoding them first.
+
+Codecs:
+--------
+- "float32" - no compression, 4 bytes per dimension (1536 bytes for a 384-d MiniLM vector).
+- "float16" - half precision, 2 bytes per dimension (2x smaller). NumPy converts half
+              precision to float32 slowly, so scanning is slower than with float32.
+- "int8"    - one signed byte per dimension with a per-dimension scale learned from
+              `training_rows` vectors (4x smaller). Queries are multiplied by the scales,
+              so scoring is a single int8 → float32 matrix product.
+- "pq"      - product quantization (32x smaller with the defaults). The vector is cut
+              into `subspaces` sub-vectors and each one is replaced by the id of its
+              nearest of 256 centroids (one byte). Scoring is asymmetric (ADC): the
+              query stays at full precision, its dot product with every centroid is
+              computed once, and a vector's score is the sum of the looked-up values
+              for its centroid ids.
+
+Function:
+----------
+makeCodec(encoding: str, dimension: int, **options) -> codec
+    - Builds an untrained codec ("pq" takes `subspaces`, `training_rows` and `seed`, "int8"
+      takes `training_rows`).
+
+Every codec has:
+    - trained -> bool
+    - training_rows -> int, the vectors it should be trained on at least (0 for float32 / float16)
+    - train(vectors) -> None
+    - encode(vectors) -> numpy.ndarray of codes, one row per vector
+    - scores(queries, codes) -> numpy.ndarray (queries x codes) of approximate dot products
+    - state() -> dict of arrays, and load(state) -> None, for saving a trained codec
+    - code_dtype, code_size (code values per vector) and bytes_per_vector
+"""
+
+ENCODINGS = ("float32", "float16", "int8", "pq")
+# compact codes are converted to float32 this many rows at a time, so the converted rows stay in the CPU cache
+_CONVERT_ROWS = 2048
+
+
+# queries @ codes.T, converting the codes to float32 a few rows at a time
+def _product(queries, codes):
+    if codes.dtype == np.float32:
+        return queries @ codes.T
+
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), _CONVERT_ROWS):
+        scores[:, start:start + _CONVERT_ROWS] = queries @ codes[start:start + _CONVERT_ROWS].astype(np.float32).T
+    return scores
+
+
+class FloatCodec:
+
+    # dtype == float32 or float16
+    def __init__(self, dimension, dtype="float32"):
+        self.dimension = dimension
+        self.code_dtype = np.dtype(dtype)
+        self.code_size = dimension
+        self.bytes_per_vector = dimension * self.code_dtype.itemsize
+        self.training_rows = 0
+        self.trained = True
+
+    def train(self, vectors):
+        pass
+
+    def encode(self, vectors):
+        return np.asarray(vectors).astype(self.code_dtype)
+
+    def scores(self, queries, codes):
+        return _product(queries, codes)
+
+    def state(self):
+        return {}
+
+    def load(self, state):
+        pass
+
+
+class Int8Codec:
+
+    # training_rows == vectors the scales should be learned from (values past the largest one seen are clipped)
+    def __init__(self, dimension, training_rows=1000):
+        self.dimension = dimension
+        self.code_dtype = np.dtype(np.int8)
+        self.code_size = dimension
+        self.bytes_per_vector = dimension
+        self.training_rows = training_rows
+        self.scale = None
+        self.trained = False
+
+    # one scale per dimension, from the largest absolute value seen in that dimension (values past it are clipped)
+    def train(self, vectors):
+        self.scale = np.maximum(np.abs(vectors).max(axis=0), 1e-6).astype(np.float32) / 127
+        self.trained = True
+
+    def encode(self, vectors):
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, queries, codes):
+        return _product(queries * self.scale, codes)
+
+    def state(self):
+        return {"scale": self.scale}
+
+    def load(self, state):
+        self.scale = state["scale"]
+        self.trained = True
+
+
+# k-means clustering, returns the centroids
+def _kmeans(data, k, iterations, rng):
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (centroids ** 2).sum(axis=1) - 2 * data @ centroids.T
+        assignments = distances.argmin(axis=1)
+
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        # empty clusters are restarted on a random point
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = data[rng.choice(len(data), empty.sum())]
+    return centroids
+
+
+class ProductQuantizer:
+
+    # subspaces == number of sub-vectors (and code bytes) per vector, must divide the dimension
+    # training_rows == vectors the centroids should be learned from, k-means needs several per centroid (default 10 x centroids)
+    def __init__(self, dimension, subspaces=48, centroids=256, iterations=20, training_sample=20000, training_rows=None, seed=0):
+        if dimension % subspaces:
+            raise ValueError(f"{subspaces} subspaces do not divide the dimension {dimension}")
+
+        self.dimension = dimension
+        self.subspaces = subspaces
+        self.subspace_dimension = dimension // subspaces
+        self.centroid_count = centroids
+        self.iterations = iterations
+        self.training_sample = training_sample
+        self.training_rows = 10 * centroids if training_rows is None else max(training_rows, centroids)
+        self.seed = seed
+        self.code_dtype = np.dtype(np.uint8)
+        self.code_size = subspaces
+        self.bytes_per_vector = subspaces
+        # (subspaces, centroids, subspace dimension)
+        self.centroids = None
+        self.trained = False
+
+    def _split(self, vectors):
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.subspaces, self.subspace_dimension)
+
+    def train(self, vectors):
+        if len(vectors) < self.centroid_count:
+            raise ValueError(f"Product quantization needs at least {self.centroid_count} training vectors, got {len(vectors)}")
+        if len(vectors) < self.training_rows:
+            warnings.warn(f"Training {self.centroid_count} centroids on only {len(vectors)} vectors "
+                          f"(at least {self.training_rows} recommended), recall will suffer")
+
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.training_sample:
+            vectors = vectors[rng.choice(len(vectors), self.training_sample, replace=False)]
+
+        parts = self._split(vectors)
+        self.centroids = np.stack([_kmeans(parts[:, s], self.centroid_count, self.iterations, rng) for s in range(self.subspaces)])
+        self.trained = True
+
+    # id of the nearest centroid of every sub-vector
+    def encode(self, vectors):
+        parts = self._split(vectors)
+        codes = np.empty((len(parts), self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            distances = (self.centroids[s] ** 2).sum(axis=1) - 2 * parts[:, s] @ self.centroids[s].T
+            codes[:, s] = distances.argmin(axis=1)
+        return codes
+
+    # asymmetric distance computation: dot product of each query sub-vector with every centroid, summed over the codes
+    def scores(self, queries, codes):
+        tables = np.einsum("qsd,scd->sqc", self._split(queries), self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for s in range(self.subspaces):
+            scores += tables[s][:, codes[:, s]]
+        return scores
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    def load(self, state):
+        self.centroids = state["centroids"]
+        self.subspaces, _, self.subspace_dimension = self.centroids.shape
+        self.code_size = self.bytes_per_vector = self.subspaces
+        self.trained = True
+
+
+# untrained codec for an encoding
+def makeCodec(encoding, dimension, **options):
+    if encoding in ("float32", "float16"):
+        return FloatCodec(dimension, encoding)
+    if encoding == "int8":
+        return Int8Codec(dimension, **options)
+    if encoding == "pq":
+        return ProductQuantizer(dimension, **options)
+    raise ValueError(f"Unknown encoding {encoding!r}, expected one of {ENCODINGS}")
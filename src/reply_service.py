@@ -0,0 +1,322 @@
+import contextlib
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import instrumentation
+from llm_interface import GenerationTimeoutError, callLLM
+from semantic_search import getSemanticSearchResultsBatch
+
+"""
+Reply Service
+
+This module runs the retrieval and reply steps of the pipeline as a long-lived local
+HTTP service, so the embedding model, the vector store and the Ollama client are
+loaded once when the service starts instead of by every `python main.py`.
+
+Searches that arrive within `max_wait_seconds` of each other are coalesced into one
+`getSemanticSearchResultsBatch` call (one batched encode and one vector store query),
+which raises the searches per second the service can answer under concurrent load.
+Both endpoints shed load instead of queueing without limit: when more than
+`max_queued_searches` searches are waiting, or `max_queued_replies` replies are waiting
+for one of the `max_generations` generation slots, new requests get a 503 with a
+Retry-After header.
+
+Endpoints:
+-----------
+POST /search  {"prompt": str, "comments_to_return": int = 5, "where": dict | None}
+    -> {"comments": [...], "replies": [[...], ...], "seconds": float}
+POST /reply   {"prompt": str, "comments_to_return": int = 5, "where": dict | None,
+               "timeout": float | None, "use_cache": bool = True}
+    -> {"reply": str, "comments": [...], "replies": [[...], ...], "cached": bool, "seconds": float}
+GET /health   -> {"status": "ok"}
+GET /stats    -> counters of the service and its search batcher, and the load time and
+                 memory of every component (see config.registry.stats)
+GET /metrics  -> the pipeline's spans and counters in the Prometheus text format (see
+                 instrumentation.py, empty unless INSTRUMENTATION=on)
+
+Errors are returned as {"error": message} with status 400 (bad request, e.g. a
+timeout that is not a positive number or a use_cache that is not a boolean), 503 (overloaded),
+504 (reply timed out) or 500.
+
+Classes:
+---------
+SearchBatcher(max_batch_size: int = 64, max_wait_seconds: float = 0.005, max_queued_searches: int = 256)
+    - search(prompt, comments_to_return=5, where=None) -> (comments, replies)
+        Blocks until the batch holding the search is answered. Raises
+        ServiceOverloadedError when the queue is full.
+    - close() -> None
+    - stats -> dict with searches, batches, mean_batch_size, largest_batch and shed
+ReplyService(address, max_generations: int = 2, max_queued_replies: int = 16, **batcher_options)
+    - The HTTP server, `ThreadingHTTPServer` with one thread per connection.
+ServiceOverloadedError(RuntimeError)
+
+Functions:
+----------
+startReplyService(host: str = "127.0.0.1", port: int = 8000, warm: bool = True, **options) -> tuple[ReplyService, str]
+    - Loads the components (unless warm=False), starts the service on a background thread
+      and returns it with its base URL.
+
+Usage:
+------
+python src/reply_service.py [--host 127.0.0.1] [--port 8000] [--max-generations 2] [--max-wait-ms 5]
+
+Notes:
+-------
+- `max_generations` should match `OLLAMA_NUM_PARALLEL`, more generations in flight only
+  wait in Ollama's own queue.
+- Searches are grouped by `comments_to_return` and `where` within a batch, each group is
+  one batched call.
+"""
+
+
+# raised when a request is shed because too many are already waiting
+class ServiceOverloadedError(RuntimeError):
+    pass
+
+
+# coalesces searches that arrive close together into batched searches
+class SearchBatcher:
+
+    # max_batch_size == max searches answered by one batched call
+    # max_wait_seconds == how long the first search of a batch waits for others to join it
+    # max_queued_searches == searches allowed to wait, more are shed
+    def __init__(self, max_batch_size=64, max_wait_seconds=0.005, max_queued_searches=256):
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.stats = {"searches": 0, "batches": 0, "mean_batch_size": 0.0, "largest_batch": 0, "shed": 0}
+        self._queue = queue.Queue(maxsize=max_queued_searches)
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # search for one prompt, answered together with the searches that arrive at the same time
+    def search(self, prompt, comments_to_return=5, where=None):
+        if self._closed:
+            raise ServiceOverloadedError("Service is shutting down")
+        future = Future()
+        try:
+            self._queue.put_nowait((prompt, comments_to_return, where, future))
+        except queue.Full:
+            with self._stats_lock:
+                self.stats["shed"] += 1
+            raise ServiceOverloadedError("Too many searches waiting")
+        return future.result()
+
+    # wait for a first search, then collect the ones that arrive within max_wait_seconds
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            wait = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [search for search in self._collect() if search is not None]
+            if self._closed:
+                for search in batch:
+                    search[3].set_exception(ServiceOverloadedError("Service is shutting down"))
+                return
+
+            # one batched call per distinct (comments_to_return, where)
+            groups = {}
+            for search in batch:
+                groups.setdefault((search[1], json.dumps(search[2], sort_keys=True)), []).append(search)
+            for (comments_to_return, _), searches in groups.items():
+                try:
+                    results = getSemanticSearchResultsBatch([search[0] for search in searches], comments_to_return,
+                                                            where=searches[0][2])
+                    for search, result in zip(searches, results):
+                        search[3].set_result(result)
+                except Exception as error:
+                    for search in searches:
+                        search[3].set_exception(error)
+
+            with self._stats_lock:
+                self.stats["searches"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["mean_batch_size"] = self.stats["searches"] / self.stats["batches"]
+                self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+class ReplyServiceHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sendJSON(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._sendJSON(200, {"status": "ok"})
+        if self.path == "/stats":
+            return self._sendJSON(200, {"service": dict(self.server.stats), "search_batcher": dict(self.server.batcher.stats),
+                                        "components": config.registry.stats()})
+        if self.path == "/metrics":
+            body = instrumentation.prometheusText().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._sendJSON(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/search", "/reply"):
+            return self._sendJSON(404, {"error": "not found"})
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("body must be a JSON object")
+            prompt = request["prompt"]
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError("prompt must be a non-empty string")
+            comments_to_return = request.get("comments_to_return", 5)
+            if not isinstance(comments_to_return, int) or isinstance(comments_to_return, bool) or comments_to_return < 1:
+                raise ValueError("comments_to_return must be a positive integer")
+            if not isinstance(request.get("where"), (dict, type(None))):
+                raise ValueError("where must be a JSON object")
+            timeout = request.get("timeout")
+            if timeout is not None and (not isinstance(timeout, (int, float)) or isinstance(timeout, bool)
+                                        or not math.isfinite(timeout) or timeout <= 0):
+                raise ValueError("timeout must be a positive number of seconds or null")
+            if not isinstance(request.get("use_cache", True), bool):
+                raise ValueError("use_cache must be true or false")
+        except (KeyError, ValueError) as error:
+            return self._sendJSON(400, {"error": f"Bad request: {error}"})
+
+        start = time.perf_counter()
+        try:
+            if self.path == "/search":
+                payload = self._search(request)
+            else:
+                payload = self._reply(request)
+        except ServiceOverloadedError as error:
+            return self._sendJSON(503, {"error": str(error)}, {"Retry-After": "1"})
+        except GenerationTimeoutError as error:
+            return self._sendJSON(504, {"error": str(error)})
+        except Exception as error:
+            return self._sendJSON(500, {"error": f"{type(error).__name__}: {error}"})
+
+        payload["seconds"] = time.perf_counter() - start
+        self._sendJSON(200, payload)
+
+    def _search(self, request):
+        comments, replies = self.server.batcher.search(request["prompt"], request.get("comments_to_return", 5),
+                                                       request.get("where"))
+        self.server.count("searches")
+        return {"comments": comments, "replies": replies}
+
+    def _reply(self, request):
+        server = self.server
+        with server.waitingReply():
+            comments, replies = server.batcher.search(request["prompt"], request.get("comments_to_return", 5), request.get("where"))
+            server.generation_slots.acquire()
+
+        try:
+            stats = {}
+            reply = callLLM(comments, replies, request["prompt"], timeout=request.get("timeout"), stats=stats,
+                            use_cache=request.get("use_cache", True))
+        finally:
+            server.generation_slots.release()
+
+        server.count("replies")
+        return {"reply": reply, "comments": comments, "replies": replies, "cached": stats.get("cached", False)}
+
+
+class ReplyService(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # listen backlog, the default of 5 resets connections under a burst of clients before they can be shed
+    request_queue_size = 128
+
+    # max_generations == replies generated at the same time
+    # max_queued_replies == replies allowed to wait for retrieval or a generation slot, more are shed
+    # batcher_options == passed to SearchBatcher (max_batch_size, max_wait_seconds, max_queued_searches)
+    def __init__(self, address, max_generations=2, max_queued_replies=16, **batcher_options):
+        super().__init__(address, ReplyServiceHandler)
+        self.batcher = SearchBatcher(**batcher_options)
+        self.generation_slots = threading.Semaphore(max_generations)
+        self.max_queued_replies = max_queued_replies
+        self.waiting_replies = 0
+        self.stats = {"searches": 0, "replies": 0, "shed_replies": 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    # count a reply as waiting while it is inside the block, shedding it if too many are already waiting
+    @contextlib.contextmanager
+    def waitingReply(self):
+        with self.lock:
+            if self.waiting_replies >= self.max_queued_replies:
+                self.stats["shed_replies"] += 1
+                raise ServiceOverloadedError("Too many replies waiting")
+            self.waiting_replies += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.waiting_replies -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+# load the components, then start the service on a background thread
+# warm == False to load the components on the first request instead
+# options == passed to ReplyService (max_generations, max_queued_replies, max_batch_size, max_wait_seconds, ...)
+def startReplyService(host="127.0.0.1", port=8000, warm=True, **options):
+    if warm:
+        config.registry.warm("embedding_model", "embedding_cache", "vector_store", "retrieval_cache", "llm_client",
+                             "prompt_builder", "generation_cache")
+        # the first encode is slower (lazy initialisation in torch), pay for it before serving
+        config.embedding_model.encode(["warm up"])
+
+    server = ReplyService((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    def getArg(name, default, cast):
+        return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    server, url = startReplyService(host=getArg("--host", "127.0.0.1", str), port=getArg("--port", 8000, int),
+                                    max_generations=getArg("--max-generations", 2, int),
+                                    max_wait_seconds=getArg("--max-wait-ms", 5.0, float) / 1000)
+    print(f"Reply service listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.server_close()
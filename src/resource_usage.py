@@ -0,0 +1,60 @@
+import os
+import sys
+
+"""
+Resource Usage Helpers
+
+Small helpers for reporting the memory used by the current process. They are used
+to report the footprint of loaded components and the peak memory of pipeline runs.
+
+Functions:
+----------
+getCurrentRSS() -> int
+    - Returns the current resident set size of the process in bytes.
+getPeakRSS() -> int
+    - Returns the peak resident set size of the process in bytes.
+formatBytes(num_bytes: int) -> str
+    - Formats a byte count as a human readable string (e.g. "86.4 MB").
+
+Notes:
+-------
+- psutil is used when it is installed, otherwise /proc and the `resource` module are
+  used. On platforms where neither is available the functions return 0.
+"""
+
+
+# current resident set size in bytes
+def getCurrentRSS():
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    # linux fallback, second field of statm is the resident page count
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+# peak resident set size in bytes
+def getPeakRSS():
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, linux reports kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# format a byte count for printing
+def formatBytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
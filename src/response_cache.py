@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+"""
+YouTube API Response Cache
+
+This module stores raw YouTube Data API responses on disk so that unchanged pages do
+not have to be requested again. Responses are content-addressed by a hash of the
+request (method, video ID, page token and the other request parameters) and are
+saved as gzip-compressed JSON.
+
+Modes:
+-------
+- "off"    : the cache is bypassed.
+- "record" : fresh cached responses are served, anything missing or older than the TTL
+             is requested from the API and saved.
+- "replay" : every response must come from the cache (the TTL is ignored), a missing
+             response raises `CacheMissError`. No API client or network is needed,
+             which makes ingest runs repeatable offline.
+
+Class:
+-------
+ResponseCache(path: str = "./api_cache", mode: str = "record", ttl_seconds: float | None = 86400)
+    - get(params, ttl_seconds=None) -> dict | None
+        Returns the cached response for a request, or None if it is missing or stale.
+        `ttl_seconds` overrides the cache's TTL for this lookup (0 never serves it in
+        record mode).
+    - put(params, response) -> None
+        Saves a response.
+    - fetch(params, request_function, ttl_seconds=None) -> dict
+        Returns the cached response or calls `request_function()` and saves its result,
+        following the cache mode. `ttl_seconds` overrides the TTL as in `get`, so
+        requests whose answer changes all the time (the newest comments of a video)
+        still reach the API while recording, and are still saved for replays.
+    - stats -> dict with hit, miss and write counts
+
+Artifacts:
+-----------
+- <path>/<first two hash characters>/<hash>.json.gz for every cached response
+"""
+
+CACHE_MODES = ("off", "record", "replay")
+
+
+# raised in replay mode when a response was never recorded
+class CacheMissError(Exception):
+    pass
+
+
+class ResponseCache:
+
+    def __init__(self, path="./api_cache", mode="record", ttl_seconds=86400):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+
+    # hash of the request parameters, independent of their order
+    def key(self, params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json.gz")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    # cached response for a request, None if missing or older than the ttl
+    # ttl_seconds == overrides the cache's ttl for this lookup
+    def get(self, params, ttl_seconds=None):
+        try:
+            with gzip.open(self._file(self.key(params)), "rt", encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        # recorded fixtures never expire in replay mode
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if self.mode != "replay" and ttl_seconds is not None and time.time() - entry["stored_at"] >= ttl_seconds:
+            return None
+
+        return entry["response"]
+
+    # save a response, written to a temporary file first so readers never see half a file
+    def put(self, params, response):
+        cache_file = self._file(self.key(params))
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+        entry = {"stored_at": time.time(), "params": params, "response": response}
+        descriptor, temporary_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as raw_file, gzip.open(raw_file, "wt", encoding="utf-8") as compressed_file:
+            json.dump(entry, compressed_file)
+        os.replace(temporary_file, cache_file)
+
+        self._count("writes")
+
+    # serve a request from the cache, calling request_function() for anything missing (unless replaying)
+    def fetch(self, params, request_function, ttl_seconds=None):
+        if self.mode == "off":
+            return request_function()
+
+        response = self.get(params, ttl_seconds)
+        if response is not None:
+            self._count("hits")
+            return response
+
+        self._count("misses")
+        if self.mode == "replay":
+            raise CacheMissError(f"No recorded response for {params}")
+
+        response = request_function()
+        self.put(params, response)
+        return response
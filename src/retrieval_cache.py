@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import normalizeText
+
+"""
+Retrieval Cache
+
+This module keeps the results of recent semantic searches in memory so identical or
+nearly identical prompts ("what's the 0-60?", "Whats the 0-60") are answered without
+going back to the embedding model and Chroma.
+
+The cache has two layers:
+
+1. Exact - keyed by the normalized prompt (case, Unicode form and spacing ignored), the
+   number of results and the search's metadata filter (`scope`). A hit skips encoding and the Chroma query. Case can be
+   ignored because all-MiniLM-L6-v2 is uncased, it never changes the embedding.
+2. Similar - keyed by the prompt embedding. After a prompt is encoded, the stored
+   result whose query embedding has the highest cosine similarity is reused if the
+   similarity is at least `similarity_threshold`. A hit skips the Chroma query.
+
+Entries are evicted least recently used first once there are `max_entries` of them,
+and expire `ttl_seconds` after they were stored. Any write to the collection must call
+`invalidate()` (`writeToVectorDB` does), since the stored results may no longer be
+the nearest neighbours. Writes made by another process are noticed through the store
+version file, which every search checks first (see store_version.py and
+semantic_search.py).
+
+Class:
+-------
+RetrievalCache(max_entries: int = 10000, ttl_seconds: float | None = 3600, similarity_threshold: float = 0.97)
+    - lookupPrompt(prompt, comments_to_return, scope=None) -> result | None
+        Exact layer lookup.
+    - lookupEmbedding(embedding, comments_to_return, scope=None) -> result | None
+        Similar layer lookup.
+    - put(prompt, embedding, comments_to_return, result, generation, scope=None) -> None
+        Stores a result, unless the cache was invalidated since `generation` was read.
+    `scope` is any hashable description of the filter the search used (e.g. its `where`
+    serialized to JSON), results are only reused for searches with the same scope.
+    - invalidate() -> None
+        Drops every entry.
+    - count() -> int
+    - generation -> int, incremented by every `invalidate()`
+    - stats -> dict with exact_hits, similar_hits, misses, hit_rate, evictions and invalidations
+
+Notes:
+-------
+- `max_entries` = 0 disables the cache, `similarity_threshold` > 1 disables the similar layer.
+- Results are copied in and out, so callers can modify the lists they get back.
+"""
+
+
+# copy of a (comments, replies) result so cached results never change
+def _copyResult(result):
+    comments, replies = result
+    return list(comments), [list(reply) for reply in replies]
+
+
+class RetrievalCache:
+
+    # max_entries == max cached results, the least recently used one is evicted first
+    # ttl_seconds == how long a result stays valid (None never expires)
+    # similarity_threshold == min cosine similarity between two prompt embeddings to reuse a result
+    def __init__(self, max_entries=10000, ttl_seconds=3600, similarity_threshold=0.97):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.generation = 0
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "hit_rate": 0.0, "evictions": 0, "invalidations": 0}
+
+        # (normalized prompt, comments_to_return, scope) -> {"result", "stored_at", "slot"}, in least recently used order
+        self._entries = OrderedDict()
+        # unit length query embeddings, one row (slot) per entry
+        self._embeddings = None
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        # slots at or above this were never used since the last invalidate(), so lookups skip them
+        self._slots_in_use = 0
+        self._lock = threading.Lock()
+
+    def _key(self, prompt, comments_to_return, scope):
+        return normalizeText(prompt).lower(), comments_to_return, scope
+
+    def _count(self, name):
+        self.stats[name] += 1
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"]
+        self.stats["hit_rate"] = hits / max(hits + self.stats["misses"], 1)
+
+    def _expired(self, entry):
+        return self.ttl_seconds is not None and time.time() - entry["stored_at"] > self.ttl_seconds
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._slot_keys[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+
+    # cached result for the exact (normalized) prompt
+    def lookupPrompt(self, prompt, comments_to_return, scope=None):
+        if not self.max_entries:
+            return None
+
+        key = self._key(prompt, comments_to_return, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            self._count("exact_hits")
+            return _copyResult(entry["result"])
+
+    # cached result of the most similar earlier prompt, if it is similar enough
+    # counts a miss when nothing is found, so call it once per prompt that missed the exact layer
+    def lookupEmbedding(self, embedding, comments_to_return, scope=None):
+        if not self.max_entries:
+            return None
+
+        with self._lock:
+            if self.similarity_threshold <= 1 and self._entries:
+                embedding = np.asarray(embedding, dtype=np.float32)
+                similarities = self._embeddings[:self._slots_in_use] @ (embedding / max(np.linalg.norm(embedding), 1e-12))
+
+                # most similar first, only live entries with the same number of results and scope
+                candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+                for slot in candidates[np.argsort(-similarities[candidates])]:
+                    key = self._slot_keys[slot]
+                    if key is None or key[1:] != (comments_to_return, scope):
+                        continue
+                    if self._expired(self._entries[key]):
+                        self._remove(key)
+                        continue
+
+                    self._entries.move_to_end(key)
+                    self._count("similar_hits")
+                    return _copyResult(self._entries[key]["result"])
+
+            self._count("misses")
+            return None
+
+    # store the result of a search
+    # generation == value of self.generation read before the search, results from before an invalidate() are dropped
+    def put(self, prompt, embedding, comments_to_return, result, generation, scope=None):
+        if not self.max_entries:
+            return
+
+        key = self._key(prompt, comments_to_return, scope)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if generation != self.generation:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            slot = self._free_slots.pop()
+            self._slots_in_use = max(self._slots_in_use, slot + 1)
+            self._embeddings[slot] = embedding / max(np.linalg.norm(embedding), 1e-12)
+            self._slot_keys[slot] = key
+            self._entries[key] = {"result": _copyResult(result), "stored_at": time.time(), "slot": slot}
+
+    # drop every cached result (called whenever the collection changes)
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._slot_keys = [None] * self.max_entries
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            self._slots_in_use = 0
+
+    # number of cached results
+    def count(self):
+        return len(self._entries)
@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+"""
+Scrape State Store
+
+This module keeps track of how far the scraper got on each video so that a crash or
+a used-up quota does not lose the work already done. It stores a cursor per video in
+a small SQLite database and appends every page of comment–reply pairs to a JSON lines
+file per video as soon as the page arrives.
+
+Class:
+-------
+ScrapeStateStore(path: str = "./scrape_state")
+    - getCursor(video) -> dict | None
+        Returns the saved cursor for a video (page token, fetch time, pair count,
+        pages fetched, completion flag and newest comment time) or None.
+    - savePage(video, pairs, page_token, completed, newest_published_at) -> None
+        Appends the page's pairs to the video's file and advances its cursor.
+    - loadPairs(video) -> list[dict]
+        Returns every pair saved for a video.
+    - reset(video=None) -> None
+        Forgets the cursor and saved pairs for one video (or all videos).
+
+Artifacts:
+-----------
+- <path>/state.sqlite3 with one `video_cursors` row per video
+- <path>/pages/<video id>.jsonl with the comment–reply pairs fetched so far
+
+Notes:
+-------
+- Pairs are written before the cursor is advanced. If the process dies between the
+  two, the page is fetched again on the next run and its pairs appear twice in the
+  file, which `cleanData` removes as duplicates.
+"""
+
+
+class ScrapeStateStore:
+
+    def __init__(self, path="./scrape_state"):
+        self.path = path
+        self.pages_path = os.path.join(path, "pages")
+        os.makedirs(self.pages_path, exist_ok=True)
+
+        # one connection shared by the fetch threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "state.sqlite3"), check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS video_cursors (
+                video_id TEXT PRIMARY KEY,
+                page_token TEXT,
+                fetched_at TEXT,
+                pair_count INTEGER NOT NULL DEFAULT 0,
+                pages INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                newest_published_at TEXT
+            )
+        """)
+        self._connection.commit()
+
+    def _pagesFile(self, video):
+        return os.path.join(self.pages_path, f"{video}.jsonl")
+
+    # saved cursor for a video, None if the video was never fetched
+    def getCursor(self, video):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_token, fetched_at, pair_count, pages, completed, newest_published_at FROM video_cursors WHERE video_id = ?",
+                (video,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "page_token": row[0],
+            "fetched_at": row[1],
+            "pair_count": row[2],
+            "pages": row[3],
+            "completed": bool(row[4]),
+            "newest_published_at": row[5],
+        }
+
+    # flush a page of pairs to disk and advance the video's cursor
+    # page_token == token of the next page to fetch (None once there are no more pages)
+    # completed == True once the video has been fully fetched
+    # newest_published_at == time of the newest comment seen so far (used by refreshes)
+    def savePage(self, video, pairs, page_token, completed, newest_published_at=None):
+        with self._lock:
+            with open(self._pagesFile(video), "a", encoding="utf-8") as pages_file:
+                for pair in pairs:
+                    pages_file.write(json.dumps(pair) + "\n")
+                pages_file.flush()
+                os.fsync(pages_file.fileno())
+
+            self._connection.execute("""
+                INSERT INTO video_cursors (video_id, page_token, fetched_at, pair_count, pages, completed, newest_published_at)
+                VALUES (?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    page_token = excluded.page_token,
+                    fetched_at = excluded.fetched_at,
+                    pair_count = pair_count + excluded.pair_count,
+                    pages = pages + 1,
+                    completed = excluded.completed,
+                    newest_published_at = MAX(COALESCE(newest_published_at, ''), COALESCE(excluded.newest_published_at, ''))
+            """, (video, page_token, datetime.now(timezone.utc).isoformat(), len(pairs), int(completed), newest_published_at))
+            self._connection.commit()
+
+    # every pair saved for a video
+    def loadPairs(self, video):
+        if not os.path.exists(self._pagesFile(video)):
+            return []
+
+        with open(self._pagesFile(video), encoding="utf-8") as pages_file:
+            return [json.loads(line) for line in pages_file if line.strip()]
+
+    # forget the cursor and pairs of one video, or of every video
+    def reset(self, video=None):
+        with self._lock:
+            if video is None:
+                self._connection.execute("DELETE FROM video_cursors")
+                videos = [name[:-len(".jsonl")] for name in os.listdir(self.pages_path) if name.endswith(".jsonl")]
+            else:
+                self._connection.execute("DELETE FROM video_cursors WHERE video_id = ?", (video,))
+                videos = [video]
+            self._connection.commit()
+
+            for name in videos:
+                if os.path.exists(self._pagesFile(name)):
+                    os.remove(self._pagesFile(name))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,4 +1,9 @@
-from config import collection, embedding_model
+import json
+import threading
+
+import config
+import instrumentation
+from store_version import readStoreVersion
 
 """
 Semantic Search
@@ -10,18 +15,65 @@ stored comments and their corresponding replies.
 
 Function:
 ----------
-getSemanticSearchResults(user_prompt: str, comments_to_return: int = 5) -> tuple[list[str], list[list[str]]]
-    - Encodes the user prompt using the preloaded sentence embedding model.
-    - Queries the Chroma database for the top-N most similar comment–reply pairs using
-      cosine similarity.
+getSemanticSearchResults(user_prompt: str, comments_to_return: int = 5, where: dict | None = None)
+    -> tuple[list[str], list[list[str]]]
+    - Returns the cached results if the same prompt (ignoring case and spacing), or one
+      with a nearly identical embedding, was searched since the collection last changed
+      (see retrieval_cache.py).
+    - Encodes the user prompt using the shared sentence embedding model, through the
+      persistent embedding cache (prompts already in it are not encoded again, new
+      prompts are not added to it).
+    - Queries the vector store (the Chroma database by default) for the top-N most
+      similar comment–reply pairs, by the distance of its index (cosine for collections
+      created by config.py, l2 for the shipped one, both rank unit length embeddings
+      the same way).
     - Returns lists of retrieved comments and their associated replies.
 
+getSemanticSearchResultsBatch(user_prompts: list[str], comments_to_return: int = 5, query_batch_size: int = 256,
+                              where: dict | None = None) -> list[tuple[list[str], list[list[str]]]]
+    - Batch version of `getSemanticSearchResults` for answering many comments at once.
+    - Encodes all prompts in one batched call and sends one multi-embedding query to
+      the vector store per `query_batch_size` prompts, instead of one encode and one
+      query per prompt. Prompts found in the retrieval cache are skipped.
+    - Returns one (comments, replies) tuple per prompt, in the order of `user_prompts`.
+
+getLexicalSearchResults(user_prompt: str, comments_to_return: int = 5) -> tuple[list[str], list[list[str]]]
+    - Keyword search with the BM25 lexical index (see lexical_index.py). Needs no
+      embedding model, so it is the fast path for a process that has not loaded it
+      (or for prompts like "K20C1" or "LSD" that are all keywords).
+    - Returns an empty result if no stored comment shares a word with the prompt.
+
+getHybridSearchResults(user_prompt: str, comments_to_return: int = 5, candidates: int = 50, rrf_k: int = 60,
+                       where: dict | None = None) -> tuple[list[str], list[list[str]]]
+    - Takes the top `candidates` of both the dense and the lexical search and fuses the
+      two rankings with reciprocal rank fusion: every comment scores
+      sum(1 / (rrf_k + rank)) over the rankings it appears in.
+    - With `where`, keyword hits that don't match the filter are dropped before fusing.
+
+Every search first checks the store version file (see store_version.py). When another
+process wrote to the stores since the last search, the retrieval cache is dropped and
+the lexical index and vector store pick up the new rows before the search runs.
+
 Parameters:
 ------------
 user_prompt : str
     The input comment or query from the user to use for semantic search.
 comments_to_return : int, optional (default = 5)
     The number of most relevant comment–reply pairs to return.
+user_prompts : list[str]
+    The input comments or queries to search for in one batch.
+query_batch_size : int, optional (default = 256)
+    The max number of prompts sent to the vector store in a single query.
+where : dict, optional (default = None)
+    Only return comments whose metadata matches this Chroma style filter, e.g.
+    {"channel_id": "UC..."} or {"$and": [{"video_id": "..."}, {"published_at": {"$gte": 1704067200}}]}.
+    Stored metadata: video_id, channel_id, published_at (Unix timestamp), like_count and
+    reply_like_count (see upload_vector_db.py). With a sharded vector store, filtering on
+    the shard key only searches the matching shards.
+candidates : int, optional (default = 50)
+    The number of results taken from each ranking before fusing them.
+rrf_k : int, optional (default = 60)
+    Damps the weight of the top ranks in reciprocal rank fusion.
 
 Returns:
 ---------
@@ -33,29 +85,188 @@ tuple[list[str], list[list[str]]]
 
 Dependencies:
 --------------
-- src.config (for the initialized `collection` and `embedding_model`)
+- src.config (for the lazily built `vector_store`, `embedding_model`, `embedding_cache`, `retrieval_cache`
+  and `lexical_index`)
+- src.instrumentation (query latency per search mode, when enabled)
+- src.store_version (writes made by other processes)
 - ChromaDB
 - sentence-transformers
 """
 
+# convert the results of the i-th query embedding to lists of comments and replies
+def _parseResults(semantic_search_results, i):
+
+    # get the comments 
+    comments = semantic_search_results['documents'][i]
+
+    # get replies
+    replies = semantic_search_results['metadatas'][i]
+    # convert the list of dictionaries to a list of the replies (other metadata such as the content hash is dropped)
+    replies = [[reply["reply"]] for reply in replies]
+
+    return comments, replies
+
+
+# store version seen by the last search of this process
+_seen_version = None
+_sync_lock = threading.Lock()
+
+
+# pick up writes made by other processes (e.g. an ingest run next to the reply service) since the last search
+# the version file only changes when the stores are written to, so this is usually one small file read
+def _syncWithStores():
+    global _seen_version
+    version = readStoreVersion(config.STORE_VERSION_PATH)
+    if version == _seen_version:
+        return
+
+    with _sync_lock:
+        if version == _seen_version:
+            return
+        if config.registry.isLoaded("retrieval_cache"):
+            config.retrieval_cache.invalidate()
+        if config.registry.isLoaded("lexical_index"):
+            config.lexical_index.reload()
+        if config.registry.isLoaded("vector_store"):
+            config.vector_store.refresh()
+        _seen_version = version
+
+
+# retrieval cache scope of a where filter (searches with different filters never share results)
+def _scope(where):
+    return json.dumps(where, sort_keys=True) if where else None
+
+
 # function to embed the prompt and perform semantic search on vector database (retrieval)
 # user_prompt == prompt from user
 # comments_to_return == number of comments to return from semantic search
-def getSemanticSearchResults(user_prompt, comments_to_return=5):
+# where == optional metadata filter, e.g. {"channel_id": "UC..."}
+def getSemanticSearchResults(user_prompt, comments_to_return=5, where=None):
+    instrumentation.count("search_prompts_total", mode="semantic")
+    _syncWithStores()
+    with instrumentation.span("search", mode="semantic") as span:
+        # a prompt asked before (ignoring case and spacing) is answered from the retrieval cache without encoding it
+        retrieval_cache = config.retrieval_cache
+        generation = retrieval_cache.generation
+        scope = _scope(where)
+        cached = retrieval_cache.lookupPrompt(user_prompt, comments_to_return, scope)
+        if cached is not None:
+            span.set(cached=True)
+            return cached
 
-    # encode the prompt
-    promptEncoded = embedding_model.encode(user_prompt)
+        # encode the prompt (a prompt that was seen before comes straight from the embedding cache)
+        # prompts are not added to the persistent cache, most are only ever asked once
+        promptEncoded = config.embedding_cache.encode(user_prompt, cache=False)
 
-    # search the database using the encoded query and get 5 most related comment-reply pairs
-    # distance metric is cosine similarity by default, need to set it when I set up the collection
-    semantic_search_results = collection.query(query_embeddings=promptEncoded, n_results=comments_to_return)
+        # a nearly identical earlier prompt can reuse its results without querying the database
+        results = retrieval_cache.lookupEmbedding(promptEncoded, comments_to_return, scope)
+        span.set(cached=results is not None)
+        if results is None:
+            # search the database using the encoded query and get 5 most related comment-reply pairs
+            # distance metric is the one the collection was created with (cosine for new ones, see config.py)
+            # the shipped collection is l2, which ranks the unit length MiniLM embeddings the same way
+            with instrumentation.span("vector_query"):
+                semantic_search_results = config.vector_store.query(query_embeddings=promptEncoded, n_results=comments_to_return,
+                                                                    where=where)
+            results = _parseResults(semantic_search_results, 0)
 
-    # get the comments 
-    comments = semantic_search_results['documents'][0]
+        retrieval_cache.put(user_prompt, promptEncoded, comments_to_return, results, generation, scope)
+        return results
 
-    # get replies
-    replies = semantic_search_results['metadatas'][0]
-    # convert the list of dictionaries to a list of the replies (replies are dictionary values)
-    replies = [list(reply.values()) for reply in replies]
 
-    return comments, replies
+# function to perform semantic search for many prompts at once
+# user_prompts == list of prompts
+# comments_to_return == number of comments to return for each prompt
+# query_batch_size == max prompts per vector store query
+# where == optional metadata filter applied to every prompt
+def getSemanticSearchResultsBatch(user_prompts, comments_to_return=5, query_batch_size=256, where=None):
+    user_prompts = list(user_prompts)
+    instrumentation.count("search_prompts_total", len(user_prompts), mode="semantic_batch")
+    _syncWithStores()
+    with instrumentation.span("search", mode="semantic_batch") as span:
+        retrieval_cache = config.retrieval_cache
+        generation = retrieval_cache.generation
+        scope = _scope(where)
+
+        # prompts asked before are answered from the retrieval cache, only the rest are encoded
+        results = [retrieval_cache.lookupPrompt(prompt, comments_to_return, scope) for prompt in user_prompts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        span.set(prompts=len(user_prompts), cached=len(user_prompts) - len(missing))
+        if not missing:
+            return results
+
+        # encode every remaining prompt in one batched call (repeated prompts are only encoded once)
+        promptsEncoded = config.embedding_cache.encode([user_prompts[i] for i in missing], cache=False)
+
+        # prompts nearly identical to an earlier one reuse its results, the rest are queried
+        for j, i in enumerate(missing):
+            results[i] = retrieval_cache.lookupEmbedding(promptsEncoded[j], comments_to_return, scope)
+        to_query = [j for j, i in enumerate(missing) if results[i] is None]
+
+        for start in range(0, len(to_query), query_batch_size):
+            chunk = to_query[start:start + query_batch_size]
+            # one query for the whole chunk, the store returns one result list per query embedding
+            with instrumentation.span("vector_query"):
+                semantic_search_results = config.vector_store.query(query_embeddings=promptsEncoded[chunk],
+                                                                    n_results=comments_to_return, where=where)
+            for k, j in enumerate(chunk):
+                results[missing[j]] = _parseResults(semantic_search_results, k)
+
+        for j, i in enumerate(missing):
+            retrieval_cache.put(user_prompts[i], promptsEncoded[j], comments_to_return, results[i], generation, scope)
+
+        return results
+
+
+# comment and metadata of every stored row among `ids` that matches `where`
+def _fetchStored(ids, where=None):
+    if not ids:
+        return {}
+
+    stored = config.vector_store.get(ids=ids, include=["documents", "metadatas"], where=where)
+    return {row_id: (document, metadata) for row_id, document, metadata in zip(stored['ids'], stored['documents'], stored['metadatas'])}
+
+
+# comments and replies of stored rows, in the order of `ids` (ids that are not stored are skipped)
+def _fetchPairs(ids):
+    pairs = _fetchStored(ids)
+    found = [pairs[row_id] for row_id in ids if row_id in pairs]
+    return [document for document, _ in found], [[metadata["reply"]] for _, metadata in found]
+
+
+# function to perform keyword (bm25) search, no embedding model needed
+# user_prompt == prompt from user
+# comments_to_return == number of comments to return
+def getLexicalSearchResults(user_prompt, comments_to_return=5):
+    instrumentation.count("search_prompts_total", mode="lexical")
+    _syncWithStores()
+    with instrumentation.span("search", mode="lexical"):
+        hits = config.lexical_index.search(user_prompt, n_results=comments_to_return)
+        return _fetchPairs([row_id for row_id, _ in hits])
+
+
+# function to perform hybrid search, fusing the dense and lexical rankings with reciprocal rank fusion
+# user_prompt == prompt from user
+# comments_to_return == number of comments to return
+# candidates == results taken from each ranking before fusing
+# rrf_k == constant of reciprocal rank fusion, higher values flatten the difference between top ranks
+# where == optional metadata filter, applied to both rankings
+def getHybridSearchResults(user_prompt, comments_to_return=5, candidates=50, rrf_k=60, where=None):
+    instrumentation.count("search_prompts_total", mode="hybrid")
+    _syncWithStores()
+    with instrumentation.span("search", mode="hybrid"):
+        promptEncoded = config.embedding_cache.encode(user_prompt, cache=False)
+        dense = config.vector_store.query(query_embeddings=promptEncoded, n_results=candidates, where=where)
+        lexical = [row_id for row_id, _ in config.lexical_index.search(user_prompt, n_results=candidates)]
+
+        # dense hits already came back with their comment and reply, lexical-only hits are fetched (and filtered)
+        pairs = {row_id: (document, metadata) for row_id, document, metadata in zip(dense['ids'][0], dense['documents'][0], dense['metadatas'][0])}
+        pairs.update(_fetchStored([row_id for row_id in lexical if row_id not in pairs], where))
+
+        fused = {}
+        for ranking in [dense['ids'][0], [row_id for row_id in lexical if row_id in pairs]]:
+            for rank, row_id in enumerate(ranking):
+                fused[row_id] = fused.get(row_id, 0.0) + 1 / (rrf_k + rank + 1)
+        best = sorted(fused, key=fused.get, reverse=True)[:comments_to_return]
+
+        return [pairs[row_id][0] for row_id in best], [[pairs[row_id][1]["reply"]] for row_id in best]
@@ -0,0 +1,47 @@
+import os
+import uuid
+
+"""
+Store Version
+
+This module keeps a small version file next to the stores so that processes sharing
+them notice each other's writes. Every write to the vector store or the lexical index
+(`writeToVectorDB`, `migrateLegacyRows`) replaces the file with a new random token.
+Searches read the token first (one small file read) and, when it changed since the
+last search of the process, drop the retrieval cache and reload the lexical index and
+the memmap row counts before answering (see semantic_search.py). A long-lived reply
+service therefore sees comments ingested by another process on its next search,
+instead of serving results cached before them for up to the retrieval cache's TTL.
+
+Functions:
+-----------
+readStoreVersion(path: str) -> str | None
+    - The current token, None if nothing was written since the file was created.
+bumpStoreVersion(path: str) -> str
+    - Writes a new token and returns it.
+
+Artifacts:
+-----------
+- <path>    the token, replaced in one step (written next to it and renamed over it)
+"""
+
+
+def readStoreVersion(path):
+    try:
+        with open(path, encoding="utf-8") as version_file:
+            return version_file.read()
+    except FileNotFoundError:
+        return None
+
+
+# a random token rather than a counter, so two processes writing at the same time can't end up with the same version
+def bumpStoreVersion(path):
+    version = uuid.uuid4().hex
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as version_file:
+        version_file.write(version)
+    os.replace(temporary_path, path)
+    return version
@@ -1,5 +1,11 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
+import hashlib
+from datetime import datetime
+
+import pandas as pd
+
+import config
+import instrumentation
+from store_version import bumpStoreVersion
 
 """
 Vector Database Upload Script
@@ -9,14 +15,45 @@ data into a persistent Chroma vector database. It uses a pretrained sentence emb
 model to convert comments into vector representations and stores their corresponding
 replies as metadata for future retrieval and semantic search.
 
-Function:
+Functions:
 ----------
-uploadToVectorDB(df: pandas.DataFrame) -> None
-    - Initializes a persistent Chroma database and creates or retrieves a collection.
-    - Loads the 'all-MiniLM-L6-v2' model from Hugging Face for sentence embeddings.
-    - Extracts comments and replies from the input DataFrame.
-    - Encodes comments into embeddings for storage.
-    - Uploads embedded comments and reply metadata into the Chroma collection.
+makeRowId(comment: str, reply: str, video_id: str | None = None, comment_id: str | None = None) -> str
+    - Returns a stable id for a pair: "<video id>:<comment id>" when both are known,
+      otherwise "text:<sha1 of the normalized comment and reply>".
+
+findNewRows(df: pandas.DataFrame) -> pandas.DataFrame
+    - Assigns stable ids and content hashes, then looks the ids up in the vector store in
+      bulk and keeps only rows that are missing or whose text changed.
+
+encodeComments(comments: list[str]) -> numpy.ndarray
+    - Embeds comments with the shared embedding model, through the persistent embedding
+      cache so previously embedded texts are not encoded again. Cache misses go to the
+      length-bucketed `batch_encoder`.
+
+rowMetadata(row: dict) -> dict
+    - The metadata stored with a row: its reply and content hash, plus whichever of
+      video_id, channel_id, published_at, like_count and reply_like_count the row has.
+      published_at is stored as a Unix timestamp so searches can filter on time ranges.
+
+migrateLegacyRows() -> int
+    - Re-keys rows stored by the first version of this script, under the numeric ids
+      "0", "1", ..., with stable ids (see `makeRowId`), then deletes the numeric ids.
+      Returns the number of legacy rows found (0 once the store has been migrated).
+      Called by `uploadToVectorDB` and the ingest pipeline before they write anything.
+
+writeToVectorDB(df: pandas.DataFrame, encoded_comments) -> None
+    - Upserts already embedded rows (from `findNewRows`) into the shared vector store with
+      their metadata (see `rowMetadata`), indexes the comments in the BM25 lexical index,
+      then invalidates the retrieval cache and bumps the store version so other
+      processes searching the same stores notice the write (see store_version.py).
+
+uploadToVectorDB(df: pandas.DataFrame) -> int
+    - Uses the shared vector store (the Chroma collection by default) and
+      'all-MiniLM-L6-v2' embedding model from `config`, which are loaded once per
+      process and reused across calls.
+    - Skips rows that are already stored unchanged, so only new or changed comments
+      are encoded.
+    - Upserts the embedded comments and reply metadata into the vector store.
 
 Parameters:
 ------------
@@ -26,11 +63,13 @@ df : pandas.DataFrame
 
 Returns:
 ---------
-None
-    The function does not return a value. It adds data directly to the Chroma database.
+int
+    The number of rows that were encoded and written (0 if everything was already stored).
 
 Dependencies:
 --------------
+- src.config (for the shared `vector_store`, `embedding_model`, `embedding_cache` and `lexical_index`)
+- src.instrumentation (upsert time and rows, when enabled)
 - pandas
 - chromadb
 - sentence-transformers
@@ -39,22 +78,174 @@ Artifacts:
 -----------
 - A persistent Chroma database stored at ./youtube_comment_database
 - A collection named "youtube_comments" containing comment embeddings and reply metadata
+  (or ./vector_store when `VECTOR_STORE=memmap`, see vector_store.py)
+- A BM25 index of the comments at ./lexical_index (unless `LEXICAL_INDEX=off`)
+- The store version file at ./store_version
+
+Notes:
+-------
+- Because ids are stable, running the upload again on the same or overlapping data
+  never creates duplicate rows, and a refresh only pays for the new comments.
+- Stores written before ids were stable (like the shipped youtube_comment_database)
+  hold rows under "0", "1", ... that no stable id matches. They are migrated the first
+  time something is uploaded. Otherwise every comment would be stored twice and every
+  search would return each match twice.
+- Rows whose text did not change are skipped, so their like counts stay the ones from
+  when they were first stored.
 """
 
+# max ids per collection.get call when checking for rows that are already stored
+LOOKUP_BATCH_SIZE = 1000
+# scraper fields stored as metadata when a row has them, so searches can be filtered on them
+METADATA_COLUMNS = ["video_id", "channel_id", "published_at", "like_count", "reply_like_count"]
+
+
+# hash of a pair's text, used to tell if a stored row has changed
+def contentHash(comment, reply):
+    return hashlib.sha1(f"{comment}\x1f{reply}".encode("utf-8")).hexdigest()
+
+
+# stable id for a comment-reply pair
+# video id + comment id when the scraper provided them, otherwise a hash of the normalized text
+def makeRowId(comment, reply, video_id=None, comment_id=None):
+    if video_id and comment_id:
+        return f"{video_id}:{comment_id}"
+
+    normalized = " ".join(f"{comment}\x1f{reply}".lower().split())
+    return "text:" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+# add "id" and "content_hash" columns to a cleaned dataframe and keep one row per id
+def assignRowIds(df):
+    df = df.copy()
+    video_ids = df["video_id"] if "video_id" in df else [None] * len(df)
+    comment_ids = df["comment_id"] if "comment_id" in df else [None] * len(df)
+
+    df["id"] = [makeRowId(comment, reply, video_id if isinstance(video_id, str) else None, comment_id if isinstance(comment_id, str) else None)
+                for comment, reply, video_id, comment_id in zip(df["comment"], df["reply"], video_ids, comment_ids)]
+    df["content_hash"] = [contentHash(comment, reply) for comment, reply in zip(df["comment"], df["reply"])]
+
+    # the latest version of a row wins if it shows up twice
+    return df.drop_duplicates(subset="id", keep="last")
+
+
+# keep only the rows that are not in the collection yet, or whose text changed since they were stored
+# existing rows are looked up in bulk before anything is encoded
+def findNewRows(df):
+    df = assignRowIds(df)
+    ids = df["id"].to_list()
+
+    stored_hashes = {}
+    for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        existing = config.vector_store.get(ids=ids[i:i + LOOKUP_BATCH_SIZE], include=["metadatas"])
+        for row_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            stored_hashes[row_id] = (metadata or {}).get("content_hash")
+
+    return df[[stored_hashes.get(row_id) != row_hash for row_id, row_hash in zip(df["id"], df["content_hash"])]]
+
+
+# ids of the rows stored by the first version of the upload script, numbered "0", "1", ... in upload order
+# stable ids always hold a ":", so they never look like these
+def findLegacyIds():
+    if not config.vector_store.get(ids=["0"], include=[])["ids"]:
+        return []
+
+    legacy_ids = []
+    start = 0
+    while True:
+        found = config.vector_store.get(ids=[str(i) for i in range(start, start + LOOKUP_BATCH_SIZE)], include=[])["ids"]
+        if not found:
+            return legacy_ids
+        legacy_ids += found
+        start += LOOKUP_BATCH_SIZE
+
+
+# store the rows kept under legacy numeric ids again under stable ids, then delete the numeric ids
+# a migration that stops half way is finished by the next call, the rows already re-keyed are skipped
+def migrateLegacyRows():
+    legacy_ids = findLegacyIds()
+    if not legacy_ids:
+        return 0
+
+    rows = []
+    for i in range(0, len(legacy_ids), LOOKUP_BATCH_SIZE):
+        stored = config.vector_store.get(ids=legacy_ids[i:i + LOOKUP_BATCH_SIZE], include=["documents", "metadatas"])
+        rows += [{"comment": document, "reply": (metadata or {}).get("reply", "")}
+                 for document, metadata in zip(stored["documents"], stored["metadatas"])]
+
+    new_rows = findNewRows(pd.DataFrame(rows, columns=["comment", "reply"]))
+    if not new_rows.empty:
+        writeToVectorDB(new_rows, encodeComments(new_rows["comment"].to_list()))
+
+    config.vector_store.delete(ids=legacy_ids)
+    if config.LEXICAL_INDEX_ENABLED:
+        config.lexical_index.delete(legacy_ids)
+    if config.registry.isLoaded("retrieval_cache"):
+        config.retrieval_cache.invalidate()
+    bumpStoreVersion(config.STORE_VERSION_PATH)
+    print(f"migrated {len(legacy_ids)} rows stored under legacy numeric ids to stable ids")
+    return len(legacy_ids)
+
+
+# embed a list of comments with the shared embedding model
+# goes through the embedding cache, so only comments that were never embedded before reach the model
+def encodeComments(comments):
+    return config.embedding_cache.encode(comments)
+
+
+# metadata stored with a row: reply and content hash, plus the scraper fields the row has
+# chroma metadata values can't be None, so missing fields are left out
+def rowMetadata(row):
+    metadata = {"reply": row["reply"], "content_hash": row["content_hash"]}
+    for column in METADATA_COLUMNS:
+        value = row.get(column)
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            continue
+        if column == "published_at":
+            # unix timestamp, chroma can only compare numbers
+            value = int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+        elif column.endswith("_count"):
+            value = int(value)
+        metadata[column] = value
+    return metadata
+
+
+# upsert already embedded rows (output of findNewRows) into the vector database, with their replies as metadata
+def writeToVectorDB(df, encoded_comments):
+
+    # convert replies to list of dictionaries so I can pass it as metadata
+    # the content hash is stored too so later ingests can skip unchanged rows
+    columns = ["reply", "content_hash"] + [column for column in METADATA_COLUMNS if column in df]
+    replies_dict = [rowMetadata(row) for row in df[columns].to_dict("records")]
+
+    # add data into database, replacing any older version of the same rows
+    with instrumentation.span("upsert"):
+        config.vector_store.upsert(
+            ids=df["id"].to_list(),
+            embeddings=encoded_comments,
+            documents=df["comment"].to_list(),
+            metadatas=replies_dict
+        )
+    instrumentation.count("rows_upserted_total", len(df))
+
+    # keep the keyword index in step with the vector store
+    if config.LEXICAL_INDEX_ENABLED:
+        config.lexical_index.upsert(df["id"].to_list(), df["comment"].to_list())
+
+    # cached search results may no longer be the nearest neighbours
+    # other processes searching the same stores notice the new version on their next search
+    if config.registry.isLoaded("retrieval_cache"):
+        config.retrieval_cache.invalidate()
+    bumpStoreVersion(config.STORE_VERSION_PATH)
+
+
 # function to add data into vector database
 # accepts output from the cleanData function
-
+# safe to call repeatedly with overlapping data, rows that are already stored are not encoded again
 def uploadToVectorDB(df):
 
-    # initialize an instance of the database
-    # persist ensures that the database is saved to the computer so I can reference it in other scripts
-    database = chromadb.PersistentClient(path="./youtube_comment_database")
-    # create a collection (group of documents and their embeddings)
-    collection = database.get_or_create_collection(name="youtube_comments")
-
-    # import sentence embedder from huggingface
-    # using all-MiniLM-L6-v2 since llama2:7B doesn't have an encoder and this one is light enough for me to run
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+    # the collection and embedding model come from config
+    # they are only loaded on the first call, repeated calls reuse the same instances
 
     # prepping data for embedding model
 
@@ -63,22 +254,18 @@ def uploadToVectorDB(df):
     # when the semantic search is happening, we should only be searching the comments, I want to see the comment-reply pairs for the most similar comments
     # therefore the replies will be stored as metadata in the database while the only the comments will be embedded
 
-    # convert dataframe items to lists
-    comments = df["comment"].to_list()
-    replies = df["reply"].to_list()
+    # rows from before ids were stable would never match, so they are re-keyed first
+    migrateLegacyRows()
 
-    # convert replies to list of dictionaries so I can pass it as metadata
-    replies_dict = [{"reply":reply} for reply in replies]
+    # skip rows that are already in the database
+    new_rows = findNewRows(df)
+    if new_rows.empty:
+        return 0
 
     # embed comments
-    encoded_comments = embedding_model.encode(comments)
+    encoded_comments = encodeComments(new_rows["comment"].to_list())
 
     # add data into database
-    collection.add(
-        ids=[str(i) for i in range(len(comments))],
-        embeddings=encoded_comments,
-        documents=comments,
-        metadatas=replies_dict
-    )
-
-    return
\ No newline at end of file
+    writeToVectorDB(new_rows, encoded_comments)
+
+    return len(new_rows)
@@ -0,0 +1,827 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from quantization import makeCodec
+
+"""
+Vector Stores
+
+This module defines the interface that the upload and search modules use to store and
+search comment embeddings, so the storage backend can be swapped without touching
+them. Results use the same layout as Chroma's (`query` returns one list per query
+embedding under "ids", "documents", "metadatas" and "distances"), so any backend can
+stand in for a Chroma collection.
+
+Searches and lookups can be filtered on metadata with a Chroma style `where` dict, e.g.
+{"channel_id": "UC..."} or {"$and": [{"channel_id": {"$in": [...]}}, {"like_count": {"$gte": 10}}]}
+(operators: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $and, $or). Keys must be plain
+identifiers (letters, digits and underscores) and values strings or numbers, anything
+else raises ValueError.
+
+Classes:
+---------
+VectorStore
+    Base class of every backend:
+    - add(ids, embeddings, documents, metadatas) -> None
+    - upsert(ids, embeddings, documents, metadatas) -> None
+    - get(ids, include=("documents", "metadatas"), where=None) -> dict with "ids" and the included fields
+    - query(query_embeddings, n_results=5, where=None) -> dict with "ids", "documents", "metadatas" and "distances"
+    - delete(ids) -> None
+    - count() -> int
+    - ids() -> list[str], the ids of every stored row
+    - refresh() -> None, picks up rows written by another process since the store was
+      opened (a no-op for backends that read their state from disk on every call)
+
+ChromaVectorStore(collection, max_batch_size: int = 5000)
+    Wraps a Chroma collection (approximate search with an HNSW index). Writes are split
+    into batches of `max_batch_size` rows, Chroma rejects bigger ones.
+
+Functions:
+-----------
+hnswMetadata(space: str = "cosine", M: int | None = None, construction_ef: int | None = None,
+             search_ef: int | None = None) -> dict
+    - Chroma collection metadata for the HNSW index settings. Settings left as None
+      keep Chroma's defaults.
+getOrCreateChromaCollection(client, name: str, space: str = "cosine", M: int | None = None,
+                            construction_ef: int | None = None, search_ef: int | None = None)
+    - Opens a collection, creating it with the given HNSW settings. The space, M and
+      construction_ef of an existing collection are fixed when its index is built (a
+      warning is raised when they differ from the requested ones), but its search_ef is
+      updated to the one given. Chroma keeps a loaded index for the rest
+      of the process, so a new search_ef applies once the index is loaded again (e.g.
+      the next time the app starts).
+hnswSettings(collection) -> dict
+    - The HNSW settings a collection actually uses.
+shardCollectionName(name: str, shard: str) -> str
+    - Name of the Chroma collection holding one shard of the collection `name`.
+chromaShards(client, name: str) -> list[str]
+    - Names of the shards of `name` that exist in a Chroma database.
+memmapShards(path: str) -> list[str]
+    - Names of the shards stored under a folder (one MemmapVectorStore folder per shard,
+      see `memmapShardPath`).
+
+MemmapVectorStore(path: str = "./vector_store", encoding: str = "float32", rerank: int = 0,
+                  keep_full_precision: bool = True, block_rows: int = 65536, **codec_options)
+    Keeps the embeddings in a flat file that is memory-mapped, with ids, documents and
+    metadata in SQLite. The query embeddings are scored against the stored matrix
+    block by block and the top k of every block is picked with `argpartition`. Opening
+    a store only maps the file, so even a large store is ready to query instantly.
+    - With the default float32 encoding, search is exact.
+    - With a compact encoding (float16, int8 or pq, see quantization.py), only the codes
+      are scanned. With `rerank` > 0, the best `rerank` candidates of every query are
+      rescored with the float32 vectors (read from disk for those rows only) before
+      the top n_results are picked.
+    - int8 and pq codecs are trained once the store holds `training_rows` rows (a codec
+      option, by default 1000 for int8 and 10 x centroids for pq). Until then only the
+      float32 vectors are written and searched exactly, then every row is encoded.
+    - retrain() -> None learns the codec again from the rows stored now and re-encodes
+      every row (needs vectors.bin).
+    - sizes() -> dict with the bytes scanned per query and the bytes on disk
+    - refresh() -> None re-reads the row count, deleted rows and codec from disk, the
+      open store otherwise keeps searching the rows it knew about when it was opened.
+    - A `where` filter is evaluated in SQLite first, and only the matching rows are scored.
+
+ShardedVectorStore(open_shard, shard_key: str, shards: list[str] = (), list_shards=None,
+                   default_shard: str = "default", max_workers: int = 8)
+    Splits the rows over several stores ("shards") by the value of one metadata key, e.g.
+    one Chroma collection per channel. `open_shard(name)` returns the store of a shard,
+    creating it if needed. Writes go to the shard of each row. A query whose `where`
+    pins the shard key ({"channel_id": ...} or {"channel_id": {"$in": [...]}}, alone or
+    inside an $and) only searches those shards, so its latency depends on the size of
+    the shards and not of the whole corpus. Other queries are sent to every shard in
+    parallel and the best n_results of all shards are merged by distance. refresh()
+    adds the shards `list_shards()` returns that it does not know yet and refreshes the
+    opened ones.
+Artifacts (MemmapVectorStore):
+-------------------------------
+- <path>/vectors.bin          unit length float32 embeddings, one row per stored id
+                              (left out for compact encodings with keep_full_precision=False,
+                              once the codec is trained)
+- <path>/codes.<encoding>.bin compact codes searched by queries (compact encodings only)
+- <path>/codec.npz            int8 scales or pq centroids, learned once training_rows rows are stored
+- <path>/meta.json            encoding and dimension
+- <path>/rows.sqlite3         one `vector_rows` row per stored id (row number, id, document, metadata)
+
+Notes:
+-------
+- `MemmapVectorStore` ranks by cosine similarity and reports cosine distances
+  (1 - similarity). The MiniLM embeddings are unit length, so this ranks the same as
+  Chroma's default squared L2 distance.
+- The int8 scales and pq centroids are learned from a sample of up to 100000 of the rows
+  stored when training_rows is reached. A corpus that drifts a lot later on can call
+  retrain().
+- Deleted rows keep their place in vectors.bin and are skipped by queries, adding or
+  upserting the same id again reuses the row.
+- `ShardedVectorStore` looks ids up in every shard, since an id does not say which shard
+  holds it. A row whose shard key changes is not moved, delete it before upserting it.
+"""
+
+
+class VectorStore:
+
+    def add(self, ids, embeddings, documents, metadatas):
+        raise NotImplementedError
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        raise NotImplementedError
+
+    def get(self, ids, include=("documents", "metadatas"), where=None):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def ids(self):
+        raise NotImplementedError
+
+    # pick up writes made by another process, backends that read everything from disk on every call need nothing
+    def refresh(self):
+        pass
+
+
+HNSW_SPACES = ("cosine", "l2", "ip")
+
+
+# chroma collection metadata for the hnsw index settings (None keeps chroma's default)
+# space == distance used by the index: cosine, l2 (squared euclidean) or ip (inner product)
+# M == links per node, more links give better recall but a bigger index and slower inserts
+# construction_ef == candidates considered while inserting, higher builds a better graph more slowly
+# search_ef == candidates considered per query, higher gives better recall but slower queries
+def hnswMetadata(space="cosine", M=None, construction_ef=None, search_ef=None):
+    if space not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space {space!r}, expected one of {HNSW_SPACES}")
+
+    settings = {"hnsw:space": space, "hnsw:M": M, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+    return {key: value for key, value in settings.items() if value is not None}
+
+
+# hnsw settings a collection actually uses
+def hnswSettings(collection):
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return {"space": hnsw.get("space"), "M": hnsw.get("max_neighbors"), "construction_ef": hnsw.get("ef_construction"),
+            "search_ef": hnsw.get("ef_search")}
+
+
+# open a collection, creating it with the given hnsw settings
+# the settings of an existing index are kept (with a warning if they differ), except search_ef which only affects queries
+# metadata == extra collection metadata to store when the collection is created
+def getOrCreateChromaCollection(client, name, space="cosine", M=None, construction_ef=None, search_ef=None, metadata=None):
+    collection = client.get_or_create_collection(name=name, metadata={**hnswMetadata(space, M, construction_ef, search_ef), **(metadata or {})})
+
+    settings = hnswSettings(collection)
+    requested = {"space": space, "M": M, "construction_ef": construction_ef}
+    # collections created without a space use chroma's default, l2
+    differing = [f"{setting} {settings[setting] or 'l2'!r} (requested {value!r})" for setting, value in requested.items()
+                 if value is not None and (settings[setting] or ("l2" if setting == "space" else None)) != value]
+    if differing:
+        warnings.warn(f"Chroma collection {name!r} was built with {', '.join(differing)}, which can't be changed on an "
+                      f"existing collection. Delete the collection and upload the comments again to rebuild it, or set "
+                      f"HNSW_SPACE / HNSW_M / HNSW_CONSTRUCTION_EF to match it.")
+
+    if search_ef is not None and hnswSettings(collection)["search_ef"] != search_ef:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    return collection
+
+
+# chroma collection name of one shard (shard names may hold characters chroma does not allow in collection names)
+def shardCollectionName(name, shard):
+    return f"{name}-{hashlib.sha1(shard.encode('utf-8')).hexdigest()[:16]}"
+
+
+# shards of a collection that exist in a chroma database (every shard collection stores its shard name)
+def chromaShards(client, name):
+    return [collection.metadata["shard"] for collection in client.list_collections()
+            if (collection.metadata or {}).get("shard_of") == name]
+
+
+class ChromaVectorStore(VectorStore):
+
+    # max_batch_size == max rows per write (chroma's limit depends on its sqlite build, about 5400 by default)
+    def __init__(self, collection, max_batch_size=5000):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+
+    # call a collection write method on batches of at most max_batch_size rows
+    def _writeBatches(self, write, ids, embeddings, documents, metadatas):
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            write(ids=list(ids[start:end]), embeddings=embeddings[start:end],
+                  documents=documents[start:end] if documents is not None else None,
+                  metadatas=metadatas[start:end] if metadatas is not None else None)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self._writeBatches(self.collection.add, ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._writeBatches(self.collection.upsert, ids, embeddings, documents, metadatas)
+
+    def get(self, ids, include=("documents", "metadatas"), where=None):
+        return self.collection.get(ids=list(ids), include=list(include), where=where or None)
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where or None)
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def count(self):
+        return self.collection.count()
+
+    def ids(self):
+        return self.collection.get(include=[])["ids"]
+
+
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# metadata keys a where filter may use (where filters can come straight from a client of the reply service)
+_METADATA_KEY = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# most stored vectors a codec is trained on
+TRAINING_SAMPLE = 100000
+
+
+# sql condition on the json metadata column for a chroma style where filter, and its parameters
+def _whereSql(where):
+    if not isinstance(where, dict):
+        raise ValueError(f"A where filter must be a dict, got {type(where).__name__}")
+
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [_whereSql(part) for part in condition]
+            clauses.append("(" + f" {key[1:].upper()} ".join(clause for clause, _ in parts) + ")")
+            params += [param for _, part_params in parts for param in part_params]
+            continue
+
+        if not isinstance(key, str) or not _METADATA_KEY.fullmatch(key):
+            raise ValueError(f"Invalid where key {key!r}")
+
+        # {"key": value} is short for {"key": {"$eq": value}}
+        # the json path is bound as a parameter, never pasted into the sql
+        path = f'$."{key}"'
+        for operator, value in (condition if isinstance(condition, dict) else {"$eq": condition}).items():
+            values = value if operator in ("$in", "$nin") else [value]
+            if not isinstance(values, list) or not all(isinstance(item, (str, int, float)) for item in values):
+                raise ValueError(f"Invalid value for {key!r} {operator}: {value!r}")
+
+            if operator in _COMPARISONS:
+                clauses.append(f"json_extract(metadata, ?) {_COMPARISONS[operator]} ?")
+                params += [path, value]
+            elif operator in ("$in", "$nin"):
+                clauses.append(f"json_extract(metadata, ?) {'IN' if operator == '$in' else 'NOT IN'} ({','.join('?' * len(value))})")
+                params += [path] + list(value)
+            else:
+                raise ValueError(f"Unknown where operator {operator!r}")
+    return " AND ".join(clauses) or "1", params
+
+
+# rows of embeddings scaled to unit length
+def _normalizeRows(embeddings):
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+class MemmapVectorStore(VectorStore):
+
+    # encoding == how vectors are stored for search: float32, float16, int8 or pq (see quantization.py)
+    # rerank == candidates per query rescored at full precision before the top n_results are picked (0 turns it off)
+    # keep_full_precision == also keep the float32 vectors on disk (needed by rerank, unused by plain float32 stores)
+    # block_rows == stored rows scored at once per query batch (bounds the memory of a query)
+    # codec_options == passed to the codec (e.g. subspaces for pq)
+    def __init__(self, path="./vector_store", encoding="float32", rerank=0, keep_full_precision=True,
+                 block_rows=65536, **codec_options):
+        self.path = path
+        self.rerank = rerank
+        self.block_rows = block_rows
+        self.codec_options = codec_options
+        self.dimension = None
+        self.codec = None
+        os.makedirs(path, exist_ok=True)
+
+        # an existing store keeps the encoding it was created with (stores without meta.json are float32)
+        if os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json")) as meta_file:
+                meta = json.load(meta_file)
+            encoding, keep_full_precision = meta["encoding"], meta["keep_full_precision"]
+            self.dimension = meta["dimension"]
+        self.encoding = encoding
+        self.keep_full_precision = keep_full_precision and encoding != "float32"
+
+        # one connection shared by every thread, guarded by a lock
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self._file("rows.sqlite3"), check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS vector_rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._connection.commit()
+        self._codes = None
+        self._vectors = None
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # file searched by queries (float32 stores search vectors.bin directly)
+    def _codesFile(self):
+        return self._file("vectors.bin" if self.encoding == "float32" else f"codes.{self.encoding}.bin")
+
+    def _load(self):
+        self._readState()
+
+        # vectors written by a process that died before committing their rows are dropped
+        for name, row_bytes in self._rowFiles():
+            if os.path.exists(name):
+                os.truncate(name, self._rows * row_bytes)
+
+    # committed rows, deleted rows and codec, as stored on disk
+    def _readState(self):
+        self._rows = self._connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vector_rows").fetchone()[0]
+        self._deleted = {row for (row,) in self._connection.execute("SELECT row FROM vector_rows WHERE deleted = 1")}
+
+        if self.dimension is None and self._rows and os.path.exists(self._file("vectors.bin")):
+            self.dimension = os.path.getsize(self._file("vectors.bin")) // (4 * self._rows)
+        if self.dimension is not None:
+            self._makeCodec()
+            if os.path.exists(self._file("codec.npz")):
+                with np.load(self._file("codec.npz")) as state:
+                    self.codec.load(dict(state))
+
+    # pick up rows written (or deleted) by another process
+    # unlike opening the store, nothing is truncated, the other process may be appending right now
+    def refresh(self):
+        with self._lock:
+            if self.dimension is None and os.path.exists(self._file("meta.json")):
+                with open(self._file("meta.json")) as meta_file:
+                    self.dimension = json.load(meta_file)["dimension"]
+            self._readState()
+            self._codes = self._vectors = None
+
+    def _makeCodec(self):
+        self.codec = makeCodec(self.encoding, self.dimension, **self.codec_options)
+
+    # data files and the bytes of one row in each
+    def _rowFiles(self):
+        if self.codec is None:
+            return []
+        # until the codec is trained only the float32 vectors are written
+        if not self.codec.trained:
+            return [(self._file("vectors.bin"), self.dimension * 4)]
+        files = [(self._codesFile(), self.codec.bytes_per_vector)]
+        if self.keep_full_precision:
+            files.append((self._file("vectors.bin"), self.dimension * 4))
+        return files
+
+    def _setUp(self, embeddings):
+        self.dimension = embeddings.shape[1]
+        self._makeCodec()
+        with open(self._file("meta.json"), "w") as meta_file:
+            json.dump({"encoding": self.encoding, "dimension": self.dimension, "keep_full_precision": self.keep_full_precision}, meta_file)
+
+    # codec the searched rows are scored with (the float32 vectors are searched exactly until the codec is trained)
+    def _searchCodec(self):
+        return self.codec if self.codec.trained else makeCodec("float32", self.dimension)
+
+    # memory maps of the codes and of the full precision vectors, reopened after new rows are appended
+    def _matrices(self):
+        if self._codes is None and self._rows:
+            if not self.codec.trained:
+                self._codes = self._vectors = np.memmap(self._file("vectors.bin"), dtype=np.float32, mode="r",
+                                                        shape=(self._rows, self.dimension))
+                return self._codes, self._vectors
+            self._codes = np.memmap(self._codesFile(), dtype=self.codec.code_dtype, mode="r",
+                                    shape=(self._rows, self.codec.code_size))
+            if self.keep_full_precision:
+                self._vectors = np.memmap(self._file("vectors.bin"), dtype=np.float32, mode="r", shape=(self._rows, self.dimension))
+            elif self.encoding == "float32":
+                self._vectors = self._codes
+        return self._codes, self._vectors
+
+    # stored row of every id that exists (deleted ones included)
+    def _findRows(self, ids):
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(self._connection.execute(f"SELECT id, row FROM vector_rows WHERE id IN ({placeholders})", chunk))
+        return rows
+
+    # overwrite existing rows of a data file in place and append new ones
+    def _writeRows(self, name, dtype, values, existing_rows, existing_values, new_values):
+        if existing_rows:
+            stored = np.memmap(name, dtype=dtype, mode="r+", shape=(self._rows, values))
+            stored[existing_rows] = existing_values
+            stored.flush()
+            del stored
+        if len(new_values):
+            with open(name, "ab") as data_file:
+                data_file.write(np.ascontiguousarray(new_values, dtype=dtype).tobytes())
+
+    def _write(self, ids, embeddings, documents, metadatas, replace):
+        ids = list(ids)
+        embeddings = _normalizeRows(embeddings)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            if self.dimension is None:
+                self._setUp(embeddings)
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the store's {self.dimension}")
+
+            # the last copy of an id wins if it shows up twice in one call
+            positions = {row_id: i for i, row_id in enumerate(ids)}
+            existing = self._findRows(list(positions))
+            # a deleted id can be added again, its row is reused like an upsert's
+            stored = [row_id for row_id, row in existing.items() if row not in self._deleted]
+            if stored and not replace:
+                raise ValueError(f"Ids already stored: {sorted(stored)[:5]}")
+
+            # existing ids (deleted ones included) are overwritten in place, new ids are appended
+            new_ids = [row_id for row_id in positions if row_id not in existing]
+            existing_vectors = embeddings[[positions[row_id] for row_id in existing]]
+            new_vectors = embeddings[[positions[row_id] for row_id in new_ids]]
+            existing_rows = list(existing.values())
+            if self.codec.trained:
+                self._writeRows(self._codesFile(), self.codec.code_dtype, self.codec.code_size, existing_rows,
+                                self.codec.encode(existing_vectors), self.codec.encode(new_vectors))
+            if self.keep_full_precision or not self.codec.trained:
+                self._writeRows(self._file("vectors.bin"), np.float32, self.dimension, existing_rows, existing_vectors, new_vectors)
+
+            # rows are committed after their vectors are on disk
+            assigned = {**existing, **{row_id: self._rows + i for i, row_id in enumerate(new_ids)}}
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO vector_rows (row, id, document, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                [(assigned[row_id], row_id, documents[i], json.dumps(metadatas[i]) if metadatas[i] is not None else None)
+                 for row_id, i in positions.items()],
+            )
+            self._connection.commit()
+
+            self._rows += len(new_ids)
+            self._deleted -= set(existing.values())
+            self._codes = self._vectors = None
+
+            # int8 scales and pq centroids are learned once enough rows are stored to be representative
+            if not self.codec.trained and self.count() >= self.codec.training_rows:
+                self._trainCodec()
+
+    # train the codec on a sample of the stored float32 vectors and encode every row with it
+    def _trainCodec(self):
+        vectors = np.memmap(self._file("vectors.bin"), dtype=np.float32, mode="r", shape=(self._rows, self.dimension))
+        live = np.setdiff1d(np.arange(self._rows), np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted)))
+        if len(live) > TRAINING_SAMPLE:
+            live = np.sort(np.random.default_rng(0).choice(live, TRAINING_SAMPLE, replace=False))
+        self.codec.train(np.asarray(vectors[live]))
+
+        # the codes are complete on disk before the codec is saved, so a crash in between leaves the store untrained
+        with open(self._codesFile() + ".tmp", "wb") as codes_file:
+            for start in range(0, self._rows, self.block_rows):
+                codes_file.write(np.ascontiguousarray(self.codec.encode(vectors[start:start + self.block_rows])).tobytes())
+        os.replace(self._codesFile() + ".tmp", self._codesFile())
+        with open(self._file("codec.npz.tmp"), "wb") as codec_file:
+            np.savez(codec_file, **self.codec.state())
+        os.replace(self._file("codec.npz.tmp"), self._file("codec.npz"))
+
+        del vectors
+        self._codes = self._vectors = None
+        if not self.keep_full_precision:
+            os.remove(self._file("vectors.bin"))
+
+    # learn the codec again from the rows stored now and re-encode every row (needs the float32 vectors)
+    def retrain(self):
+        with self._lock:
+            if self.codec is None or self.encoding == "float32":
+                return
+            if not os.path.exists(self._file("vectors.bin")):
+                raise ValueError("Retraining needs the float32 vectors, the store was created with keep_full_precision=False")
+            self._makeCodec()
+            self._trainCodec()
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self._write(ids, embeddings, documents, metadatas, replace=False)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._write(ids, embeddings, documents, metadatas, replace=True)
+
+    # documents and metadata of stored rows, in the order of `rows`
+    def _fetchRows(self, rows):
+        found = {}
+        with self._lock:
+            for start in range(0, len(rows), 500):
+                chunk = [int(row) for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(chunk))
+                for row, row_id, document, metadata in self._connection.execute(
+                        f"SELECT row, id, document, metadata FROM vector_rows WHERE row IN ({placeholders})", chunk):
+                    found[row] = (row_id, document, json.loads(metadata) if metadata is not None else None)
+        return [found[int(row)] for row in rows]
+
+    # stored rows that match a where filter, in row order (only among `rows` when given)
+    def _matchingRows(self, where, rows=None):
+        clause, params = _whereSql(where)
+        with self._lock:
+            if rows is None:
+                found = self._connection.execute(f"SELECT row FROM vector_rows WHERE deleted = 0 AND {clause} ORDER BY row", params)
+                return np.array([row for (row,) in found], dtype=np.int64)
+
+            matching = set()
+            for start in range(0, len(rows), 500):
+                chunk = [int(row) for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(chunk))
+                matching.update(row for (row,) in self._connection.execute(
+                    f"SELECT row FROM vector_rows WHERE row IN ({placeholders}) AND {clause}", chunk + params))
+            return np.array([row for row in rows if row in matching], dtype=np.int64)
+
+    # stored rows with the given ids (ids that are missing, deleted or don't match `where` are left out)
+    def get(self, ids, include=("documents", "metadatas"), where=None):
+        with self._lock:
+            rows = [row for row in self._findRows(list(ids)).values() if row not in self._deleted]
+        if where:
+            rows = self._matchingRows(where, rows).tolist()
+        found = self._fetchRows(rows)
+
+        result = {"ids": [row_id for row_id, _, _ in found]}
+        if "documents" in include:
+            result["documents"] = [document for _, document, _ in found]
+        if "metadatas" in include:
+            result["metadatas"] = [metadata for _, _, metadata in found]
+        return result
+
+    # top k rows for every query by (approximate) score, returns (scores, rows) sorted best first
+    def _search(self, codec, queries, codes, deleted, k):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        rows = 0 if codes is None else codes.shape[0]
+
+        # best k of every block, merged into the overall best k
+        for start in range(0, rows if k > 0 else 0, self.block_rows):
+            scores = codec.scores(queries, codes[start:start + self.block_rows])
+            block_deleted = deleted[(deleted >= start) & (deleted < start + scores.shape[1])]
+            scores[:, block_deleted - start] = -np.inf
+
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    # top n_results rows for every query embedding (one embedding or a list of them)
+    # where == only rows whose metadata matches this filter are scored
+    # rerank == overrides the store's rerank setting for this query
+    def query(self, query_embeddings, n_results=5, where=None, rerank=None):
+        queries = _normalizeRows(query_embeddings)
+        rerank = self.rerank if rerank is None else rerank
+        with self._lock:
+            codec = self._searchCodec()
+            codes, vectors = self._matrices()
+            deleted = np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted))
+
+        # with a filter only the matching rows are scored (they never include deleted ones)
+        allowed = self._matchingRows(where) if where else None
+        if allowed is not None:
+            codes = codes[allowed] if codes is not None and len(allowed) else None
+            deleted = np.zeros(0, dtype=np.int64)
+        k = min(n_results, (0 if codes is None else codes.shape[0]) - len(deleted))
+
+        # with rerank, more candidates are picked from the compact codes and rescored with the float32 vectors
+        use_rerank = rerank > k > 0 and vectors is not None and codec is self.codec and self.encoding != "float32"
+        best_scores, best_rows = self._search(codec, queries, codes, deleted, min(rerank, len(codes) - len(deleted)) if use_rerank else k)
+        if allowed is not None:
+            best_rows = allowed[best_rows]
+        if use_rerank and best_rows.size:
+            exact = np.einsum("qcd,qd->qc", vectors[best_rows.ravel()].reshape(*best_rows.shape, self.dimension), queries)
+            order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+            best_scores = np.take_along_axis(exact, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+        found = self._fetchRows(best_rows.ravel().tolist())
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for i in range(len(queries)):
+            hits = found[i * k:(i + 1) * k]
+            result["ids"].append([row_id for row_id, _, _ in hits])
+            result["documents"].append([document for _, document, _ in hits])
+            result["metadatas"].append([metadata for _, _, metadata in hits])
+            result["distances"].append((1 - best_scores[i]).tolist())
+        return result
+
+    def delete(self, ids):
+        with self._lock:
+            rows = list(self._findRows(list(ids)).values())
+            self._connection.executemany("UPDATE vector_rows SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+            self._connection.commit()
+            self._deleted |= set(rows)
+
+    # number of stored (not deleted) rows
+    def count(self):
+        return self._rows - len(self._deleted)
+
+    def ids(self):
+        with self._lock:
+            return [row_id for (row_id,) in self._connection.execute("SELECT id FROM vector_rows WHERE deleted = 0 ORDER BY row")]
+
+    # bytes scanned by every query (the codes) and bytes on disk (codes and full precision vectors)
+    def sizes(self):
+        if self.codec is None:
+            return {"search_bytes": 0, "disk_bytes": 0}
+        return {"search_bytes": self._rows * self._searchCodec().bytes_per_vector,
+                "disk_bytes": sum(os.path.getsize(name) for name, _ in self._rowFiles() if os.path.exists(name))}
+
+    def close(self):
+        with self._lock:
+            self._codes = self._vectors = None
+            self._connection.close()
+
+
+# folder of one shard of a sharded memmap store
+def memmapShardPath(path, shard):
+    return os.path.join(path, "shards", quote(shard, safe=""))
+
+
+# shards stored under a sharded memmap store's folder
+def memmapShards(path):
+    if not os.path.isdir(os.path.join(path, "shards")):
+        return []
+    return [unquote(name) for name in sorted(os.listdir(os.path.join(path, "shards")))]
+
+
+# values a condition on the shard key limits it to (a plain value, $eq or $in), None for other conditions
+def _pinnedValues(condition):
+    if not isinstance(condition, dict):
+        return [condition]
+    if list(condition) == ["$eq"]:
+        return [condition["$eq"]]
+    if list(condition) == ["$in"]:
+        return list(condition["$in"])
+    return None
+
+
+# shard names a where filter is limited to, None if it can match rows in any shard
+def _whereShards(where, shard_key):
+    if not where:
+        return None
+    for key, condition in where.items():
+        if key == "$and":
+            for part in condition:
+                shards = _whereShards(part, shard_key)
+                if shards is not None:
+                    return shards
+        elif key == shard_key and _pinnedValues(condition) is not None:
+            return _pinnedValues(condition)
+    return None
+
+
+# where filter without the shard key conditions that every row of the given shards matches, None if nothing is left
+def _withoutShardKey(where, shard_key, shards):
+    if not where:
+        return None
+
+    def matchesEveryShard(condition):
+        values = _pinnedValues(condition)
+        return values is not None and set(shards) <= {str(value) for value in values}
+
+    left = {key: condition for key, condition in where.items() if key != shard_key or not matchesEveryShard(condition)}
+    if "$and" in left:
+        parts = [part for part in (_withoutShardKey(part, shard_key, shards) for part in left.pop("$and")) if part]
+        if len(parts) == 1 and not left:
+            return parts[0]
+        if parts:
+            left["$and"] = parts
+    return left or None
+
+
+class ShardedVectorStore(VectorStore):
+
+    # open_shard == function returning the store of a shard name, creating the shard if it does not exist
+    # shard_key == metadata key whose value picks the shard of a row (e.g. "channel_id")
+    # shards == names of the shards that already exist
+    # list_shards == optional function returning the names of the shards that exist now, used by refresh()
+    # default_shard == shard of rows without a shard_key value
+    # max_workers == shards searched in parallel
+    def __init__(self, open_shard, shard_key, shards=(), list_shards=None, default_shard="default", max_workers=8):
+        self.open_shard = open_shard
+        self.list_shards = list_shards
+        self.shard_key = shard_key
+        self.default_shard = default_shard
+        self._shard_names = list(dict.fromkeys(shards))
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    # store of a shard, opened on first use
+    def shard(self, name):
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = self.open_shard(name)
+                if name not in self._shard_names:
+                    self._shard_names.append(name)
+            return self._shards[name]
+
+    def shardNames(self):
+        return list(self._shard_names)
+
+    # existing shards a where filter can match rows in, and the filter left to apply within them
+    def _targetShards(self, where):
+        pinned = _whereShards(where, self.shard_key)
+        if pinned is None:
+            return list(self._shard_names), where
+        names = [name for name in dict.fromkeys(str(value) for value in pinned) if name in self._shard_names]
+        return names, _withoutShardKey(where, self.shard_key, names)
+
+    # run a function on the store of every named shard in parallel, results are in the order of names
+    def _fanOut(self, function, names):
+        return list(self._pool.map(lambda name: function(self.shard(name)), names))
+
+    # split a write by shard and hand every part to its shard
+    def _write(self, method, ids, embeddings, documents, metadatas):
+        parts = {}
+        for i, metadata in enumerate(metadatas if metadatas is not None else [None] * len(ids)):
+            value = (metadata or {}).get(self.shard_key)
+            parts.setdefault(self.default_shard if value is None else str(value), []).append(i)
+
+        embeddings = np.asarray(embeddings)
+        for name, positions in parts.items():
+            getattr(self.shard(name), method)(
+                ids=[ids[i] for i in positions], embeddings=embeddings[positions],
+                documents=[documents[i] for i in positions] if documents is not None else None,
+                metadatas=[metadatas[i] for i in positions] if metadatas is not None else None)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self._write("add", list(ids), embeddings, documents, metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._write("upsert", list(ids), embeddings, documents, metadatas)
+
+    # ids can be in any shard, so every shard is asked
+    def get(self, ids, include=("documents", "metadatas"), where=None):
+        ids = list(ids)
+        names, where = self._targetShards(where)
+        result = {"ids": [], **{field: [] for field in include}}
+        for found in self._fanOut(lambda store: store.get(ids, include=include, where=where), names):
+            for field in result:
+                result[field] += found[field]
+        return result
+
+    # best n_results of every shard the filter can match, merged by distance
+    def query(self, query_embeddings, n_results=5, where=None):
+        names, where = self._targetShards(where)
+        results = self._fanOut(lambda store: store.query(query_embeddings=query_embeddings, n_results=n_results, where=where), names)
+
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for i in range(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)).shape[0]):
+            hits = [hit for result in results
+                    for hit in zip(result["distances"][i], result["ids"][i], result["documents"][i], result["metadatas"][i])]
+            hits = sorted(hits, key=lambda hit: hit[0])[:n_results]
+            merged["distances"].append([distance for distance, _, _, _ in hits])
+            merged["ids"].append([row_id for _, row_id, _, _ in hits])
+            merged["documents"].append([document for _, _, document, _ in hits])
+            merged["metadatas"].append([metadata for _, _, _, metadata in hits])
+        return merged
+
+    def delete(self, ids):
+        ids = list(ids)
+        self._fanOut(lambda store: store.delete(ids), self._shard_names)
+
+    def count(self):
+        return sum(self._fanOut(lambda store: store.count(), self._shard_names))
+
+    def ids(self):
+        return [row_id for shard_ids in self._fanOut(lambda store: store.ids(), self._shard_names) for row_id in shard_ids]
+
+    # shards created by another process are added, the opened ones pick up that process's writes
+    def refresh(self):
+        if self.list_shards is not None:
+            with self._lock:
+                self._shard_names += [name for name in self.list_shards() if name not in self._shard_names]
+        with self._lock:
+            opened = list(self._shards.values())
+        for store in opened:
+            store.refresh()
+
+    def close(self):
+        self._pool.shutdown()
+        for store in self._shards.values():
+            if hasattr(store, "close"):
+                store.close()
@@ -1,4 +1,14 @@
-from config import youtube
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+import config
+import instrumentation
+from api_limits import (COMMENT_THREADS_LIST_COST, QuotaBudget, QuotaExceededError, RateLimiter, executeWithRetry,
+                        getErrorReasons, isRetryable)
+from response_cache import CacheMissError
+from scrape_state import ScrapeStateStore
 
 """
 YouTube Comment Collection Script
@@ -10,15 +20,51 @@ cleaning, embedding, and semantic search.
 
 Functions:
 -----------
+parseCommentThreads(apiCall: dict) -> list[dict]
+    - For each top-level comment with replies in one API response, selects the most
+      liked reply and returns the comment–reply pairs.
+
+fetchCommentPage(video: str, page_token: str | None = None, order: str = "relevance",
+                 cache_ttl_seconds: float | None = None) -> dict
+    - Requests one page (up to 100 threads) of comments for a video, retrying
+      transient errors with exponential backoff.
+    - Goes through the on-disk response cache (`config.response_cache`), which can
+      record responses or replay them without touching the network. The first page
+      of the newest comments (order="time") changes with every new comment, so it is
+      never served from the cache while recording. Refreshes request all their pages
+      this way.
+
 getCommentsPerVideo(video: str, output: list[dict], comments_to_view: int = 2000) -> list[dict]
     - Iteratively fetches comments and replies for a single YouTube video.
-    - For each top-level comment with replies, selects the most liked reply.
     - Aggregates all comment–reply pairs into a shared output list.
     - Handles pagination to retrieve up to `comments_to_view` comments per video.
 
-fetchYouTubeComments(videos: list[str]) -> list[dict]
-    - Iterates over multiple YouTube video IDs and aggregates all comment–reply pairs.
-    - Returns a consolidated list of structured comment–reply dictionaries.
+fetchYouTubeComments(videos: list[str], comments_to_view: int = 5000, max_workers: int = 4,
+                     quota_budget: int | None = None, requests_per_second: float | None = None,
+                     state_path: str | None = None, refresh: bool = False) -> list[dict]
+    - Fetches several videos in parallel with a `CommentFetchEngine`.
+    - With `state_path`, checkpoints every page to disk and resumes an interrupted run
+      from each video's saved page token. With `refresh=True`, only fetches threads
+      posted after the newest thread seen by earlier runs.
+    - Returns a consolidated list of structured comment–reply dictionaries, in the
+      order of the given video IDs.
+
+Classes:
+---------
+CommentFetchEngine(max_workers: int = 4, quota_budget: int | None = None,
+                   requests_per_second: float | None = None, max_retries: int = 5)
+    - Fetches videos on a thread pool, following page tokens for each video.
+    - Shares one quota-unit budget and one requests-per-second limit across threads.
+    - Stops cleanly (keeping the pairs fetched so far) once the quota budget is used up.
+    - Skips a video whose request fails with an error that retrying can't fix (e.g.
+      comments disabled, video not found), keeping the other videos and the pages
+      fetched so far. The reason is recorded in `stats["failed_videos"]`. In replay
+      mode, a video whose next page was never recorded is skipped the same way.
+    - With a `ScrapeStateStore`, saves a cursor per video and flushes each page to disk,
+      so a rerun resumes where the last one stopped.
+    - With an `on_page` callback, streams each page of pairs to it as soon as it arrives
+      instead of collecting everything in memory.
+    - Records requests, retries, pairs, quota units and wall-clock time in `stats`.
 
 Parameters:
 ------------
@@ -38,10 +84,20 @@ list[dict]
     A list of dictionaries, each containing:
         - "comment": the original comment text
         - "reply": the most liked reply text
+        - "video_id": the ID of the video the comment was posted on
+        - "comment_id": the ID of the top-level comment thread
+        - "channel_id": the ID of the channel the video belongs to
+        - "published_at": when the comment was posted (ISO 8601)
+        - "like_count": likes on the comment
+        - "reply_like_count": likes on the reply
 
 Dependencies:
 --------------
-- src.config (for the initialized `youtube` client)
+- src.config (for the lazily built `youtube` client)
+- src.api_limits (quota budget, rate limiter, retries)
+- src.scrape_state (per-video cursors and saved pages)
+- src.response_cache (through `config.response_cache`)
+- src.instrumentation (api calls, retries and quota units, when enabled)
 - google-api-python-client
 
 Notes:
@@ -49,8 +105,84 @@ Notes:
 - Each API call retrieves up to 100 comments and their replies.
 - Only comments with at least one reply are included in the output.
 - The YouTube API may return fewer replies depending on video engagement.
+- A refresh only looks at new top-level comments, new replies on old comments are not
+  picked up until the video is fetched again from scratch.
 """
 
+# pull the comment-reply pairs out of a single commentThreads api response
+# ignores comments that don't have any replies
+def parseCommentThreads(apiCall):
+    pairs = []
+
+    # iterate through the comments the api returned
+    for item in apiCall.get("items", []):
+
+        # get comment text
+        textOutput = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
+
+        # get count of replies
+        replyCount = item["snippet"]["totalReplyCount"]
+
+        # the api can report replies without returning them (e.g. they were deleted)
+        replies = item.get("replies", {}).get("comments", [])
+
+        if replyCount > 0 and replies:
+
+            # get the likes per reply (api usually returns 5 replies)
+            likes = [reply["snippet"]["likeCount"] for reply in replies]
+
+            # get index of comment with most likes
+            maxIndex = likes.index(max(likes))
+            # get reply with most likes
+            mostLikedReplyText = replies[maxIndex]["snippet"]["textDisplay"]
+
+            # save comment text and most liked reply text, with ids so the pair can be stored under a stable id
+            # and the channel, post time and likes so searches can be filtered on them
+            commentSnippet = item["snippet"]["topLevelComment"]["snippet"]
+            pairs.append({"comment": textOutput, "reply": mostLikedReplyText,
+                          "video_id": item["snippet"].get("videoId"), "comment_id": item["id"],
+                          "channel_id": item["snippet"].get("channelId") or commentSnippet.get("channelId"),
+                          "published_at": commentSnippet.get("publishedAt"),
+                          "like_count": commentSnippet.get("likeCount"), "reply_like_count": likes[maxIndex]})
+
+    return pairs
+
+
+# request a single page of comment threads for a video
+# page_token == token from the previous page, must be None for the first page
+# http == optional httplib2.Http to send the request on (each thread needs its own)
+# before_request == optional function called right before a real api call (not for cached responses)
+# responses go through config.response_cache, so in replay mode no api call is ever made
+# cache_ttl_seconds == max age of a cached response to reuse while recording (None uses the cache's ttl, 0 always asks the api)
+def fetchCommentPage(video, page_token=None, order="relevance", http=None, max_retries=5, on_retry=None, before_request=None,
+                     cache_ttl_seconds=None):
+    # the newest comments change all the time, a recorded first page would hide new ones for the whole ttl
+    if cache_ttl_seconds is None and order == "time" and page_token is None:
+        cache_ttl_seconds = 0
+
+    params = {"method": "commentThreads.list", "part": ["snippet", "replies"], "videoId": video,
+              "maxResults": 100, "order": order, "pageToken": page_token}
+
+    # every retry is a separate call charged by the api
+    def onRetry(error):
+        instrumentation.count("youtube_api_retries_total")
+        instrumentation.count("youtube_quota_units_total", COMMENT_THREADS_LIST_COST)
+        if on_retry is not None:
+            on_retry(error)
+
+    def requestPage():
+        if before_request is not None:
+            before_request()
+        instrumentation.count("youtube_api_calls_total")
+        instrumentation.count("youtube_quota_units_total", COMMENT_THREADS_LIST_COST)
+        request = config.youtube.commentThreads().list(part=["snippet","replies"], videoId=video, maxResults=100, order=order, pageToken=page_token)
+        with instrumentation.span("youtube_api_call", method="commentThreads.list"):
+            return executeWithRetry(request, max_retries=max_retries, http=http, on_retry=onRetry)
+
+    instrumentation.count("youtube_pages_total")
+    return config.response_cache.fetch(params, requestPage, ttl_seconds=cache_ttl_seconds)
+
+
 # build function to call youtube api to go through as many pages of comments as possible per youtube video
 # video == id of particular video
 # output == output list
@@ -65,54 +197,217 @@ def getCommentsPerVideo(video, output, comments_to_view=2000):
     # realistically most comments won't have a reply, so by iterating through 2000 we will get between 500 and 1000 usable data entries per video
     for i in range(comments_to_view//100):
 
-        apiCall = youtube.commentThreads().list(part=["snippet","replies"], videoId=video, maxResults=100, order="relevance", pageToken=nextPageToken).execute()
-
-        # iterate through the API response to save all comment-reply pairs (ignore comments that don't have any replies)
-        # iterate through the comments the api returned
-        for j in range(len(apiCall["items"])):
-            
-            # get comment text
-            textOutput = apiCall["items"][j]["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-            
-            # get count of replies
-            replyCount = apiCall["items"][j]["snippet"]["totalReplyCount"]
-            
-            if replyCount > 0:
-                
-                # get list of all the returned replies (api usually returns 5 replies)
-                replies = apiCall["items"][j]["replies"]["comments"]
-
-                # get the likes per reply
-                likes = []
-                for reply in replies:
-                    likes.append(reply["snippet"]["likeCount"])
-                    
-                # get index of comment with most likes
-                maxIndex = likes.index(max(likes))
-                # get reply with most likes
-                mostLikedReplyText = replies[maxIndex]["snippet"]["textDisplay"]
-
-                # save comment text and most liked reply text to output list dictionary
-                output.append({"comment":textOutput, "reply":mostLikedReplyText})
-            
-            # update next page token
-            next_page_token = apiCall.get("nextPageToken")
-            if not next_page_token:
-                break
-    
+        apiCall = fetchCommentPage(video, page_token=nextPageToken)
+
+        # save all comment-reply pairs on this page
+        output.extend(parseCommentThreads(apiCall))
+
+        # update next page token, stop once there are no more pages
+        nextPageToken = apiCall.get("nextPageToken")
+        if not nextPageToken:
+            break
+
     return output
 
 
+# time a comment thread was posted (ISO 8601 strings compare in time order)
+def getPublishedAt(item):
+    return item["snippet"]["topLevelComment"]["snippet"]["publishedAt"]
+
+
+# time of the newest comment thread in an api response, None if it has no threads
+def newestPublishedAt(apiCall):
+    return max((getPublishedAt(item) for item in apiCall.get("items", [])), default=None)
+
+
+# fetches comments for many videos at once on a thread pool
+# all threads share one quota budget and one rate limiter
+class CommentFetchEngine:
+
+    # max_workers == number of videos fetched in parallel
+    # quota_budget == max youtube quota units to spend (None for no limit)
+    # requests_per_second == max api calls per second across all threads (None for no limit)
+    # max_retries == retries per page on 403 (rate limit), 429 and 5xx errors
+    # state_store == optional ScrapeStateStore used to checkpoint each page and resume later runs
+    # on_page == optional function called with (video, pairs) for every page as it arrives (from the worker threads)
+    #            when given, pairs are streamed to it instead of being collected and returned by fetch
+    def __init__(self, max_workers=4, quota_budget=None, requests_per_second=None, max_retries=5, state_store=None, on_page=None):
+        self.max_workers = max_workers
+        self.quota = QuotaBudget(quota_budget)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.state = state_store
+        self.on_page = on_page
+        self.stats = {"requests": 0, "retries": 0, "pairs": 0, "quota_units": 0, "quota_exhausted": False,
+                      "failed_videos": {}, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    # httplib2 is not thread safe, so every worker thread gets its own connection
+    def _threadHttp(self):
+        if not hasattr(self._local, "http"):
+            self._local.http = build_http()
+        return self._local.http
+
+    # hand a page of pairs to the on_page callback, or keep it to return from fetch
+    def _emit(self, video, pairs, collected):
+        if self.on_page is not None:
+            self.on_page(video, pairs)
+        else:
+            collected.extend(pairs)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    # every retried request is charged by the api, so charge it to the budget too
+    def _onRetry(self, error):
+        self.quota.spend(COMMENT_THREADS_LIST_COST)
+        self._count("retries")
+
+    # only real api calls count against the quota and rate limits, cached pages are free
+    def _beforeRequest(self):
+        self.quota.spend(COMMENT_THREADS_LIST_COST)
+        self.rate_limiter.wait()
+        self._count("requests")
+
+    # request one page within the quota and rate limits
+    # None once the quota is used up or if the video can't be fetched (comments disabled, video not found, ...)
+    # cache_ttl_seconds == passed to fetchCommentPage
+    def _requestPage(self, video, page_token, order="relevance", cache_ttl_seconds=None):
+        try:
+            apiCall = fetchCommentPage(video, page_token=page_token, order=order, http=self._threadHttp(),
+                                       max_retries=self.max_retries, on_retry=self._onRetry,
+                                       before_request=self._beforeRequest, cache_ttl_seconds=cache_ttl_seconds)
+        except QuotaExceededError:
+            # the other videos will stop too, the pages fetched so far are kept
+            self.stats["quota_exhausted"] = True
+            return None
+        except HttpError as error:
+            if isRetryable(error):
+                raise
+            # only this video is skipped, the other videos go on
+            with self._stats_lock:
+                self.stats["failed_videos"][video] = ", ".join(filter(None, getErrorReasons(error))) or f"HTTP {error.resp.status}"
+            instrumentation.count("youtube_failed_videos_total")
+            return None
+        except CacheMissError:
+            # replaying a recording that stops before this page, the pages replayed so far are kept
+            with self._stats_lock:
+                self.stats["failed_videos"][video] = "no recorded response (replay mode)"
+            instrumentation.count("youtube_failed_videos_total")
+            return None
+
+        return apiCall
+
+    # fetch up to comments_to_view comments for one video, following page tokens
+    # with a state store the fetch picks up from the saved cursor and every page is saved as it arrives
+    # refresh == only fetch threads newer than the saved cursor (for videos that were fully fetched before)
+    # returns every pair for the video, or only the newly fetched ones when refreshing
+    def fetchVideo(self, video, comments_to_view=5000, refresh=False):
+        cursor = self.state.getCursor(video) if self.state else None
+
+        if cursor and cursor["completed"]:
+            if refresh:
+                return self._refreshVideo(video, cursor, comments_to_view)
+            # nothing left to fetch for this video
+            pairs = []
+            self._emit(video, self.state.loadPairs(video), pairs)
+            return pairs
+
+        # resume where the last run stopped
+        page_token = cursor["page_token"] if cursor else None
+        pages_to_fetch = comments_to_view // 100 - (cursor["pages"] if cursor else 0)
+        pairs = []
+        if cursor and not refresh:
+            self._emit(video, self.state.loadPairs(video), pairs)
+        fetched = 0
+
+        for page in range(pages_to_fetch):
+            apiCall = self._requestPage(video, page_token)
+            if apiCall is None:
+                break
+
+            page_pairs = parseCommentThreads(apiCall)
+            fetched += len(page_pairs)
+
+            page_token = apiCall.get("nextPageToken")
+            if self.state:
+                completed = not page_token or page == pages_to_fetch - 1
+                self.state.savePage(video, page_pairs, page_token, completed, newestPublishedAt(apiCall))
+
+            self._emit(video, page_pairs, pairs)
+
+            if not page_token:
+                break
+
+        self._count("pairs", fetched)
+        return pairs
+
+    # fetch only the threads posted after the newest one seen so far
+    # pages are requested newest first (order="time") and the fetch stops at the first thread that is not new
+    def _refreshVideo(self, video, cursor, comments_to_view):
+        cutoff = cursor["newest_published_at"] or ""
+        newest = None
+        page_token = None
+        pairs = []
+        fetched = 0
+
+        for page in range(comments_to_view // 100):
+            # a refresh is about what changed since the last run, so it never reuses cached pages while recording
+            apiCall = self._requestPage(video, page_token, order="time", cache_ttl_seconds=0)
+            if apiCall is None:
+                break
+
+            new_items = [item for item in apiCall.get("items", []) if getPublishedAt(item) > cutoff]
+            page_pairs = parseCommentThreads({"items": new_items})
+            fetched += len(page_pairs)
+
+            newest = max(filter(None, [newest, newestPublishedAt({"items": new_items})]), default=None)
+            page_token = apiCall.get("nextPageToken")
+            done = len(new_items) < len(apiCall.get("items", [])) or not page_token or page == comments_to_view // 100 - 1
+
+            # only move the cursor forward once the refresh is done, so an interrupted refresh is retried in full
+            self.state.savePage(video, page_pairs, None, True, newest if done else None)
+            self._emit(video, page_pairs, pairs)
+
+            if done:
+                break
+
+        self._count("pairs", fetched)
+        return pairs
+
+    # fetch all videos in parallel, results are returned in the same order as videos
+    # (an empty list when pages are streamed to on_page)
+    def fetch(self, videos, comments_to_view=5000, refresh=False):
+        if refresh and self.state is None:
+            raise ValueError("refresh needs a state store with the cursors of earlier runs")
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(lambda video: self.fetchVideo(video, comments_to_view, refresh), videos))
+
+        self.stats["quota_units"] = self.quota.spent
+        self.stats["seconds"] += time.perf_counter() - start
+
+        return [pair for pairs in results for pair in pairs]
+
+
 # build function to get comments for all youtube videos specified
 # videos == list of video IDs
-def fetchYouTubeComments(videos):
+# max_workers, quota_budget, requests_per_second == passed to CommentFetchEngine
+# state_path == folder to checkpoint progress in, reruns resume from it (None to keep everything in memory)
+# refresh == only fetch comments newer than the last run (needs state_path)
+def fetchYouTubeComments(videos, comments_to_view=5000, max_workers=4, quota_budget=None, requests_per_second=None,
+                         state_path=None, refresh=False):
 
-    # define output list
-    output = []
+    state_store = ScrapeStateStore(state_path) if state_path else None
+    engine = CommentFetchEngine(max_workers=max_workers, quota_budget=quota_budget, requests_per_second=requests_per_second,
+                                state_store=state_store)
 
-    # iterate through list of video IDs
-    for video in videos:
-        
-        output = getCommentsPerVideo(video, output, comments_to_view=5000)
-
-    return output
+    try:
+        return engine.fetch(videos, comments_to_view=comments_to_view, refresh=refresh)
+    finally:
+        if state_store:
+            state_store.close()
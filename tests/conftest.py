@@ -0,0 +1,54 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# the modules are imported as top-level modules, like the benchmarks do
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import config
+
+
+# a stand-in registered with the component registry for one test
+@pytest.fixture
+def override():
+    names = []
+
+    def overrideComponent(name, instance):
+        names.append(name)
+        config.registry.override(name, instance)
+        return instance
+
+    yield overrideComponent
+    config.registry.teardown(*names)
+
+
+# bag of words hashed into 64 dimensions, enough to tell the test comments apart without the model
+def encodeWords(texts, **options):
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[i, zlib.crc32(word.encode("utf-8")) % 64] += 1
+    return vectors
+
+
+# empty memmap vector store, lexical index and caches in a temporary folder, with encodeWords as the embedding model
+@pytest.fixture
+def stores(override, monkeypatch, tmp_path):
+    from embedding_cache import EmbeddingCache
+    from lexical_index import LexicalIndex
+    from retrieval_cache import RetrievalCache
+    from vector_store import MemmapVectorStore
+
+    monkeypatch.setattr(config, "STORE_VERSION_PATH", str(tmp_path / "store_version"))
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", True)
+    override("embedding_cache", EmbeddingCache(encodeWords, "bag-of-words", path=str(tmp_path / "embedding_cache")))
+    override("retrieval_cache", RetrievalCache())
+    override("vector_store", MemmapVectorStore(path=str(tmp_path / "vector_store")))
+    override("lexical_index", LexicalIndex(path=str(tmp_path / "lexical_index")))
+    yield tmp_path
+    config.vector_store.close()
@@ -0,0 +1,58 @@
+import random
+import re
+
+import pytest
+
+from cleaning_benchmark import makeText
+from data_cleaning import normalizeText
+
+
+# the original cleaning: four regex passes, in this order
+def baselineNormalizeText(text):
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+    text = re.sub(r"<.*?>", "", text)
+    text = re.sub(r"[^\w\s]", "", text)
+    return re.sub(r"[\U00010000-\U0010ffff]", "", text)
+
+
+CASES = [
+    "",
+    "   ",
+    "plain ascii comment",
+    "https://youtu.be/abc123 check this",
+    "see www.honda.ca/civic, http://example.com/a?b=c and HTTPS://CAPS.example",
+    "http",
+    "www",
+    "thewww.example",
+    "<br>line<br/>break <a href=\"x\">link</a> <b>bold</b>",
+    "a < b and c > d",
+    "unclosed <tag",
+    "@dealer @Honda_Canada thanks!!",
+    "＠fullwidth mention",
+    "#1 #civic_si",
+    "😂😂 lol 🔥",
+    "👍🏻 skin tone",
+    "👨‍👩‍👧 family (zero width joiner)",
+    "🚗💨 https://t.co/😂",
+    "☺ ♥ ✓ in the BMP",
+    "café naïve über Ångström",
+    "é combining accent",
+    "車 ホンダ シビック",
+    "سيارة ٣٠٠",
+    "tabs\tand\nnewlines\r\n",
+    " non breaking spaces",
+    "&amp; &#39; entities",
+    "<b>café</b> 😂 www.x.com/ü 100%",
+    "mathematical 𝐛𝐨𝐥𝐝 letters",
+]
+
+
+@pytest.mark.parametrize("text", CASES)
+def test_normalize_text_matches_the_baseline(text):
+    assert normalizeText(text) == baselineNormalizeText(text)
+
+
+def test_normalize_text_matches_the_baseline_on_a_mixed_corpus():
+    rng = random.Random(0)
+    texts = [makeText(rng) for _ in range(5000)]
+    assert [normalizeText(text) for text in texts] == [baselineNormalizeText(text) for text in texts]
@@ -0,0 +1,30 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+# embeds a text as its length and number of words, and counts the texts it was asked for
+class CountingModel:
+
+    def __init__(self):
+        self.texts = 0
+
+    def encode(self, texts, **options):
+        self.texts += len(texts)
+        return np.array([[len(text), len(text.split())] for text in texts], dtype=np.float32)
+
+
+def test_uncached_encode_returns_vectors_without_storing_them(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(model.encode, "counting", path=str(tmp_path))
+    cache.encode(["stored comment"])
+
+    vectors = cache.encode(["one off prompt", "stored comment", "one off prompt"], cache=False)
+    np.testing.assert_array_equal(vectors, [[14, 3], [14, 2], [14, 3]])
+    assert cache.count() == 1
+    assert model.texts == 2
+
+    # the prompt is encoded again next time, and never reaches the files
+    np.testing.assert_array_equal(cache.encode("one off prompt", cache=False), [14, 3])
+    assert model.texts == 3
+    assert EmbeddingCache(model.encode, "counting", path=str(tmp_path)).count() == 1
@@ -0,0 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_builder import PromptBuilder
+
+
+def test_stats_add_up_when_building_from_several_threads():
+    builder = PromptBuilder(token_budget=None, max_text_tokens=None, max_comment_tokens=None)
+    comments, replies = ["comment"] * 3, [["reply"]] * 3
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: builder.build(comments, replies, f"prompt {i}"), range(2000)))
+
+    assert builder.stats["prompts"] == 2000
+    assert builder.stats["examples_used"] == 6000
+    assert builder.stats["examples_dropped"] == 0
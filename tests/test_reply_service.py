@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import config
+from reply_service import startReplyService
+
+
+@pytest.fixture
+def service():
+    server, url = startReplyService(port=0, warm=False)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+# status, json body and headers of a POST
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read()), error.headers
+
+
+# stand-in for the ollama client that answers every prompt with the same reply
+class FakeOllama:
+
+    def generate(self, **options):
+        yield {"response": "Thanks for watching!", "done": True, "done_reason": "stop", "eval_count": 4}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("timeout", "5"), ("timeout", 0), ("timeout", -1), ("timeout", True), ("timeout", float("nan")), ("timeout", float("inf")),
+    ("use_cache", "no"), ("use_cache", 0), ("use_cache", None),
+])
+def test_reply_rejects_bad_timeout_and_use_cache(service, field, value):
+    status, payload, _ = post(service + "/reply", {"prompt": "what's the 0-60?", field: value})
+    assert status == 400
+    assert field in payload["error"]
+
+
+def test_replies_beyond_the_queue_are_shed_with_503(stores, override):
+    override("llm_client", FakeOllama())
+    config.vector_store.add(ids=["a"], embeddings=np.ones((1, 64)), documents=["what's the 0-60?"], metadatas=[{"reply": "7 s"}])
+    server, url = startReplyService(port=0, warm=False, max_generations=1, max_queued_replies=1)
+    try:
+        # with the only generation slot taken, the first reply waits for it and fills the queue
+        server.generation_slots.acquire()
+        waiting = []
+        thread = threading.Thread(target=lambda: waiting.append(post(url + "/reply", {"prompt": "0-60?", "use_cache": False})))
+        thread.start()
+        while server.waiting_replies < 1:
+            time.sleep(0.01)
+
+        status, payload, headers = post(url + "/reply", {"prompt": "top speed?", "use_cache": False})
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        assert server.stats["shed_replies"] == 1
+
+        # the waiting reply is answered once the slot frees up
+        server.generation_slots.release()
+        thread.join()
+        status, payload, _ = waiting[0]
+        assert status == 200
+        assert payload["reply"] == "Thanks for watching!"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,38 @@
+import config
+from conftest import encodeWords
+from lexical_index import LexicalIndex
+from semantic_search import getLexicalSearchResults, getSemanticSearchResults
+from store_version import bumpStoreVersion
+from vector_store import MemmapVectorStore
+
+
+# write rows the way another process would: its own store instances, then a version bump
+def writeFromAnotherProcess(path, rows):
+    store = MemmapVectorStore(path=str(path / "vector_store"))
+    ids = [row_id for row_id, _ in rows]
+    comments = [comment for _, comment in rows]
+    store.upsert(ids=ids, embeddings=encodeWords(comments), documents=comments, metadatas=[{"reply": "reply"} for _ in rows])
+    store.close()
+    LexicalIndex(path=str(path / "lexical_index")).upsert(ids, comments)
+    bumpStoreVersion(config.STORE_VERSION_PATH)
+
+
+def test_searches_pick_up_rows_written_by_another_process(stores):
+    writeFromAnotherProcess(stores, [("a", "turbo lag early"), ("b", "nice paint colour")])
+    assert getSemanticSearchResults("turbo spools", comments_to_return=1)[0] == ["turbo lag early"]
+    assert getLexicalSearchResults("k20c1")[0] == []
+
+    # the first answer is cached, and the stores opened above only know two rows
+    writeFromAnotherProcess(stores, [("c", "turbo spools k20c1")])
+    assert getSemanticSearchResults("turbo spools", comments_to_return=1)[0] == ["turbo spools k20c1"]
+    assert getLexicalSearchResults("k20c1")[0] == ["turbo spools k20c1"]
+    assert config.vector_store.count() == 3
+
+
+def test_searches_without_new_writes_keep_the_cache(stores):
+    writeFromAnotherProcess(stores, [("a", "turbo lag early")])
+    getSemanticSearchResults("turbo spools")
+    getSemanticSearchResults("turbo spools")
+
+    assert config.retrieval_cache.stats["exact_hits"] == 1
+    assert config.retrieval_cache.stats["invalidations"] == 1
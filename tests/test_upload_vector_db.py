@@ -0,0 +1,37 @@
+import pandas as pd
+
+import config
+from conftest import encodeWords
+from upload_vector_db import makeRowId, migrateLegacyRows, uploadToVectorDB
+
+
+def test_row_ids_are_stable():
+    # ids already stored must never change, so the hash of a text id is pinned
+    assert makeRowId("What is the 0-60", "About 7 seconds") == "text:23cbc9c98f2ee11943a5d52f9a4c09a6f99e5974"
+    assert makeRowId("  what is the   0-60 ", "about 7 SECONDS") == makeRowId("What is the 0-60", "About 7 seconds")
+    assert makeRowId("What is the 0-60", "About 8 seconds") != makeRowId("What is the 0-60", "About 7 seconds")
+    assert makeRowId("What is the 0-60", "About 7 seconds", video_id="abc", comment_id="Ugx1") == "abc:Ugx1"
+
+
+def test_upload_skips_stored_rows_and_rewrites_changed_ones(stores):
+    df = pd.DataFrame({"comment": ["first comment", "second comment"], "reply": ["first reply", "second reply"],
+                       "video_id": ["abc", "abc"], "comment_id": ["c1", "c2"]})
+    assert uploadToVectorDB(df) == 2
+    assert uploadToVectorDB(df) == 0
+
+    # an edited comment keeps its id and replaces the stored row
+    df.loc[0, "comment"] = "first comment edited"
+    assert uploadToVectorDB(df) == 1
+    assert config.vector_store.count() == 2
+    assert config.vector_store.get(["abc:c1"])["documents"] == ["first comment edited"]
+
+
+def test_rows_under_legacy_numeric_ids_are_migrated(stores):
+    comments = ["legacy comment", "another legacy comment"]
+    config.vector_store.add(ids=["0", "1"], embeddings=encodeWords(comments), documents=comments,
+                            metadatas=[{"reply": "legacy reply"}, {"reply": "another reply"}])
+
+    assert migrateLegacyRows() == 2
+    assert migrateLegacyRows() == 0
+    assert sorted(config.vector_store.ids()) == sorted([makeRowId("legacy comment", "legacy reply"),
+                                                        makeRowId("another legacy comment", "another reply")])
@@ -0,0 +1,72 @@
+import warnings
+
+import chromadb
+import numpy as np
+import pytest
+
+from vector_store import MemmapVectorStore, _whereSql, getOrCreateChromaCollection, hnswSettings
+
+
+def test_opening_a_collection_with_another_space_warns(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    getOrCreateChromaCollection(client, "comments", space="l2")
+
+    with pytest.warns(UserWarning, match="space 'l2' \\(requested 'cosine'\\)"):
+        collection = getOrCreateChromaCollection(client, "comments", space="cosine")
+    assert hnswSettings(collection)["space"] == "l2"
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        getOrCreateChromaCollection(client, "comments", space="l2")
+        getOrCreateChromaCollection(client, "new", space="cosine")
+        getOrCreateChromaCollection(client, "new", space="cosine")
+
+
+def test_collection_without_a_space_counts_as_l2(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    client.create_collection("legacy")
+
+    with pytest.warns(UserWarning, match="Delete the collection"):
+        getOrCreateChromaCollection(client, "legacy", space="cosine")
+
+
+def test_where_values_are_bound_as_parameters():
+    clause, params = _whereSql({"$and": [{"channel_id": "x' OR 1=1 --"}, {"like_count": {"$in": [1, 2]}}]})
+    assert "OR 1=1" not in clause
+    assert clause.count("?") == len(params) == 5
+    assert params == ['$."channel_id"', "x' OR 1=1 --", '$."like_count"', 1, 2]
+
+
+@pytest.mark.parametrize("where", [
+    {"channel_id') OR 1=1 --": "x"}, {"like_count": {"$regex": ".*"}}, {"channel_id": {"$in": "abc"}},
+    {"channel_id": {"$eq": ["x"]}}, {"channel_id": None}, ["channel_id"],
+])
+def test_invalid_where_filters_raise_value_error(where):
+    with pytest.raises(ValueError):
+        _whereSql(where)
+
+
+def test_where_filters_match_only_the_given_values(tmp_path):
+    store = MemmapVectorStore(path=str(tmp_path))
+    store.add(ids=["a", "b"], embeddings=np.eye(2), documents=["a", "b"],
+              metadatas=[{"channel_id": "x' OR 1=1 --"}, {"channel_id": "other"}])
+
+    assert store.get(["a", "b"], where={"channel_id": "x' OR 1=1 --"})["ids"] == ["a"]
+    assert store.get(["a", "b"], where={"channel_id": "x' OR '1'='1"})["ids"] == []
+    assert store.query(np.eye(2)[1], n_results=2, where={"channel_id": {"$ne": "other"}})["ids"] == [["a"]]
+    store.close()
+
+
+def test_deleted_ids_can_be_added_again(tmp_path):
+    store = MemmapVectorStore(path=str(tmp_path))
+    store.add(ids=["a", "b"], embeddings=np.eye(2), documents=["a", "b"], metadatas=[{"reply": "a"}, {"reply": "b"}])
+    store.delete(["a"])
+
+    store.add(ids=["a"], embeddings=np.eye(2)[1:], documents=["a again"], metadatas=[{"reply": "a again"}])
+    assert store.count() == 2
+    assert store.get(["a"])["documents"] == ["a again"]
+    assert sorted(store.query(np.eye(2)[1], n_results=2)["ids"][0]) == ["a", "b"]
+    with pytest.raises(ValueError, match="Ids already stored"):
+        store.add(ids=["a"], embeddings=np.eye(2)[:1], documents=["a"], metadatas=[{"reply": "a"}])
+    store.close()
+    assert MemmapVectorStore(path=str(tmp_path)).ids() == ["a", "b"]
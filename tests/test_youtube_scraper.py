@@ -0,0 +1,68 @@
+import copy
+
+import pytest
+from googleapiclient.discovery import build
+
+from fake_youtube_api import startFakeYouTubeServer
+from response_cache import ResponseCache
+from scrape_state import ScrapeStateStore
+from youtube_scraper import CommentFetchEngine
+
+
+@pytest.fixture
+def fake_api(override):
+    server, url = startFakeYouTubeServer(threads_per_video=150)
+    override("youtube", build("youtube", "v3", developerKey="test", client_options={"api_endpoint": url}))
+    yield server
+    server.shutdown()
+
+
+# post a new comment thread (with one reply) on a video of the fake api, newer than every other thread
+def postThread(server, video, text):
+    threads = server.getThreads(video, "time")
+    thread = copy.deepcopy(next(thread for thread in threads if thread["replies"]))
+    thread["id"] = thread["snippet"]["topLevelComment"]["id"] = f"{video}.new"
+    thread["snippet"]["topLevelComment"]["snippet"]["textDisplay"] = text
+    thread["snippet"]["topLevelComment"]["snippet"]["publishedAt"] = "2030-01-01T00:00:00Z"
+    with server.lock:
+        server._video_threads[video].append(thread)
+
+
+def test_refresh_inside_cache_ttl_picks_up_new_threads(fake_api, override, tmp_path):
+    override("response_cache", ResponseCache(path=str(tmp_path / "api_cache"), mode="record", ttl_seconds=86400))
+    state = ScrapeStateStore(str(tmp_path / "state"))
+    try:
+        CommentFetchEngine(max_workers=1, state_store=state).fetch(["video000"], comments_to_view=200)
+        assert CommentFetchEngine(max_workers=1, state_store=state).fetch(["video000"], comments_to_view=200, refresh=True) == []
+
+        # the first time-ordered page was recorded by the refresh above, well inside the ttl
+        postThread(fake_api, "video000", "brand new comment")
+        pairs = CommentFetchEngine(max_workers=1, state_store=state).fetch(["video000"], comments_to_view=200, refresh=True)
+        assert [pair["comment"] for pair in pairs] == ["brand new comment"]
+    finally:
+        state.close()
+
+
+def test_relevance_pages_are_served_from_the_cache_inside_the_ttl(fake_api, override, tmp_path):
+    cache = override("response_cache", ResponseCache(path=str(tmp_path / "api_cache"), mode="record", ttl_seconds=86400))
+    first = CommentFetchEngine(max_workers=1)
+    first.fetch(["video000"], comments_to_view=200)
+    second = CommentFetchEngine(max_workers=1)
+    second.fetch(["video000"], comments_to_view=200)
+
+    assert first.stats["requests"] == 2
+    assert second.stats["requests"] == 0
+    assert cache.stats["hits"] == 2
+
+
+def test_replay_skips_videos_missing_from_the_recording(fake_api, override, tmp_path):
+    override("response_cache", ResponseCache(path=str(tmp_path / "api_cache"), mode="record"))
+    recorded = CommentFetchEngine(max_workers=1).fetch(["video000"], comments_to_view=100)
+
+    override("response_cache", ResponseCache(path=str(tmp_path / "api_cache"), mode="replay"))
+    engine = CommentFetchEngine(max_workers=2)
+    pairs = engine.fetch(["video000", "video001"], comments_to_view=200)
+
+    # the recorded first page of video000 is kept, its second page and video001 were never recorded
+    assert pairs == recorded
+    assert sorted(engine.stats["failed_videos"]) == ["video000", "video001"]